@@ -17,6 +17,18 @@ from routes.quejas import feedback_router
 from routes.opinion_cliente import opinion_cliente_router
 from fastapi.middleware.cors import CORSMiddleware
 from routes.reservaciones import reservacion_router
+from routes.busqueda import busqueda_router
+from routes.tareas import tareas_router
+from routes.calendario import calendario_router
+import crud.clases
+import crud.reservaciones
+import crud.membresias
+import crud.quejas
+import crud.evaluaciones_serv
+import crud.busqueda
+import config.db
+import report_cache
+import tareas
 
 
 app = FastAPI()
@@ -33,6 +45,26 @@ app.add_middleware(
     allow_headers=["*"],  # Permite todos los headers
 )
 
+# Tareas en segundo plano
+@app.on_event("startup")
+def iniciar_tareas_segundo_plano():
+    report_cache.cache.iniciar()
+    tareas.programar("sesiones", crud.clases.extender_sesiones, crud.clases.INTERVALO_SESIONES)
+    tareas.programar("inasistencias", crud.reservaciones.marcar_inasistencias_vencidas, crud.reservaciones.INTERVALO_INASISTENCIAS)
+    tareas.programar("membresias", crud.membresias.desactivar_membresias_vencidas, crud.membresias.INTERVALO_MEMBRESIAS)
+
+# Tablas derivadas (resúmenes de calificaciones y evaluaciones, índice de búsqueda) que se llenan la primera vez que arranca la app sobre una base
+# existente; si falla, la app no arranca en vez de servir estadísticas en cero o búsquedas vacías
+@app.on_event("startup")
+def inicializar_tablas_derivadas():
+    db = config.db.SessionLocal()
+    try:
+        crud.quejas.inicializar_resumen_entrenadores(db)
+        crud.evaluaciones_serv.inicializar_resumen_servicios(db)
+        crud.busqueda.inicializar_indice_busqueda(db)
+    finally:
+        db.close()
+
 # TABLAS CON RELACIÓN 
 app.include_router(user)
 app.include_router(person)
@@ -51,3 +83,6 @@ app.include_router(opinion_cliente_router)
 app.include_router(feedback_router)
 app.include_router(reservacion_router)
 app.include_router(google_auth_router)
+app.include_router(busqueda_router)
+app.include_router(tareas_router)
+app.include_router(calendario_router)
@@ -0,0 +1,260 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import or_, and_, case, distinct, func, literal, insert
+from collections import defaultdict
+import re
+import math
+import unicodedata
+import models.busqueda
+import models.servicios
+import models.clases
+import models.entrenamientos
+import crud.versiones
+
+TIPO_SERVICIO = "servicio"
+TIPO_CLASE = "clase"
+TIPO_EJERCICIO = "ejercicio"
+TIPOS = (TIPO_SERVICIO, TIPO_CLASE, TIPO_EJERCICIO)
+
+# Peso de cada aparición de un término según el campo, y peso máximo por documento
+PESO_NOMBRE = 3
+PESO_DESCRIPCION = 1
+PESO_MAXIMO = 10
+# Términos por consulta, longitud mínima para buscar por prefijo y términos en que se expande un prefijo
+TERMINOS_MAXIMOS = 8
+LONGITUD_MINIMA_PREFIJO = 3
+EXPANSIONES_MAXIMAS = 20
+
+STOPWORDS = {
+    "de", "la", "el", "en", "los", "las", "del", "al", "un", "una", "unos", "unas",
+    "por", "con", "para", "sin", "sobre", "que", "se", "su", "sus", "lo", "le", "les",
+    "es", "son", "como", "mas", "muy", "ya", "o", "u", "y", "e", "a"
+}
+
+_PATRON_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+# Pasar a minúsculas y quitar acentos ("Nutrición" -> "nutricion")
+def normalizar_texto(texto: str):
+    texto = unicodedata.normalize("NFKD", (texto or "").lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+# Raíz mínima para español: quitar la "s" final de los plurales ("clases" -> "clase")
+def raiz(token: str):
+    if len(token) > 4 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+# Términos indexables de un texto (normalizados, sin stopwords)
+def tokenizar(texto: str):
+    terminos = []
+    for token in _PATRON_TOKEN.findall(normalizar_texto(texto)):
+        if len(token) < 2 or token in STOPWORDS:
+            continue
+        terminos.append(raiz(token)[:60])
+    return terminos
+
+# Pesos por término de un documento a partir de su nombre y sus textos secundarios
+def pesos_documento(nombre: str, *textos: str):
+    pesos = defaultdict(int)
+    for termino in tokenizar(nombre):
+        pesos[termino] += PESO_NOMBRE
+    for texto in textos:
+        for termino in tokenizar(texto):
+            pesos[termino] += PESO_DESCRIPCION
+    return {termino: min(peso, PESO_MAXIMO) for termino, peso in pesos.items()}
+
+# Quitar un documento del índice (sin commit)
+def eliminar_documento(db: Session, tipo: str, entidad_id: int):
+    db.query(models.busqueda.TerminoBusqueda).filter(
+        models.busqueda.TerminoBusqueda.Tipo == tipo,
+        models.busqueda.TerminoBusqueda.Entidad_ID == entidad_id
+    ).delete(synchronize_session=False)
+
+# Reemplazar los términos de un documento en el índice (sin commit)
+def indexar_documento(db: Session, tipo: str, entidad_id: int, nombre: str, *textos: str):
+    eliminar_documento(db, tipo, entidad_id)
+    
+    pesos = pesos_documento(nombre, *textos)
+    if pesos:
+        db.execute(insert(models.busqueda.TerminoBusqueda), [
+            {"Termino": termino, "Tipo": tipo, "Entidad_ID": entidad_id, "Peso": peso}
+            for termino, peso in pesos.items()
+        ])
+
+# Indexar un servicio (solo los activos aparecen en la búsqueda)
+def indexar_servicio(db: Session, servicio: models.servicios.Servicios):
+    if not servicio.Estatus:
+        eliminar_documento(db, TIPO_SERVICIO, servicio.ID)
+        return
+    indexar_documento(db, TIPO_SERVICIO, servicio.ID, servicio.Nombre, servicio.Descripcion)
+
+# Indexar una clase (solo las activas aparecen en la búsqueda)
+def indexar_clase(db: Session, clase: models.clases.Clase):
+    if not clase.Estatus:
+        eliminar_documento(db, TIPO_CLASE, clase.ID)
+        return
+    indexar_documento(db, TIPO_CLASE, clase.ID, clase.Nombre, clase.Descripcion)
+
+# Indexar un ejercicio
+def indexar_ejercicio(db: Session, ejercicio: models.entrenamientos.Ejercicio):
+    indexar_documento(db, TIPO_EJERCICIO, ejercicio.ID, ejercicio.Nombre, ejercicio.Categoria)
+
+# Reconstruir el índice completo a partir de servicios, clases y ejercicios
+def rebuild_indice_busqueda(db: Session, tamano_lote: int = 1000):
+    db.query(models.busqueda.TerminoBusqueda).delete(synchronize_session=False)
+    
+    fuentes = [
+        (TIPO_SERVICIO, db.query(
+            models.servicios.Servicios.ID, models.servicios.Servicios.Nombre, models.servicios.Servicios.Descripcion
+        ).filter(models.servicios.Servicios.Estatus == True)),
+        (TIPO_CLASE, db.query(
+            models.clases.Clase.ID, models.clases.Clase.Nombre, models.clases.Clase.Descripcion
+        ).filter(models.clases.Clase.Estatus == True)),
+        (TIPO_EJERCICIO, db.query(
+            models.entrenamientos.Ejercicio.ID, models.entrenamientos.Ejercicio.Nombre, models.entrenamientos.Ejercicio.Categoria
+        ))
+    ]
+    
+    documentos = 0
+    for tipo, query in fuentes:
+        lote = []
+        for entidad_id, nombre, texto in query.yield_per(tamano_lote):
+            documentos += 1
+            lote.extend(
+                {"Termino": termino, "Tipo": tipo, "Entidad_ID": entidad_id, "Peso": peso}
+                for termino, peso in pesos_documento(nombre, texto).items()
+            )
+            if len(lote) >= tamano_lote:
+                db.execute(insert(models.busqueda.TerminoBusqueda), lote)
+                lote = []
+        if lote:
+            db.execute(insert(models.busqueda.TerminoBusqueda), lote)
+    
+    db.commit()
+    return documentos
+
+# Llenar el índice al arrancar si está vacío y ya hay servicios, clases o ejercicios (por ejemplo, la primera vez que
+# corre esta versión sobre una base existente); devuelve cuántos documentos indexó. Un solo worker lo reconstruye
+def inicializar_indice_busqueda(db: Session):
+    if db.query(models.busqueda.TerminoBusqueda.Termino).first() is not None:
+        return 0
+    hay_documentos = any(
+        db.query(columna).first() is not None
+        for columna in (models.servicios.Servicios.ID, models.clases.Clase.ID, models.entrenamientos.Ejercicio.ID)
+    )
+    if not hay_documentos:
+        return 0
+    if not crud.versiones.reclamar(db, "inicializacion:indice_busqueda"):
+        db.rollback()
+        return 0
+    return rebuild_indice_busqueda(db)
+
+# Condición de rango sobre el índice para los términos que empiezan con un prefijo
+def _rango_prefijo(columna, prefijo: str):
+    # Los términos solo tienen [a-z0-9]: el límite superior es el prefijo con su último carácter incrementado
+    for i in range(len(prefijo) - 1, -1, -1):
+        if prefijo[i] != "z":
+            siguiente = "a" if prefijo[i] == "9" else chr(ord(prefijo[i]) + 1)
+            return and_(columna >= prefijo, columna < prefijo[:i] + siguiente)
+    return columna >= prefijo
+
+# Cargar en una consulta por tipo los datos a mostrar de los documentos encontrados
+def _cargar_documentos(db: Session, ids_por_tipo: dict):
+    documentos = {}
+    
+    if ids_por_tipo.get(TIPO_SERVICIO):
+        for servicio in db.query(models.servicios.Servicios).filter(
+            models.servicios.Servicios.ID.in_(ids_por_tipo[TIPO_SERVICIO])
+        ).all():
+            documentos[(TIPO_SERVICIO, servicio.ID)] = {
+                "Nombre": servicio.Nombre,
+                "Descripcion": servicio.Descripcion,
+                "Costo": servicio.Costo
+            }
+    
+    if ids_por_tipo.get(TIPO_CLASE):
+        for clase in db.query(models.clases.Clase).filter(
+            models.clases.Clase.ID.in_(ids_por_tipo[TIPO_CLASE])
+        ).all():
+            documentos[(TIPO_CLASE, clase.ID)] = {
+                "Nombre": clase.Nombre,
+                "Descripcion": clase.Descripcion,
+                "Entrenador_ID": clase.Entrenador_ID
+            }
+    
+    if ids_por_tipo.get(TIPO_EJERCICIO):
+        for ejercicio in db.query(models.entrenamientos.Ejercicio).filter(
+            models.entrenamientos.Ejercicio.ID.in_(ids_por_tipo[TIPO_EJERCICIO])
+        ).all():
+            documentos[(TIPO_EJERCICIO, ejercicio.ID)] = {
+                "Nombre": ejercicio.Nombre,
+                "Categoria": ejercicio.Categoria
+            }
+    
+    return documentos
+
+# Búsqueda por relevancia: primero los documentos que contienen más términos, luego por peso y rareza del término
+def buscar(db: Session, texto: str, tipos=TIPOS, skip: int = 0, limit: int = 20):
+    Termino = models.busqueda.TerminoBusqueda
+    
+    terminos = list(dict.fromkeys(tokenizar(texto)))[:TERMINOS_MAXIMOS]
+    if not terminos:
+        return {"total": 0, "resultados": []}
+    
+    # El último término también se busca por prefijo (búsqueda mientras se escribe), con un número acotado de expansiones
+    ultimo = terminos[-1]
+    expansiones = []
+    if len(ultimo) >= LONGITUD_MINIMA_PREFIJO:
+        expansiones = [termino for (termino,) in db.query(Termino.Termino).filter(
+            _rango_prefijo(Termino.Termino, ultimo)
+        ).distinct().order_by(Termino.Termino).limit(EXPANSIONES_MAXIMAS).all()]
+    
+    coincide = and_(Termino.Termino.in_(set(terminos) | set(expansiones)), Termino.Tipo.in_(tipos))
+    
+    # Término de la consulta al que corresponde cada término del índice
+    termino_consulta = case(
+        *[(Termino.Termino == termino, termino) for termino in terminos[:-1]],
+        else_=ultimo
+    ) if len(terminos) > 1 else literal(ultimo)
+    
+    # Documentos por término de la consulta (solo se lee el índice)
+    frecuencias = defaultdict(int)
+    for termino, documentos in db.query(termino_consulta, func.count()).filter(coincide).group_by(termino_consulta).all():
+        frecuencias[termino] += documentos
+    if not frecuencias:
+        return {"total": 0, "resultados": []}
+    
+    # Los términos que aparecen en menos documentos pesan más
+    rareza = case(
+        *[(termino_consulta == termino, 1 / math.log(2 + documentos)) for termino, documentos in frecuencias.items()],
+        else_=0
+    )
+    cobertura = func.count(distinct(termino_consulta))
+    puntaje = func.sum(Termino.Peso * rareza)
+    
+    agrupados = db.query(Termino.Tipo, Termino.Entidad_ID, cobertura, puntaje).filter(coincide).group_by(
+        Termino.Tipo, Termino.Entidad_ID
+    )
+    total = db.query(func.count()).select_from(agrupados.subquery()).scalar()
+    pagina = agrupados.order_by(
+        cobertura.desc(), puntaje.desc(), Termino.Tipo, Termino.Entidad_ID
+    ).offset(skip).limit(limit).all()
+    
+    ids_por_tipo = defaultdict(list)
+    for tipo, entidad_id, _, _ in pagina:
+        ids_por_tipo[tipo].append(entidad_id)
+    documentos = _cargar_documentos(db, ids_por_tipo)
+    
+    resultados = []
+    for tipo, entidad_id, terminos_encontrados, puntaje_documento in pagina:
+        if (tipo, entidad_id) not in documentos:
+            continue
+        resultados.append({
+            "tipo": tipo,
+            "ID": entidad_id,
+            **documentos[(tipo, entidad_id)],
+            "puntaje": round(float(puntaje_documento), 4),
+            "terminos_encontrados": terminos_encontrados
+        })
+    
+    return {"total": total, "resultados": resultados}
@@ -0,0 +1,209 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from collections import OrderedDict
+from datetime import datetime, date, timedelta
+import os
+import secrets
+import threading
+import models.calendario
+import models.reservaciones
+import models.clases
+import crud.clases
+
+# Días hacia atrás que incluye un feed (hacia adelante llega hasta el horizonte de sesiones)
+DIAS_HISTORIAL_CALENDARIO = int(os.getenv("CALENDARIO_DIAS_HISTORIAL", "30"))
+# Feeds generados que se guardan en memoria en este worker
+LIMITE_CACHE_CALENDARIO = int(os.getenv("CALENDARIO_CACHE_MAXIMO", "1000"))
+DOMINIO_UID = os.getenv("CALENDARIO_DOMINIO", "gym-customer.onrender.com")
+
+TIPO_RESERVACIONES = "reservaciones"
+TIPO_CLASES = "clases"
+
+# Feeds por (usuario, tipo): (etag, cuerpo); el etag incluye la versión del usuario y el día
+_cache_feeds = OrderedDict()
+_lock_feeds = threading.Lock()
+
+# Buscar el registro del calendario por token (lectura por índice único)
+def get_calendario_by_token(db: Session, token: str):
+    return db.query(models.calendario.CalendarioUsuario).filter(
+        models.calendario.CalendarioUsuario.Token == token
+    ).first()
+
+# Crear o cambiar el token del feed de un usuario; el token anterior deja de funcionar
+def rotar_token(db: Session, usuario_id: int):
+    token = secrets.token_urlsafe(32)
+    actualizadas = db.query(models.calendario.CalendarioUsuario).filter(
+        models.calendario.CalendarioUsuario.Usuario_ID == usuario_id
+    ).update({
+        models.calendario.CalendarioUsuario.Token: token,
+        models.calendario.CalendarioUsuario.Fecha_Actualizacion: datetime.now()
+    }, synchronize_session=False)
+    
+    if not actualizadas:
+        try:
+            with db.begin_nested():
+                db.add(models.calendario.CalendarioUsuario(
+                    Usuario_ID=usuario_id,
+                    Token=token,
+                    Version=0,
+                    Fecha_Registro=datetime.now()
+                ))
+        except IntegrityError:
+            # Otra solicitud creó el registro al mismo tiempo
+            db.query(models.calendario.CalendarioUsuario).filter(
+                models.calendario.CalendarioUsuario.Usuario_ID == usuario_id
+            ).update({models.calendario.CalendarioUsuario.Token: token}, synchronize_session=False)
+    
+    db.commit()
+    return token
+
+# Revocar el token del feed de un usuario
+def revocar_token(db: Session, usuario_id: int):
+    revocadas = db.query(models.calendario.CalendarioUsuario).filter(
+        models.calendario.CalendarioUsuario.Usuario_ID == usuario_id,
+        models.calendario.CalendarioUsuario.Token.isnot(None)
+    ).update({
+        models.calendario.CalendarioUsuario.Token: None,
+        models.calendario.CalendarioUsuario.Fecha_Actualizacion: datetime.now()
+    }, synchronize_session=False)
+    db.commit()
+    return revocadas > 0
+
+# Invalidar los feeds de varios usuarios con un solo UPDATE (sin commit); los usuarios sin feed no cuestan nada
+def bump_calendarios(db: Session, usuario_ids):
+    ids = {usuario_id for usuario_id in usuario_ids if usuario_id is not None}
+    if not ids:
+        return
+    db.query(models.calendario.CalendarioUsuario).filter(
+        models.calendario.CalendarioUsuario.Usuario_ID.in_(ids)
+    ).update({
+        models.calendario.CalendarioUsuario.Version: models.calendario.CalendarioUsuario.Version + 1
+    }, synchronize_session=False)
+
+# Invalidar los feeds del entrenador de una clase y de quienes tienen reservaciones vigentes en ella (sin commit)
+def bump_calendarios_clase(db: Session, clase_id: int):
+    Reservacion = models.reservaciones.Reservacion
+    usuarios = db.query(Reservacion.Usuario_ID).filter(
+        Reservacion.Clase_ID == clase_id,
+        Reservacion.Fecha >= date.today() - timedelta(days=DIAS_HISTORIAL_CALENDARIO),
+        Reservacion.Activa == True
+    ).union(
+        db.query(models.clases.Clase.Entrenador_ID).filter(models.clases.Clase.ID == clase_id)
+    ).all()
+    bump_calendarios(db, [usuario_id for (usuario_id,) in usuarios])
+
+# ETag del feed: cambia con la versión del usuario y con el día (el rango de fechas se mueve)
+def etag_feed(calendario: models.calendario.CalendarioUsuario, tipo: str):
+    return f'"{calendario.Usuario_ID}-{tipo}-{calendario.Version}-{date.today().isoformat()}"'
+
+# Escapar texto según RFC 5545
+def _texto_ics(texto: str):
+    return (texto or "").replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+# Partir las líneas de más de 75 octetos según RFC 5545
+def _doblar_linea(linea: str):
+    partes = []
+    actual = ""
+    for caracter in linea:
+        if len((actual + caracter).encode("utf-8")) > (75 if not partes else 74):
+            partes.append(actual)
+            actual = ""
+        actual += caracter
+    partes.append(actual)
+    return "\r\n ".join(partes)
+
+def _fecha_ics(valor: datetime):
+    return valor.strftime("%Y%m%dT%H%M%S")
+
+# Documento iCalendar a partir de eventos (uid, inicio, fin, titulo, descripcion)
+def render_ics(nombre: str, eventos):
+    ahora = _fecha_ics(datetime.now())
+    lineas = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//Gym//Calendario//ES",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_texto_ics(nombre)}"
+    ]
+    for uid, inicio, fin, titulo, descripcion in eventos:
+        lineas.extend([
+            "BEGIN:VEVENT",
+            f"UID:{uid}@{DOMINIO_UID}",
+            f"DTSTAMP:{ahora}",
+            f"DTSTART:{_fecha_ics(inicio)}",
+            f"DTEND:{_fecha_ics(fin)}",
+            f"SUMMARY:{_texto_ics(titulo)}",
+            f"DESCRIPTION:{_texto_ics(descripcion)}",
+            "END:VEVENT"
+        ])
+    lineas.append("END:VCALENDAR")
+    return "\r\n".join(_doblar_linea(linea) for linea in lineas) + "\r\n"
+
+# Eventos del feed de un miembro: sus reservaciones vigentes
+def _eventos_reservaciones(db: Session, usuario_id: int):
+    Reservacion = models.reservaciones.Reservacion
+    filas = db.query(
+        Reservacion.ID,
+        Reservacion.Fecha,
+        models.clases.Clase.Nombre,
+        models.clases.Clase.Hora_Inicio,
+        models.clases.Clase.Hora_Fin
+    ).join(
+        models.clases.Clase, Reservacion.Clase_ID == models.clases.Clase.ID
+    ).filter(
+        Reservacion.Usuario_ID == usuario_id,
+        Reservacion.Fecha >= date.today() - timedelta(days=DIAS_HISTORIAL_CALENDARIO),
+        Reservacion.Activa == True
+    ).order_by(Reservacion.Fecha).all()
+    
+    eventos = []
+    for fila in filas:
+        inicio, fin = crud.clases.horario_sesion(fila, fila.Fecha)
+        eventos.append((f"reservacion-{fila.ID}", inicio, fin, fila.Nombre, "Reservación de clase"))
+    return eventos
+
+# Eventos del feed de un entrenador: las sesiones de sus clases
+def _eventos_clases(db: Session, usuario_id: int):
+    desde = date.today() - timedelta(days=DIAS_HISTORIAL_CALENDARIO)
+    hasta = date.today() + timedelta(days=crud.clases.HORIZONTE_SESIONES_DIAS + 1)
+    sesiones = crud.clases.get_sesiones(
+        db,
+        desde=datetime.combine(desde, datetime.min.time()),
+        hasta=datetime.combine(hasta, datetime.min.time()),
+        entrenador_id=usuario_id,
+        limit=None
+    )
+    return [
+        (
+            f"sesion-{sesion['Clase_ID']}-{sesion['Fecha'].isoformat()}",
+            sesion["Inicio"],
+            sesion["Fin"],
+            sesion["Nombre_Clase"],
+            "Sesión de clase"
+        )
+        for sesion in sesiones
+    ]
+
+# Feed de un usuario desde la caché del worker o generado de nuevo si cambió su versión o el día
+def get_feed(db: Session, calendario: models.calendario.CalendarioUsuario, tipo: str):
+    etag = etag_feed(calendario, tipo)
+    clave = (calendario.Usuario_ID, tipo)
+    with _lock_feeds:
+        cacheado = _cache_feeds.get(clave)
+        if cacheado is not None and cacheado[0] == etag:
+            _cache_feeds.move_to_end(clave)
+            return cacheado
+    
+    if tipo == TIPO_CLASES:
+        cuerpo = render_ics("Mis clases", _eventos_clases(db, calendario.Usuario_ID))
+    else:
+        cuerpo = render_ics("Mis reservaciones", _eventos_reservaciones(db, calendario.Usuario_ID))
+    
+    cacheado = (etag, cuerpo)
+    with _lock_feeds:
+        _cache_feeds[clave] = cacheado
+        _cache_feeds.move_to_end(clave)
+        while len(_cache_feeds) > LIMITE_CACHE_CALENDARIO:
+            _cache_feeds.popitem(last=False)
+    return cacheado
@@ -1,10 +1,248 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import insert, update, func
+from sqlalchemy.exc import IntegrityError
+from pydantic import TypeAdapter
+from typing import List
+import os
+import logging
+import threading
+import config.db
 import models.clases
 import models.users
 import models.persons
 import models.quejas
+import models.reservaciones
+import crud.quejas
+import crud.busqueda
+import crud.reservaciones
+import crud.calendario
+import crud.versiones
+import report_cache
+import intervalos
+import eventos_disponibilidad
 import schemas.clases
-from datetime import datetime
+from datetime import datetime, date, time, timedelta
+
+# Días hacia adelante para los que se generan las sesiones de cada clase, y cada cuántos segundos se extiende el horizonte
+HORIZONTE_SESIONES_DIAS = int(os.getenv("SESIONES_HORIZONTE_DIAS", "28"))
+INTERVALO_SESIONES = int(os.getenv("SESIONES_INTERVALO", "3600"))
+# Las clases con más reservaciones que este umbral se eliminan en segundo plano, por lotes
+UMBRAL_BORRADO_CLASES = int(os.getenv("CLASES_BORRADO_UMBRAL", "5000"))
+LOTE_BORRADO_CLASES = int(os.getenv("CLASES_BORRADO_LOTE", "1000"))
+# Una eliminación "En proceso" sin avance en este tiempo se considera abandonada (el worker se reinició) y se puede retomar
+ABANDONO_BORRADO_SEGUNDOS = int(os.getenv("CLASES_BORRADO_ABANDONO", "600"))
+
+# Versión del listado de clases; sube con cada alta, cambio o baja de una clase y cuando cambian los datos de su entrenador
+VERSION_CLASES = "clases"
+# Listados de clases ya serializados a JSON por (vista, skip, limit): (versión, cuerpo)
+LIMITE_CACHE_CLASES = int(os.getenv("CLASES_CACHE_MAXIMO", "256"))
+_cache_clases = {}
+_lock_clases = threading.Lock()
+_json_clases = TypeAdapter(List[schemas.clases.Clase])
+_json_clases_detalles = TypeAdapter(List[dict])
+
+logger = logging.getLogger(__name__)
+
+# Horario del gimnasio en el que se buscan huecos libres de los entrenadores
+HORA_APERTURA = time.fromisoformat(os.getenv("GIMNASIO_HORA_APERTURA", "06:00"))
+HORA_CIERRE = time.fromisoformat(os.getenv("GIMNASIO_HORA_CIERRE", "22:00"))
+
+# Días de la semana en el orden de date.weekday() (0 = lunes)
+DIAS_SEMANA = ("lunes", "martes", "miercoles", "jueves", "viernes", "sabado", "domingo")
+
+# Días de la semana (date.weekday()) de Dia_Inicio a Dia_Fin (el rango puede cruzar el domingo)
+def dias_de_semana(dia_inicio: str, dia_fin: str):
+    try:
+        inicio = DIAS_SEMANA.index(crud.busqueda.normalizar_texto(dia_inicio).strip())
+        fin = DIAS_SEMANA.index(crud.busqueda.normalizar_texto(dia_fin).strip())
+    except ValueError:
+        return set()
+    return {(inicio + i) % 7 for i in range((fin - inicio) % 7 + 1)}
+
+# Días de la semana en que se imparte una clase
+def dias_de_clase(clase: models.clases.Clase):
+    return dias_de_semana(clase.Dia_Inicio, clase.Dia_Fin)
+
+# Verificar que una fecha caiga en uno de los días de la clase
+def fecha_en_horario(clase: models.clases.Clase, fecha: date):
+    return fecha.weekday() in dias_de_clase(clase)
+
+# Clases activas de un entrenador cuyo horario semanal se traslapa con el indicado. Cada llamada lee las clases del
+# entrenador y arma el índice de intervalos ordenado: O(n log n) con n intervalos semanales del entrenador (a lo más
+# 7 por clase, o 8 si una cruza del domingo al lunes)
+def get_conflictos_horario(db: Session, entrenador_id: int, dia_inicio: str, dia_fin: str, hora_inicio: time, hora_fin: time, excluir_id: int = None):
+    query = db.query(models.clases.Clase).filter(
+        models.clases.Clase.Entrenador_ID == entrenador_id,
+        models.clases.Clase.Estatus == True
+    )
+    if excluir_id is not None:
+        query = query.filter(models.clases.Clase.ID != excluir_id)
+    clases = query.all()
+    
+    indice = intervalos.IndiceIntervalos(
+        intervalo
+        for clase in clases
+        for intervalo in intervalos.intervalos_semanales(dias_de_clase(clase), clase.Hora_Inicio, clase.Hora_Fin, clase.ID)
+    )
+    conflictos = set()
+    for inicio, fin, _ in intervalos.intervalos_semanales(dias_de_semana(dia_inicio, dia_fin), hora_inicio, hora_fin):
+        conflictos.update(clave for _, _, clave in indice.traslapes(inicio, fin))
+    return [clase for clase in clases if clase.ID in conflictos]
+
+# Huecos libres de un entrenador entre dos fechas, dentro del horario del gimnasio, a partir de sus sesiones
+def get_horarios_libres(db: Session, entrenador_id: int, desde: date, hasta: date, duracion_minima: int = 60):
+    CupoSesion = models.reservaciones.CupoSesion
+    inicio_rango = datetime.combine(desde, time.min)
+    fin_rango = datetime.combine(hasta + timedelta(days=1), time.min)
+    
+    # Búsqueda por rango en el índice de Inicio (un día antes por las sesiones que cruzan la medianoche)
+    sesiones = db.query(CupoSesion.Inicio, CupoSesion.Fin, CupoSesion.Clase_ID).join(
+        models.clases.Clase, CupoSesion.Clase_ID == models.clases.Clase.ID
+    ).filter(
+        models.clases.Clase.Entrenador_ID == entrenador_id,
+        models.clases.Clase.Estatus == True,
+        CupoSesion.Inicio >= inicio_rango - timedelta(days=1),
+        CupoSesion.Inicio < fin_rango
+    ).all()
+    indice = intervalos.IndiceIntervalos(sesiones)
+    
+    libres = []
+    fecha = desde
+    while fecha <= hasta:
+        for inicio, fin in indice.huecos(
+            datetime.combine(fecha, HORA_APERTURA),
+            datetime.combine(fecha, HORA_CIERRE),
+            timedelta(minutes=duracion_minima)
+        ):
+            libres.append({
+                "Fecha": fecha,
+                "Inicio": inicio,
+                "Fin": fin,
+                "Minutos": int((fin - inicio).total_seconds() // 60)
+            })
+        fecha += timedelta(days=1)
+    return libres
+
+# Hora de inicio y de fin de la sesión de una clase en una fecha (una clase que termina después de medianoche acaba al día siguiente)
+def horario_sesion(clase: models.clases.Clase, fecha: date):
+    inicio = datetime.combine(fecha, clase.Hora_Inicio)
+    fin = datetime.combine(fecha, clase.Hora_Fin)
+    if fin <= inicio:
+        fin += timedelta(days=1)
+    return inicio, fin
+
+# Valores de una fila nueva de sesión
+def fila_sesion(clase: models.clases.Clase, fecha: date):
+    inicio, fin = horario_sesion(clase, fecha)
+    return {
+        "Clase_ID": clase.ID,
+        "Fecha": fecha,
+        "Inicio": inicio,
+        "Fin": fin,
+        "Cupo": clase.Cupo,
+        "Reservados": 0,
+        "Asistencias": 0,
+        "Fecha_Actualizacion": datetime.now()
+    }
+
+# Sincronizar las sesiones de varias clases con su horario entre dos fechas (sin commit).
+# Crea las que faltan, corrige la hora de las existentes y borra las que ya no están en el horario si nadie las reservó.
+# Devuelve cuántas sesiones faltaban al leer (alguna pudo crearla otro worker al mismo tiempo)
+def generar_sesiones(db: Session, clases, desde: date = None, hasta: date = None):
+    CupoSesion = models.reservaciones.CupoSesion
+    clases = list(clases)
+    if not clases:
+        return 0
+    desde = desde or date.today()
+    hasta = hasta or desde + timedelta(days=HORIZONTE_SESIONES_DIAS)
+    
+    existentes = {}
+    for clase_id, fecha, inicio, fin, reservados in db.query(
+        CupoSesion.Clase_ID, CupoSesion.Fecha, CupoSesion.Inicio, CupoSesion.Fin, CupoSesion.Reservados
+    ).filter(
+        CupoSesion.Clase_ID.in_([clase.ID for clase in clases]),
+        CupoSesion.Fecha >= desde,
+        CupoSesion.Fecha < hasta
+    ).all():
+        existentes[(clase_id, fecha)] = (inicio, fin, reservados)
+    
+    nuevas, cambios, sobrantes = [], [], {}
+    for clase in clases:
+        dias = dias_de_clase(clase) if clase.Estatus else set()
+        fecha = desde
+        while fecha < hasta:
+            actual = existentes.get((clase.ID, fecha))
+            if fecha.weekday() in dias:
+                if actual is None:
+                    nuevas.append(fila_sesion(clase, fecha))
+                elif actual[:2] != horario_sesion(clase, fecha):
+                    inicio, fin = horario_sesion(clase, fecha)
+                    cambios.append({"Clase_ID": clase.ID, "Fecha": fecha, "Inicio": inicio, "Fin": fin})
+            elif actual is not None and not actual[2]:
+                sobrantes.setdefault(clase.ID, []).append(fecha)
+            fecha += timedelta(days=1)
+    
+    # Un INSERT de varias filas y un UPDATE por llave primaria en lote. Otro worker (la tarea periódica, una
+    # reservación o un cambio de la clase) puede crear la misma sesión entre la lectura y el INSERT: la fila
+    # repetida se ignora en vez de abortar el lote completo
+    if nuevas:
+        db.execute(
+            insert(CupoSesion).prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite"),
+            nuevas
+        )
+    if cambios:
+        db.execute(update(CupoSesion), cambios)
+    for clase_id, fechas in sobrantes.items():
+        db.query(CupoSesion).filter(
+            CupoSesion.Clase_ID == clase_id,
+            CupoSesion.Fecha.in_(fechas),
+            CupoSesion.Reservados == 0
+        ).delete(synchronize_session=False)
+    return len(nuevas)
+
+# Tarea periódica: extender el horizonte de sesiones de todas las clases; devuelve cuántas sesiones creó
+def extender_sesiones(db: Session):
+    creadas = generar_sesiones(db, db.query(models.clases.Clase).all())
+    db.commit()
+    return creadas
+
+# Horario de sesiones entre dos momentos (búsqueda por rango en el índice de Inicio), con sus lugares
+def get_sesiones(db: Session, desde: datetime, hasta: datetime, clase_id: int = None, entrenador_id: int = None, skip: int = 0, limit: int = 100):
+    CupoSesion = models.reservaciones.CupoSesion
+    query = db.query(
+        CupoSesion,
+        models.clases.Clase.Nombre,
+        models.clases.Clase.Entrenador_ID,
+        models.users.User.Nombre_Usuario
+    ).join(
+        models.clases.Clase, CupoSesion.Clase_ID == models.clases.Clase.ID
+    ).outerjoin(
+        models.users.User, models.clases.Clase.Entrenador_ID == models.users.User.ID
+    ).filter(
+        CupoSesion.Inicio >= desde,
+        CupoSesion.Inicio < hasta,
+        models.clases.Clase.Estatus == True
+    )
+    if clase_id is not None:
+        query = query.filter(CupoSesion.Clase_ID == clase_id)
+    if entrenador_id is not None:
+        query = query.filter(models.clases.Clase.Entrenador_ID == entrenador_id)
+    
+    return [
+        {
+            "Clase_ID": sesion.Clase_ID,
+            "Fecha": sesion.Fecha,
+            "Inicio": sesion.Inicio,
+            "Fin": sesion.Fin,
+            "Nombre_Clase": nombre,
+            "Entrenador_ID": entrenador,
+            "Entrenador_Nombre": entrenador_nombre,
+            "Cupo": sesion.Cupo,
+            "Reservados": sesion.Reservados,
+            "Lugares_Disponibles": max(sesion.Cupo - sesion.Reservados, 0)
+        }
+        for sesion, nombre, entrenador, entrenador_nombre in query.order_by(CupoSesion.Inicio, CupoSesion.Clase_ID).offset(skip).limit(limit).all()
+    ]
 
 # Buscar por ID
 def get_clase(db: Session, id: int):
@@ -24,6 +262,17 @@ def get_clases_by_entrenador(db: Session, entrenador_id: int, skip: int = 0, lim
         models.clases.Clase.Entrenador_ID == entrenador_id
     ).offset(skip).limit(limit).all()
 
+# Obtener en una sola consulta los nombres de varias clases
+def get_nombres_clases(db: Session, clase_ids):
+    ids = set(clase_ids)
+    if not ids:
+        return {}
+    
+    return dict(db.query(
+        models.clases.Clase.ID,
+        models.clases.Clase.Nombre
+    ).filter(models.clases.Clase.ID.in_(ids)).all())
+
 # Crear nueva clase
 def create_clase(db: Session, clase: schemas.clases.ClaseCreate, entrenador_id: int):
     db_clase = models.clases.Clase(
@@ -35,12 +284,18 @@ def create_clase(db: Session, clase: schemas.clases.ClaseCreate, entrenador_id:
         Hora_Inicio=clase.Hora_Inicio,
         Hora_Fin=clase.Hora_Fin,
         Duracion_Minutos=clase.Duracion_Minutos,
+        Cupo=clase.Cupo,
         Estatus=clase.Estatus,
         Fecha_Registro=datetime.now(),
         Fecha_Actualizacion=datetime.now()
     )
     
     db.add(db_clase)
+    db.flush()
+    crud.busqueda.indexar_clase(db, db_clase)
+    generar_sesiones(db, [db_clase])
+    crud.calendario.bump_calendarios(db, [entrenador_id])
+    crud.versiones.bump_version(db, VERSION_CLASES)
     db.commit()
     db.refresh(db_clase)
     return db_clase
@@ -53,50 +308,196 @@ def update_clase(db: Session, id: int, clase: schemas.clases.ClaseUpdate):
             if value is not None and hasattr(db_clase, var):
                 setattr(db_clase, var, value)
         
+        # El nuevo cupo aplica a las sesiones de hoy en adelante; los lugares nuevos van a la lista de espera
+        promovidas = []
+        if clase.Cupo is not None:
+            db.query(models.reservaciones.CupoSesion).filter(
+                models.reservaciones.CupoSesion.Clase_ID == id,
+                models.reservaciones.CupoSesion.Fecha >= date.today()
+            ).update({
+                models.reservaciones.CupoSesion.Cupo: clase.Cupo,
+                models.reservaciones.CupoSesion.Fecha_Actualizacion: datetime.now()
+            }, synchronize_session=False)
+            
+            fechas_con_espera = db.query(models.reservaciones.ListaEspera.Fecha).filter(
+                models.reservaciones.ListaEspera.Clase_ID == id,
+                models.reservaciones.ListaEspera.Fecha >= date.today(),
+                models.reservaciones.ListaEspera.Estatus == "En Espera"
+            ).distinct().all()
+            for (fecha,) in fechas_con_espera:
+                promovidas.extend(crud.reservaciones.llenar_desde_lista_espera(db, id, fecha))
+        
+        # Regenerar las sesiones futuras si cambió el horario o el estatus
+        if any(getattr(clase, campo) is not None for campo in ("Dia_Inicio", "Dia_Fin", "Hora_Inicio", "Hora_Fin", "Estatus")):
+            generar_sesiones(db, [db_clase])
+        
         # Actualizar fecha de actualización
         db_clase.Fecha_Actualizacion = datetime.now()
+        crud.busqueda.indexar_clase(db, db_clase)
+        crud.calendario.bump_calendarios_clase(db, id)
+        crud.versiones.bump_version(db, VERSION_CLASES)
         
         db.commit()
+        crud.reservaciones.notificar_promociones(db, promovidas)
+        if clase.Cupo is not None and eventos_disponibilidad.canal.hay_suscriptores(id):
+            fechas = db.query(models.reservaciones.CupoSesion.Fecha).filter(
+                models.reservaciones.CupoSesion.Clase_ID == id,
+                models.reservaciones.CupoSesion.Fecha >= date.today()
+            ).all()
+            crud.reservaciones.publicar_disponibilidad(db, [(id, fecha) for (fecha,) in fechas])
         db.refresh(db_clase)
     return db_clase
 
-# Eliminar clase por ID
-# Eliminar clase por ID
+# Eliminar de una vez (DELETE por conjunto) todo lo que depende de una clase, sin commit; devuelve cuántas filas se borraron
+def _eliminar_dependencias_clase(db: Session, id: int):
+    # Quitar la clase de los feeds de calendario, del mapa de ocupación y del horario público
+    crud.calendario.bump_calendarios_clase(db, id)
+    crud.versiones.bump_version(db, crud.reservaciones.VERSION_OCUPACION)
+    crud.versiones.bump_version(db, VERSION_CLASES)
+    
+    # Descontar del resumen de calificaciones las quejas de esta clase antes de borrarlas
+    crud.quejas.restar_quejas_resumen(db, models.quejas.Queja.Clase_ID == id)
+    report_cache.marcar_sucio(db, crud.quejas.CLAVE_REPORTE_ADMIN)
+    eliminadas = {
+        "quejas": db.query(models.quejas.Queja).filter(
+            models.quejas.Queja.Clase_ID == id
+        ).delete(synchronize_session=False),
+        # La lista de espera va antes que las reservaciones a las que apunta
+        "lista_espera": db.query(models.reservaciones.ListaEspera).filter(
+            models.reservaciones.ListaEspera.Clase_ID == id
+        ).delete(synchronize_session=False),
+        "reservaciones": db.query(models.reservaciones.Reservacion).filter(
+            models.reservaciones.Reservacion.Clase_ID == id
+        ).delete(synchronize_session=False),
+        "sesiones": db.query(models.reservaciones.CupoSesion).filter(
+            models.reservaciones.CupoSesion.Clase_ID == id
+        ).delete(synchronize_session=False)
+    }
+    crud.busqueda.eliminar_documento(db, crud.busqueda.TIPO_CLASE, id)
+    return eliminadas
+
+# Eliminar clase por ID junto con sus relaciones en una sola transacción
 def delete_clase(db: Session, id: int):
-    # Primero, obtener la clase para verificar que existe
     db_clase = db.query(models.clases.Clase).filter(models.clases.Clase.ID == id).first()
     
     if db_clase:
-        # Eliminar quejas asociadas a esta clase
-        quejas = db.query(models.quejas.Queja).filter(
-            models.quejas.Queja.Clase_ID == id
-        ).all()
-        
-        num_quejas = len(quejas)
-        for queja in quejas:
-            db.delete(queja)
-            
-        print(f"Se eliminaron {num_quejas} quejas asociadas a la clase ID {id}")
-        
-        # Eliminar reservaciones asociadas a esta clase
-        reservaciones = db.query(models.reservaciones.Reservacion).filter(
-            models.reservaciones.Reservacion.Clase_ID == id
-        ).all()
-        
-        num_reservaciones = len(reservaciones)
-        for reservacion in reservaciones:
-            db.delete(reservacion)
-            
-        print(f"Se eliminaron {num_reservaciones} reservaciones asociadas a la clase ID {id}")
-        
-        # Finalmente eliminar la clase
-        db.delete(db_clase)
+        _eliminar_dependencias_clase(db, id)
+        db.query(models.clases.Clase).filter(models.clases.Clase.ID == id).delete(synchronize_session=False)
+        # La clase borrada se devuelve tal como estaba
+        db.expunge(db_clase)
         db.commit()
-        
-        print(f"Clase ID {id} eliminada correctamente junto con sus relaciones")
     
     return db_clase
 
+# Contar las reservaciones de una clase (para decidir si se elimina en segundo plano)
+def contar_reservaciones_clase(db: Session, id: int):
+    return db.query(func.count(models.reservaciones.Reservacion.ID)).filter(
+        models.reservaciones.Reservacion.Clase_ID == id
+    ).scalar()
+
+def _progreso_desde_registro(registro: models.clases.BorradoClase):
+    return {
+        "clase_id": registro.Clase_ID,
+        "estado": registro.Estado,
+        "reservaciones_totales": registro.Reservaciones_Totales,
+        "reservaciones_eliminadas": registro.Reservaciones_Eliminadas,
+        "inicio": registro.Fecha_Inicio,
+        "fin": registro.Fecha_Fin,
+        "error": registro.Error
+    }
+
+# Progreso de la eliminación en segundo plano de una clase (None si nunca se inició); lo comparten todos los workers
+def get_progreso_borrado(db: Session, id: int):
+    registro = db.query(models.clases.BorradoClase).filter(models.clases.BorradoClase.Clase_ID == id).first()
+    return _progreso_desde_registro(registro) if registro else None
+
+# Eliminar en segundo plano una clase con muchas reservaciones: se desactiva de inmediato y las reservaciones se borran por lotes.
+# El registro en tbd_borrados_clases se toma con un UPDATE condicional o un INSERT, así solo un worker inicia el trabajo
+def iniciar_borrado_clase(db: Session, id: int):
+    BorradoClase = models.clases.BorradoClase
+    ahora = datetime.now()
+    total = contar_reservaciones_clase(db, id)
+    valores = {
+        BorradoClase.Estado: "En proceso",
+        BorradoClase.Reservaciones_Totales: total,
+        BorradoClase.Reservaciones_Eliminadas: 0,
+        BorradoClase.Error: None,
+        BorradoClase.Fecha_Inicio: ahora,
+        BorradoClase.Fecha_Fin: None,
+        BorradoClase.Fecha_Actualizacion: ahora
+    }
+    
+    # Retomar un registro que terminó con error o quedó abandonado
+    tomado = db.query(BorradoClase).filter(
+        BorradoClase.Clase_ID == id,
+        (BorradoClase.Estado != "En proceso") | (BorradoClase.Fecha_Actualizacion < ahora - timedelta(seconds=ABANDONO_BORRADO_SEGUNDOS))
+    ).update(valores, synchronize_session=False)
+    if not tomado:
+        try:
+            with db.begin_nested():
+                db.add(BorradoClase(Clase_ID=id, **{columna.key: valor for columna, valor in valores.items()}))
+            tomado = 1
+        except IntegrityError:
+            # Ya hay una eliminación en proceso de esta clase (en este u otro worker)
+            tomado = 0
+    if not tomado:
+        db.rollback()
+        return get_progreso_borrado(db, id)
+    
+    db.query(models.clases.Clase).filter(models.clases.Clase.ID == id).update({
+        models.clases.Clase.Estatus: False,
+        models.clases.Clase.Fecha_Actualizacion: ahora
+    }, synchronize_session=False)
+    # Los feeds de los miembros se invalidan ahora, mientras sus reservaciones todavía existen
+    crud.calendario.bump_calendarios_clase(db, id)
+    crud.busqueda.eliminar_documento(db, crud.busqueda.TIPO_CLASE, id)
+    crud.versiones.bump_version(db, VERSION_CLASES)
+    db.commit()
+    
+    threading.Thread(target=_borrar_clase_en_lotes, args=(id,), name=f"borrado-clase-{id}", daemon=True).start()
+    return get_progreso_borrado(db, id)
+
+# Registrar el avance de una eliminación en segundo plano (sin commit; va en la transacción del lote)
+def _actualizar_borrado(db: Session, id: int, valores: dict):
+    valores[models.clases.BorradoClase.Fecha_Actualizacion] = datetime.now()
+    db.query(models.clases.BorradoClase).filter(
+        models.clases.BorradoClase.Clase_ID == id
+    ).update(valores, synchronize_session=False)
+
+def _borrar_clase_en_lotes(id: int):
+    BorradoClase = models.clases.BorradoClase
+    db = config.db.SessionLocal()
+    try:
+        db.query(models.reservaciones.ListaEspera).filter(
+            models.reservaciones.ListaEspera.Clase_ID == id
+        ).delete(synchronize_session=False)
+        db.commit()
+        
+        # Lotes acotados: cada uno es un SELECT de IDs y un DELETE ... WHERE ID IN con su propio commit (junto con el avance)
+        while True:
+            ids = [reservacion_id for (reservacion_id,) in db.query(models.reservaciones.Reservacion.ID).filter(
+                models.reservaciones.Reservacion.Clase_ID == id
+            ).limit(LOTE_BORRADO_CLASES).all()]
+            if not ids:
+                break
+            db.query(models.reservaciones.Reservacion).filter(
+                models.reservaciones.Reservacion.ID.in_(ids)
+            ).delete(synchronize_session=False)
+            _actualizar_borrado(db, id, {BorradoClase.Reservaciones_Eliminadas: BorradoClase.Reservaciones_Eliminadas + len(ids)})
+            db.commit()
+        
+        # Lo que queda (quejas, sesiones y la clase) cabe en una sola transacción
+        delete_clase(db, id)
+        _actualizar_borrado(db, id, {BorradoClase.Estado: "Terminado", BorradoClase.Fecha_Fin: datetime.now()})
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.exception("Error al eliminar la clase %s en segundo plano", id)
+        _actualizar_borrado(db, id, {BorradoClase.Estado: "Error", BorradoClase.Error: str(e), BorradoClase.Fecha_Fin: datetime.now()})
+        db.commit()
+    finally:
+        db.close()
+
 # Función para obtener detalles de clase con información del entrenador
 def get_clase_with_entrenador_details(db: Session, clase_id: int):
     # Consulta única con join para obtener información de la clase y del entrenador
@@ -130,6 +531,7 @@ def get_clase_with_entrenador_details(db: Session, clase_id: int):
         "Hora_Inicio": clase.Hora_Inicio,
         "Hora_Fin": clase.Hora_Fin,
         "Duracion_Minutos": clase.Duracion_Minutos,
+        "Cupo": clase.Cupo,
         "Estatus": clase.Estatus,
         "Fecha_Registro": clase.Fecha_Registro,
         "Fecha_Actualizacion": clase.Fecha_Actualizacion,
@@ -167,6 +569,7 @@ def get_clases_with_entrenador(db: Session, skip: int = 0, limit: int = 10):
             "Hora_Inicio": clase.Hora_Inicio,
             "Hora_Fin": clase.Hora_Fin,
             "Duracion_Minutos": clase.Duracion_Minutos,
+            "Cupo": clase.Cupo,
             "Estatus": clase.Estatus,
             "Fecha_Registro": clase.Fecha_Registro,
             "Fecha_Actualizacion": clase.Fecha_Actualizacion,
@@ -175,4 +578,40 @@ def get_clases_with_entrenador(db: Session, skip: int = 0, limit: int = 10):
             "Entrenador_Apellido": result[3] or ""
         })
     
-    return clases_con_detalles
\ No newline at end of file
+    return clases_con_detalles
+
+# Invalidar el listado de clases si el usuario es entrenador de alguna (sin commit); su nombre aparece en el listado
+def bump_clases_entrenador(db: Session, usuario_id: int):
+    if db.query(models.clases.Clase.ID).filter(models.clases.Clase.Entrenador_ID == usuario_id).first():
+        crud.versiones.bump_version(db, VERSION_CLASES)
+
+# Listado de clases ya serializado a JSON desde la caché del worker; si la versión no cambió solo cuesta su lectura
+def _get_listado_cached(db: Session, vista: str, skip: int, limit: int):
+    # La versión se lee antes de consultar, así la caché nunca queda más vieja que su versión
+    version = crud.versiones.get_version(db, VERSION_CLASES)
+    clave = (vista, skip, limit)
+    cacheado = _cache_clases.get(clave)
+    if cacheado is not None and cacheado[0] == version:
+        return cacheado[1]
+    
+    if vista == "detalles":
+        cuerpo = _json_clases_detalles.dump_json(get_clases_with_entrenador(db, skip, limit))
+    else:
+        cuerpo = _json_clases.dump_json(get_clases(db, skip, limit))
+    
+    with _lock_clases:
+        # Las entradas de versiones anteriores ya no sirven
+        for anterior in [c for c, (v, _) in _cache_clases.items() if v != version]:
+            del _cache_clases[anterior]
+        if len(_cache_clases) >= LIMITE_CACHE_CLASES:
+            _cache_clases.pop(next(iter(_cache_clases)))
+        _cache_clases[clave] = (version, cuerpo)
+    return cuerpo
+
+# Todas las clases como JSON (bytes) desde la caché
+def get_clases_json_cached(db: Session, skip: int = 0, limit: int = 10):
+    return _get_listado_cached(db, "clases", skip, limit)
+
+# Clases con detalles del entrenador como JSON (bytes) desde la caché
+def get_clases_with_entrenador_json_cached(db: Session, skip: int = 0, limit: int = 10):
+    return _get_listado_cached(db, "detalles", skip, limit)
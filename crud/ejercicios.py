@@ -1,6 +1,7 @@
 from sqlalchemy.orm import Session
 import models.entrenamientos
 import schemas.ejercicios
+import crud.busqueda
 from typing import List, Optional
 
 # Obtener todos los ejercicios
@@ -32,6 +33,8 @@ def create_ejercicio(db: Session, ejercicio: schemas.ejercicios.EjercicioCreate)
         Categoria=ejercicio.Categoria
     )
     db.add(db_ejercicio)
+    db.flush()
+    crud.busqueda.indexar_ejercicio(db, db_ejercicio)
     db.commit()
     db.refresh(db_ejercicio)
     return db_ejercicio
@@ -46,6 +49,7 @@ def update_ejercicio(db: Session, id: int, ejercicio: schemas.ejercicios.Ejercic
     for key, value in update_data.items():
         setattr(db_ejercicio, key, value)
     
+    crud.busqueda.indexar_ejercicio(db, db_ejercicio)
     db.commit()
     db.refresh(db_ejercicio)
     return db_ejercicio
@@ -56,6 +60,7 @@ def delete_ejercicio(db: Session, id: int):
     if db_ejercicio is None:
         return None
     
+    crud.busqueda.eliminar_documento(db, crud.busqueda.TIPO_EJERCICIO, id)
     db.delete(db_ejercicio)
     db.commit()
     return db_ejercicio
\ No newline at end of file
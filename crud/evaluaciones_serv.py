@@ -1,11 +1,28 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import func, case, select, insert
+from sqlalchemy.exc import IntegrityError
 import models.evaluaciones_serv
 import models.servicios
 import models.users
 import models.usersrols
 import schemas.evaluaciones_serv
+import report_cache
+import rating_stats
+import crud.servicios
+import crud.versiones
 from datetime import datetime
 
+# Versión común a las estadísticas de todos los servicios (sube al reconstruir el resumen)
+VERSION_ESTADISTICAS_SERVICIOS = "servicios:estadisticas"
+
+# Clave del reporte de estadísticas de un servicio en la caché de reportes (también es su versión)
+def clave_reporte_servicio(servicio_id: int):
+    return f"servicios:{servicio_id}:estadisticas"
+
+# Versiones de las que depende el reporte de estadísticas de un servicio
+def versiones_reporte_servicio(servicio_id: int):
+    return (VERSION_ESTADISTICAS_SERVICIOS, clave_reporte_servicio(servicio_id))
+
 # Buscar por ID
 def get_evaluacion(db: Session, id: int):
     return db.query(models.evaluaciones_serv.Evaluaciones_serv).filter(models.evaluaciones_serv.Evaluaciones_serv.ID == id).first()
@@ -40,6 +57,11 @@ def create_evaluacion(db: Session, evaluacion: schemas.evaluaciones_serv.Evaluac
     )
     
     db.add(db_evaluacion)
+    
+    # Actualizar el resumen del servicio en la misma transacción
+    aplicar_resumen_servicio(db, db_evaluacion.Servicio_ID, db_evaluacion.Calificacion, db_evaluacion.Estatus, 1)
+    crud.versiones.bump_version(db, crud.servicios.VERSION_RANKING)
+    report_cache.marcar_sucio(db, clave_reporte_servicio(db_evaluacion.Servicio_ID))
     db.commit()
     db.refresh(db_evaluacion)
     return db_evaluacion
@@ -48,12 +70,25 @@ def create_evaluacion(db: Session, evaluacion: schemas.evaluaciones_serv.Evaluac
 def update_evaluacion(db: Session, id: int, evaluacion: schemas.evaluaciones_serv.EvaluacionServUpdate):
     db_evaluacion = db.query(models.evaluaciones_serv.Evaluaciones_serv).filter(models.evaluaciones_serv.Evaluaciones_serv.ID == id).first()
     if db_evaluacion:
+        servicio_anterior = db_evaluacion.Servicio_ID
+        calificacion_anterior = db_evaluacion.Calificacion
+        estatus_anterior = db_evaluacion.Estatus
+        
         for var, value in vars(evaluacion).items():
             if value is not None and hasattr(db_evaluacion, var):
                 setattr(db_evaluacion, var, value)
         
+        # Mover la evaluación en el resumen si cambió el servicio, la calificación o el estatus
+        if (db_evaluacion.Servicio_ID, db_evaluacion.Calificacion, db_evaluacion.Estatus) != (servicio_anterior, calificacion_anterior, estatus_anterior):
+            aplicar_resumen_servicio(db, servicio_anterior, calificacion_anterior, estatus_anterior, -1)
+            aplicar_resumen_servicio(db, db_evaluacion.Servicio_ID, db_evaluacion.Calificacion, db_evaluacion.Estatus, 1)
+        
         # Actualizar fecha de actualización
         db_evaluacion.Fecha_Actualizacion = datetime.now()
+        crud.versiones.bump_version(db, crud.servicios.VERSION_RANKING)
+        report_cache.marcar_sucio(db, clave_reporte_servicio(servicio_anterior))
+        if db_evaluacion.Servicio_ID != servicio_anterior:
+            report_cache.marcar_sucio(db, clave_reporte_servicio(db_evaluacion.Servicio_ID))
         
         db.commit()
         db.refresh(db_evaluacion)
@@ -63,10 +98,122 @@ def update_evaluacion(db: Session, id: int, evaluacion: schemas.evaluaciones_ser
 def delete_evaluacion(db: Session, id: int):
     db_evaluacion = db.query(models.evaluaciones_serv.Evaluaciones_serv).filter(models.evaluaciones_serv.Evaluaciones_serv.ID == id).first()
     if db_evaluacion:
+        aplicar_resumen_servicio(db, db_evaluacion.Servicio_ID, db_evaluacion.Calificacion, db_evaluacion.Estatus, -1)
         db.delete(db_evaluacion)
+        crud.versiones.bump_version(db, crud.servicios.VERSION_RANKING)
+        report_cache.marcar_sucio(db, clave_reporte_servicio(db_evaluacion.Servicio_ID))
         db.commit()
     return db_evaluacion
 
+# Aplicar un cambio (+1 o -1 evaluaciones) al resumen del servicio, sin hacer commit
+def aplicar_resumen_servicio(db: Session, servicio_id: int, calificacion: int, activa: bool, delta: int):
+    Resumen = models.evaluaciones_serv.ResumenEvaluacionServicio
+    
+    if calificacion not in rating_stats.CLAVES_DISTRIBUCION:
+        return
+    
+    delta_activas = delta if activa else 0
+    columna_estrellas = getattr(Resumen, f"Estrellas_{calificacion}")
+    valores = {
+        Resumen.Total_Evaluaciones: Resumen.Total_Evaluaciones + delta,
+        Resumen.Suma_Calificaciones: Resumen.Suma_Calificaciones + delta * calificacion,
+        columna_estrellas: columna_estrellas + delta,
+        Resumen.Total_Activas: Resumen.Total_Activas + delta_activas,
+        Resumen.Suma_Activas: Resumen.Suma_Activas + delta_activas * calificacion,
+        Resumen.Fecha_Actualizacion: datetime.now()
+    }
+    
+    # Incremento atómico sobre la fila existente
+    actualizadas = db.query(Resumen).filter(Resumen.Servicio_ID == servicio_id).update(valores, synchronize_session=False)
+    if actualizadas or delta < 0:
+        return
+    
+    # Primera evaluación del servicio: crear la fila
+    nueva_fila = Resumen(
+        Servicio_ID=servicio_id,
+        Total_Evaluaciones=delta,
+        Suma_Calificaciones=delta * calificacion,
+        Estrellas_1=0,
+        Estrellas_2=0,
+        Estrellas_3=0,
+        Estrellas_4=0,
+        Estrellas_5=0,
+        Total_Activas=delta_activas,
+        Suma_Activas=delta_activas * calificacion,
+        Fecha_Actualizacion=datetime.now()
+    )
+    setattr(nueva_fila, f"Estrellas_{calificacion}", delta)
+    
+    try:
+        with db.begin_nested():
+            db.add(nueva_fila)
+    except IntegrityError:
+        # Otra transacción creó la fila al mismo tiempo
+        db.query(Resumen).filter(Resumen.Servicio_ID == servicio_id).update(valores, synchronize_session=False)
+
+# Reconstruir por completo el resumen de evaluaciones a partir de tbd_evaluaciones_servicios
+def rebuild_resumen_servicios(db: Session):
+    Resumen = models.evaluaciones_serv.ResumenEvaluacionServicio
+    Evaluacion = models.evaluaciones_serv.Evaluaciones_serv
+    
+    activa = Evaluacion.Estatus == True
+    seleccion = select(
+        Evaluacion.Servicio_ID,
+        func.count(Evaluacion.ID),
+        func.sum(Evaluacion.Calificacion),
+        *[func.sum(case((Evaluacion.Calificacion == n, 1), else_=0)) for n in range(1, 6)],
+        func.sum(case((activa, 1), else_=0)),
+        func.sum(case((activa, Evaluacion.Calificacion), else_=0)),
+        func.now()
+    ).where(
+        Evaluacion.Calificacion.between(1, 5)
+    ).group_by(Evaluacion.Servicio_ID)
+    
+    db.query(Resumen).delete(synchronize_session=False)
+    db.execute(insert(Resumen).from_select([
+        Resumen.Servicio_ID,
+        Resumen.Total_Evaluaciones,
+        Resumen.Suma_Calificaciones,
+        Resumen.Estrellas_1,
+        Resumen.Estrellas_2,
+        Resumen.Estrellas_3,
+        Resumen.Estrellas_4,
+        Resumen.Estrellas_5,
+        Resumen.Total_Activas,
+        Resumen.Suma_Activas,
+        Resumen.Fecha_Actualizacion
+    ], seleccion))
+    crud.versiones.bump_version(db, crud.servicios.VERSION_RANKING)
+    # Las estadísticas en caché de todos los servicios quedan desactualizadas
+    report_cache.marcar_sucio(db, VERSION_ESTADISTICAS_SERVICIOS)
+    db.commit()
+    
+    return db.query(func.count()).select_from(Resumen).scalar()
+
+# Llenar el resumen de evaluaciones al arrancar si está vacío y ya hay evaluaciones (por ejemplo, la primera vez que
+# corre esta versión sobre una base existente); devuelve cuántas filas creó. Un solo worker lo reconstruye
+def inicializar_resumen_servicios(db: Session):
+    if db.query(models.evaluaciones_serv.ResumenEvaluacionServicio.Servicio_ID).first() is not None:
+        return 0
+    if db.query(models.evaluaciones_serv.Evaluaciones_serv.ID).first() is None:
+        return 0
+    if not crud.versiones.reclamar(db, "inicializacion:resumen_servicios"):
+        db.rollback()
+        return 0
+    return rebuild_resumen_servicios(db)
+
+# Histograma de calificaciones (1 a 5 estrellas) de una fila del resumen
+def histograma_resumen(resumen):
+    if resumen is None:
+        return rating_stats.histograma_desde_conteos([])
+    return rating_stats.histograma_desde_conteos([
+        (1, resumen.Estrellas_1),
+        (2, resumen.Estrellas_2),
+        (3, resumen.Estrellas_3),
+        (4, resumen.Estrellas_4),
+        (5, resumen.Estrellas_5)
+    ])
+
 # Obtener evaluaciones con información detallada
 def get_evaluaciones_with_details(db: Session, skip: int = 0, limit: int = 10):
     # Consulta con joins para obtener detalles de usuario y servicio
@@ -103,56 +250,21 @@ def get_evaluaciones_with_details(db: Session, skip: int = 0, limit: int = 10):
 
 # Obtener estadísticas de evaluaciones por servicio
 def get_estadisticas_servicio(db: Session, servicio_id: int):
-    # Obtener todas las evaluaciones del servicio
-    evaluaciones = db.query(models.evaluaciones_serv.Evaluaciones_serv).filter(
-        models.evaluaciones_serv.Evaluaciones_serv.Servicio_ID == servicio_id
-    ).all()
+    # Histograma de calificaciones desde el resumen del servicio (una lectura por llave primaria)
+    fila = db.query(models.evaluaciones_serv.ResumenEvaluacionServicio).filter(
+        models.evaluaciones_serv.ResumenEvaluacionServicio.Servicio_ID == servicio_id
+    ).first()
     
-    total_evaluaciones = len(evaluaciones)
+    resumen = rating_stats.resumen(histograma_resumen(fila))
     
-    if total_evaluaciones == 0:
+    if resumen["total"] == 0:
         return {
             "servicio_id": servicio_id,
             "total_evaluaciones": 0,
             "promedio_calificacion": 0,
-            "distribucion_calificaciones": {
-                "5_estrellas": 0,
-                "4_estrellas": 0,
-                "3_estrellas": 0,
-                "2_estrellas": 0,
-                "1_estrella": 0
-            }
+            "distribucion_calificaciones": rating_stats.distribucion_vacia()
         }
     
-    # Calcular promedio de calificaciones
-    suma_calificaciones = sum(evaluacion.Calificacion for evaluacion in evaluaciones)
-    promedio_calificacion = round(suma_calificaciones / total_evaluaciones, 2)
-    
-    # Calcular distribución de calificaciones
-    distribucion = {
-        "5_estrellas": 0,
-        "4_estrellas": 0,
-        "3_estrellas": 0,
-        "2_estrellas": 0,
-        "1_estrella": 0
-    }
-    
-    for evaluacion in evaluaciones:
-        if evaluacion.Calificacion == 5:
-            distribucion["5_estrellas"] += 1
-        elif evaluacion.Calificacion == 4:
-            distribucion["4_estrellas"] += 1
-        elif evaluacion.Calificacion == 3:
-            distribucion["3_estrellas"] += 1
-        elif evaluacion.Calificacion == 2:
-            distribucion["2_estrellas"] += 1
-        elif evaluacion.Calificacion == 1:
-            distribucion["1_estrella"] += 1
-    
-    # Calcular porcentajes
-    for key in distribucion:
-        distribucion[key] = round((distribucion[key] / total_evaluaciones) * 100, 2)
-    
     # Obtener información del servicio
     servicio = db.query(models.servicios.Servicios).filter(
         models.servicios.Servicios.ID == servicio_id
@@ -161,7 +273,8 @@ def get_estadisticas_servicio(db: Session, servicio_id: int):
     return {
         "servicio_id": servicio_id,
         "nombre_servicio": servicio.Nombre if servicio else "Desconocido",
-        "total_evaluaciones": total_evaluaciones,
-        "promedio_calificacion": promedio_calificacion,
-        "distribucion_calificaciones": distribucion
+        "total_evaluaciones": resumen["total"],
+        "promedio_calificacion": resumen["promedio"],
+        "distribucion_calificaciones": resumen["distribucion"],
+        "percentiles_calificacion": resumen["percentiles"]
     }
\ No newline at end of file
@@ -1,29 +1,43 @@
 from sqlalchemy.orm import Session
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, exists
 import models.membresias
 import models.users
 import models.usersrols
+import models.rols
 import schemas.membresias
 from datetime import datetime
 from typing import List, Optional
+import os
+
+# Tarea de vencimientos: cada cuántos segundos corre y cuántas membresías desactiva por lote
+INTERVALO_MEMBRESIAS = int(os.getenv("MEMBRESIAS_INTERVALO", "3600"))
+LOTE_MEMBRESIAS = int(os.getenv("MEMBRESIAS_LOTE", "500"))
+
+# Condición de membresía vigente: activa y sin fecha de fin pasada (aunque la tarea aún no la haya desactivado)
+def filtro_membresia_vigente(ahora: datetime = None):
+    Membresia = models.membresias.Membresia
+    ahora = ahora or datetime.now()
+    return (Membresia.Estatus == True) & (Membresia.Fecha_Fin.is_(None) | (Membresia.Fecha_Fin >= ahora))
 
 # Buscar por ID
 def get_membresia(db: Session, id: int):
     return db.query(models.membresias.Membresia).filter(models.membresias.Membresia.ID == id).first()
 
-# Buscar por Usuario_ID
+# Buscar la membresía vigente de un usuario
 def get_membresia_by_usuario(db: Session, usuario_id: int):
     return db.query(models.membresias.Membresia).filter(
         models.membresias.Membresia.Usuario_ID == usuario_id,
-        models.membresias.Membresia.Estatus == True
+        filtro_membresia_vigente()
     ).first()
 
 # Buscar todas las membresías
 def get_membresias(db: Session, skip: int = 0, limit: int = 10, estatus: Optional[bool] = None):
     query = db.query(models.membresias.Membresia)
     
+    # Una membresía vencida cuenta como inactiva aunque conserve Estatus = True
     if estatus is not None:
-        query = query.filter(models.membresias.Membresia.Estatus == estatus)
+        vigente = filtro_membresia_vigente()
+        query = query.filter(vigente if estatus else ~vigente)
     
     return query.offset(skip).limit(limit).all()
 
@@ -71,13 +85,50 @@ def delete_membresia(db: Session, id: int):
         db.commit()
     return db_membresia
 
+# Desactivar un lote de membresías vencidas con un solo UPDATE; devuelve cuántas se desactivaron
+def desactivar_lote_membresias(db: Session, limite: int = LOTE_MEMBRESIAS):
+    Membresia = models.membresias.Membresia
+    ahora = datetime.now()
+    
+    # El índice (Estatus, Fecha_Fin) encuentra el lote; SKIP LOCKED evita tomar filas de otro proceso
+    ids = [membresia_id for (membresia_id,) in db.query(Membresia.ID).filter(
+        Membresia.Estatus == True,
+        Membresia.Fecha_Fin < ahora
+    ).order_by(Membresia.Fecha_Fin).limit(limite).with_for_update(skip_locked=True).all()]
+    if not ids:
+        db.rollback()
+        return 0
+    
+    # El UPDATE repite la condición, así una membresía renovada mientras tanto no se desactiva
+    desactivadas = db.query(Membresia).filter(
+        Membresia.ID.in_(ids),
+        Membresia.Estatus == True,
+        Membresia.Fecha_Fin < ahora
+    ).update({
+        Membresia.Estatus: False,
+        Membresia.Fecha_Actualizacion: ahora
+    }, synchronize_session=False)
+    db.commit()
+    return desactivadas
+
+# Desactivar todas las membresías vencidas en lotes acotados (cada lote con su propio commit)
+def desactivar_membresias_vencidas(db: Session, limite: int = LOTE_MEMBRESIAS):
+    total = 0
+    while True:
+        desactivadas = desactivar_lote_membresias(db, limite)
+        total += desactivadas
+        if desactivadas < limite:
+            return total
+
 # Obtener membresías con información detallada del usuario
 def get_membresias_with_details(db: Session, skip: int = 0, limit: int = 10):
     # Consulta con joins para obtener detalles de usuario
+    # Estatus se deriva de la vigencia: una membresía vencida se muestra inactiva aunque la tarea aún no la desactive
     results = db.query(
         models.membresias.Membresia,
         models.users.User.Nombre_Usuario,
-        models.users.User.Correo_Electronico
+        models.users.User.Correo_Electronico,
+        filtro_membresia_vigente().label("vigente")
     ).join(
         models.usersrols.UserRol, models.membresias.Membresia.Usuario_ID == models.usersrols.UserRol.Usuario_ID
     ).join(
@@ -97,7 +148,7 @@ def get_membresias_with_details(db: Session, skip: int = 0, limit: int = 10):
             "Nivel": membresia.Nivel.value,
             "Fecha_Inicio": membresia.Fecha_Inicio,
             "Fecha_Fin": membresia.Fecha_Fin,
-            "Estatus": membresia.Estatus,
+            "Estatus": bool(result[3]),
             "Fecha_Registro": membresia.Fecha_Registro,
             "Fecha_Actualizacion": membresia.Fecha_Actualizacion,
             "Usuario_Nombre": result[1],
@@ -106,30 +157,50 @@ def get_membresias_with_details(db: Session, skip: int = 0, limit: int = 10):
     
     return membresias_con_detalles
 
-# Obtener usuarios con rol de "usuario"
-def get_usuarios_rol_usuario(db: Session, skip: int = 0, limit: int = 10):
-    # Buscar el ID del rol "usuario"
-    rol_usuario = db.query(models.users.Rol).filter(models.users.Rol.Nombre == "usuario").first()
-    
-    if not rol_usuario:
-        return []
+# Obtener usuarios con rol de "usuario" y si tienen membresía vigente, en una sola consulta.
+# Con despues_de se pagina por llave (ID > último ID de la página anterior) en lugar de OFFSET
+def get_usuarios_rol_usuario(db: Session, skip: int = 0, limit: int = 10, despues_de: Optional[int] = None):
+    User = models.users.User
+    tiene_membresia = exists().where(
+        models.membresias.Membresia.Usuario_ID == User.ID,
+        filtro_membresia_vigente()
+    )
     
-    # Buscar los usuarios que tienen el rol "usuario"
-    usuarios = db.query(
-        models.users.User
+    query = db.query(
+        User.ID,
+        User.Nombre_Usuario,
+        User.Correo_Electronico,
+        tiene_membresia.label("tiene_membresia_activa")
     ).join(
-        models.usersrols.UserRol, models.users.User.ID == models.usersrols.UserRol.Usuario_ID
+        models.usersrols.UserRol, User.ID == models.usersrols.UserRol.Usuario_ID
+    ).join(
+        models.rols.Rol, models.usersrols.UserRol.Rol_ID == models.rols.Rol.ID
     ).filter(
-        models.usersrols.UserRol.Rol_ID == rol_usuario.ID
-    ).offset(skip).limit(limit).all()
+        models.rols.Rol.Nombre == "usuario"
+    ).order_by(User.ID)
+    
+    if despues_de is not None:
+        query = query.filter(User.ID > despues_de)
+    else:
+        query = query.offset(skip)
     
-    return usuarios
+    return [
+        {
+            "id": usuario_id,
+            "nombre_usuario": nombre_usuario,
+            "correo_electronico": correo_electronico,
+            "tiene_membresia_activa": bool(activa)
+        }
+        for usuario_id, nombre_usuario, correo_electronico, activa in query.limit(limit).all()
+    ]
 
 # Obtener usuarios con membresía específica
 def get_usuarios_por_membresia(db: Session, tipo_membresia: Optional[str] = None, skip: int = 0, limit: int = 10):
+    # El estatus se deriva de la vigencia (una membresía vencida cuenta como inactiva)
     query = db.query(
         models.users.User,
-        models.membresias.Membresia
+        models.membresias.Membresia,
+        filtro_membresia_vigente().label("vigente")
     ).join(
         models.usersrols.UserRol, models.users.User.ID == models.usersrols.UserRol.Usuario_ID
     ).join(
@@ -142,7 +213,7 @@ def get_usuarios_por_membresia(db: Session, tipo_membresia: Optional[str] = None
     results = query.offset(skip).limit(limit).all()
     
     usuarios_con_membresia = []
-    for user, membresia in results:
+    for user, membresia, vigente in results:
         usuarios_con_membresia.append({
             "usuario_id": user.ID,
             "nombre_usuario": user.Nombre_Usuario,
@@ -154,7 +225,7 @@ def get_usuarios_por_membresia(db: Session, tipo_membresia: Optional[str] = None
             "nivel": membresia.Nivel.value,
             "fecha_inicio": membresia.Fecha_Inicio,
             "fecha_fin": membresia.Fecha_Fin,
-            "estatus": membresia.Estatus
+            "estatus": bool(vigente)
         })
     
     return usuarios_con_membresia
\ No newline at end of file
@@ -1,4 +1,5 @@
 import models.persons
+import crud.clases
 import schemas.persons
 from sqlalchemy.orm import Session
 import models, schemas
@@ -39,6 +40,7 @@ def update_person(db:Session, id:int, person:schemas.persons.PersonUpdate):
     if db_person:
         for var, value in vars(person).items():
             setattr(db_person, var, value) if value else None
+        crud.clases.bump_clases_entrenador(db, db_person.Usuario_ID)
         db.commit()
         db.refresh(db_person)
     return db_person
@@ -47,6 +49,7 @@ def update_person(db:Session, id:int, person:schemas.persons.PersonUpdate):
 def delete_person(db:Session, id:int):
     db_person = db.query(models.persons.Person).filter(models.persons.Person.ID == id).first()
     if db_person:
+        crud.clases.bump_clases_entrenador(db, db_person.Usuario_ID)
         db.delete(db_person)
         db.commit()
     return db_person
\ No newline at end of file
@@ -1,11 +1,21 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import func, extract, case, select, insert
+from sqlalchemy.exc import IntegrityError
 import models.quejas
 import models.clases
 import models.users
 import models.persons
 import schemas.quejas
+import crud.users
+import crud.versiones
+import report_cache
+import rating_stats
+import numpy as np
 from datetime import datetime
 
+# Clave del reporte de estadísticas de administrador en la caché de reportes (también es su versión)
+CLAVE_REPORTE_ADMIN = "quejas:admin"
+
 # Buscar por ID
 def get_queja(db: Session, id: int):
     return db.query(models.quejas.Queja).filter(models.quejas.Queja.ID == id).first()
@@ -46,19 +56,33 @@ def create_queja(db: Session, queja: schemas.quejas.QuejaCreate, usuario_id: int
     )
     
     db.add(db_queja)
+    
+    # Actualizar el resumen del entrenador en la misma transacción
+    aplicar_resumen_entrenador(db, db_queja.Entrenador_ID, db_queja.Fecha_Registro, db_queja.Calificacion, 1)
+    
+    report_cache.marcar_sucio(db, CLAVE_REPORTE_ADMIN)
     db.commit()
     db.refresh(db_queja)
     return db_queja
+
 # Actualizar queja por ID
 def update_queja(db: Session, id: int, queja: schemas.quejas.QuejaUpdate):
     db_queja = db.query(models.quejas.Queja).filter(models.quejas.Queja.ID == id).first()
     if db_queja:
+        calificacion_anterior = db_queja.Calificacion
+        
         for var, value in vars(queja).items():
             if value is not None and hasattr(db_queja, var):
                 setattr(db_queja, var, value)
         
+        # Mover la calificación en el resumen del entrenador si cambió
+        if db_queja.Calificacion != calificacion_anterior:
+            aplicar_resumen_entrenador(db, db_queja.Entrenador_ID, db_queja.Fecha_Registro, calificacion_anterior, -1)
+            aplicar_resumen_entrenador(db, db_queja.Entrenador_ID, db_queja.Fecha_Registro, db_queja.Calificacion, 1)
+        
         # Actualizar fecha de actualización
         db_queja.Fecha_Actualizacion = datetime.now()
+        report_cache.marcar_sucio(db, CLAVE_REPORTE_ADMIN)
         
         db.commit()
         db.refresh(db_queja)
@@ -68,7 +92,9 @@ def update_queja(db: Session, id: int, queja: schemas.quejas.QuejaUpdate):
 def delete_queja(db: Session, id: int):
     db_queja = db.query(models.quejas.Queja).filter(models.quejas.Queja.ID == id).first()
     if db_queja:
+        aplicar_resumen_entrenador(db, db_queja.Entrenador_ID, db_queja.Fecha_Registro, db_queja.Calificacion, -1)
         db.delete(db_queja)
+        report_cache.marcar_sucio(db, CLAVE_REPORTE_ADMIN)
         db.commit()
     return db_queja
 
@@ -107,4 +133,333 @@ def get_quejas_with_details(db: Session, skip: int = 0, limit: int = 10):
             "Entrenador_Nombre": result[3] or "Sin nombre"
         })
     
-    return quejas_con_detalles
\ No newline at end of file
+    return quejas_con_detalles
+
+# Generar los últimos 6 meses (en orden cronológico) hasta la fecha indicada
+def get_ultimos_meses(fecha: datetime, num_meses: int = 6):
+    meses = []
+    for i in range(num_meses):
+        mes = fecha.month - i
+        anio = fecha.year
+        if mes <= 0:
+            mes += 12
+            anio -= 1
+        meses.append((anio, mes))
+    meses.reverse()
+    return meses
+
+# Aplicar un cambio (+1 o -1 quejas) al resumen mensual del entrenador, sin hacer commit
+def aplicar_resumen_entrenador(db: Session, entrenador_id: int, fecha: datetime, calificacion: int, delta: int):
+    Resumen = models.quejas.ResumenCalificacionEntrenador
+    
+    if fecha is None or calificacion not in rating_stats.CLAVES_DISTRIBUCION:
+        return
+    
+    columna_estrellas = getattr(Resumen, f"Estrellas_{calificacion}")
+    filtros = (
+        Resumen.Entrenador_ID == entrenador_id,
+        Resumen.Anio == fecha.year,
+        Resumen.Mes == fecha.month
+    )
+    valores = {
+        Resumen.Total_Quejas: Resumen.Total_Quejas + delta,
+        Resumen.Suma_Calificaciones: Resumen.Suma_Calificaciones + delta * calificacion,
+        columna_estrellas: columna_estrellas + delta,
+        Resumen.Fecha_Actualizacion: datetime.now()
+    }
+    
+    # Incremento atómico sobre la fila existente
+    actualizadas = db.query(Resumen).filter(*filtros).update(valores, synchronize_session=False)
+    if actualizadas or delta < 0:
+        return
+    
+    # Primera queja del mes para el entrenador: crear la fila
+    nueva_fila = Resumen(
+        Entrenador_ID=entrenador_id,
+        Anio=fecha.year,
+        Mes=fecha.month,
+        Total_Quejas=delta,
+        Suma_Calificaciones=delta * calificacion,
+        Estrellas_1=0,
+        Estrellas_2=0,
+        Estrellas_3=0,
+        Estrellas_4=0,
+        Estrellas_5=0,
+        Fecha_Actualizacion=datetime.now()
+    )
+    setattr(nueva_fila, f"Estrellas_{calificacion}", delta)
+    
+    try:
+        with db.begin_nested():
+            db.add(nueva_fila)
+    except IntegrityError:
+        # Otra transacción creó la fila al mismo tiempo
+        db.query(Resumen).filter(*filtros).update(valores, synchronize_session=False)
+
+# Restar del resumen las quejas que cumplan los criterios (antes de borrarlas en bloque)
+def restar_quejas_resumen(db: Session, *criterios):
+    Resumen = models.quejas.ResumenCalificacionEntrenador
+    Queja = models.quejas.Queja
+    
+    anio_col = extract('year', Queja.Fecha_Registro)
+    mes_col = extract('month', Queja.Fecha_Registro)
+    
+    grupos = db.query(
+        Queja.Entrenador_ID,
+        anio_col,
+        mes_col,
+        func.count(Queja.ID),
+        func.sum(Queja.Calificacion),
+        *[func.sum(case((Queja.Calificacion == n, 1), else_=0)) for n in range(1, 6)]
+    ).filter(
+        Queja.Fecha_Registro.isnot(None),
+        *criterios
+    ).group_by(Queja.Entrenador_ID, anio_col, mes_col).all()
+    
+    for entrenador_id, anio, mes, total, suma, *estrellas in grupos:
+        db.query(Resumen).filter(
+            Resumen.Entrenador_ID == entrenador_id,
+            Resumen.Anio == int(anio),
+            Resumen.Mes == int(mes)
+        ).update({
+            Resumen.Total_Quejas: Resumen.Total_Quejas - total,
+            Resumen.Suma_Calificaciones: Resumen.Suma_Calificaciones - suma,
+            Resumen.Estrellas_1: Resumen.Estrellas_1 - estrellas[0],
+            Resumen.Estrellas_2: Resumen.Estrellas_2 - estrellas[1],
+            Resumen.Estrellas_3: Resumen.Estrellas_3 - estrellas[2],
+            Resumen.Estrellas_4: Resumen.Estrellas_4 - estrellas[3],
+            Resumen.Estrellas_5: Resumen.Estrellas_5 - estrellas[4],
+            Resumen.Fecha_Actualizacion: datetime.now()
+        }, synchronize_session=False)
+
+# Reconstruir por completo el resumen de calificaciones a partir de tbb_quejas
+def rebuild_resumen_entrenadores(db: Session):
+    Resumen = models.quejas.ResumenCalificacionEntrenador
+    Queja = models.quejas.Queja
+    
+    anio_col = extract('year', Queja.Fecha_Registro)
+    mes_col = extract('month', Queja.Fecha_Registro)
+    
+    seleccion = select(
+        Queja.Entrenador_ID,
+        anio_col,
+        mes_col,
+        func.count(Queja.ID),
+        func.sum(Queja.Calificacion),
+        *[func.sum(case((Queja.Calificacion == n, 1), else_=0)) for n in range(1, 6)],
+        func.now()
+    ).where(
+        Queja.Fecha_Registro.isnot(None)
+    ).group_by(Queja.Entrenador_ID, anio_col, mes_col)
+    
+    db.query(Resumen).delete(synchronize_session=False)
+    db.execute(insert(Resumen).from_select([
+        Resumen.Entrenador_ID,
+        Resumen.Anio,
+        Resumen.Mes,
+        Resumen.Total_Quejas,
+        Resumen.Suma_Calificaciones,
+        Resumen.Estrellas_1,
+        Resumen.Estrellas_2,
+        Resumen.Estrellas_3,
+        Resumen.Estrellas_4,
+        Resumen.Estrellas_5,
+        Resumen.Fecha_Actualizacion
+    ], seleccion))
+    report_cache.marcar_sucio(db, CLAVE_REPORTE_ADMIN)
+    db.commit()
+    
+    return db.query(func.count()).select_from(Resumen).scalar()
+
+# Llenar el resumen de calificaciones al arrancar si está vacío y ya hay quejas (por ejemplo, la primera vez que
+# corre esta versión sobre una base existente); devuelve cuántas filas creó. Un solo worker lo reconstruye
+def inicializar_resumen_entrenadores(db: Session):
+    if db.query(models.quejas.ResumenCalificacionEntrenador.Entrenador_ID).first() is not None:
+        return 0
+    if db.query(models.quejas.Queja.ID).first() is None:
+        return 0
+    if not crud.versiones.reclamar(db, "inicializacion:resumen_entrenadores"):
+        db.rollback()
+        return 0
+    return rebuild_resumen_entrenadores(db)
+
+# Columnas agregadas (total, suma e histograma) del resumen de calificaciones
+def _columnas_resumen():
+    Resumen = models.quejas.ResumenCalificacionEntrenador
+    return [
+        func.coalesce(func.sum(Resumen.Total_Quejas), 0),
+        func.coalesce(func.sum(Resumen.Suma_Calificaciones), 0),
+        func.coalesce(func.sum(Resumen.Estrellas_1), 0),
+        func.coalesce(func.sum(Resumen.Estrellas_2), 0),
+        func.coalesce(func.sum(Resumen.Estrellas_3), 0),
+        func.coalesce(func.sum(Resumen.Estrellas_4), 0),
+        func.coalesce(func.sum(Resumen.Estrellas_5), 0)
+    ]
+
+# Convertir una fila agregada del resumen en un diccionario de estadísticas
+def _estadisticas_desde_fila(total, suma, *estrellas):
+    return {
+        "total_quejas": int(total),
+        "suma_calificaciones": int(suma),
+        "histograma": np.array(estrellas, dtype=np.int64)
+    }
+
+# Calcular la tendencia de los últimos 6 meses a partir del resumen mensual
+def get_tendencia_calificaciones(db: Session, entrenador_id: int = None):
+    Resumen = models.quejas.ResumenCalificacionEntrenador
+    
+    # Mes más reciente con quejas registradas
+    query = db.query(Resumen.Anio, Resumen.Mes).filter(Resumen.Total_Quejas > 0)
+    if entrenador_id is not None:
+        query = query.filter(Resumen.Entrenador_ID == entrenador_id)
+    
+    mas_reciente = query.order_by(Resumen.Anio.desc(), Resumen.Mes.desc()).first()
+    if not mas_reciente:
+        return []
+    
+    meses = get_ultimos_meses(datetime(mas_reciente[0], mas_reciente[1], 1))
+    anio_inicio, mes_inicio = meses[0]
+    
+    query = db.query(
+        Resumen.Anio,
+        Resumen.Mes,
+        func.sum(Resumen.Total_Quejas),
+        func.sum(Resumen.Suma_Calificaciones)
+    ).filter(
+        Resumen.Anio * 100 + Resumen.Mes >= anio_inicio * 100 + mes_inicio
+    )
+    if entrenador_id is not None:
+        query = query.filter(Resumen.Entrenador_ID == entrenador_id)
+    
+    resultados = query.group_by(Resumen.Anio, Resumen.Mes).all()
+    por_mes = {(int(anio), int(mes)): (int(total or 0), int(suma or 0)) for anio, mes, total, suma in resultados}
+    
+    return rating_stats.tendencia(meses, por_mes, clave_total="total_quejas")
+
+# Obtener estadísticas generales de quejas desde el resumen por entrenador
+def get_estadisticas_generales(db: Session):
+    Resumen = models.quejas.ResumenCalificacionEntrenador
+    
+    resultados = db.query(
+        Resumen.Entrenador_ID,
+        *_columnas_resumen()
+    ).group_by(
+        Resumen.Entrenador_ID
+    ).having(
+        func.sum(Resumen.Total_Quejas) > 0
+    ).order_by(Resumen.Entrenador_ID).all()
+    
+    entrenador_ids = [fila[0] for fila in resultados]
+    
+    # Matriz de histogramas (una fila por entrenador) para calcular todo en bloque
+    filas = np.array([fila[1:] for fila in resultados], dtype=np.int64).reshape(-1, 7)
+    totales = filas[:, 0]
+    sumas = filas[:, 1]
+    histogramas = filas[:, 2:]
+    
+    total_quejas = int(totales.sum())
+    suma_calificaciones = int(sumas.sum())
+    
+    tendencia = get_tendencia_calificaciones(db=db) if total_quejas else []
+    
+    return {
+        "total_quejas": total_quejas,
+        "suma_calificaciones": suma_calificaciones,
+        "histograma": histogramas.sum(axis=0),
+        "entrenador_ids": entrenador_ids,
+        "totales": totales,
+        "sumas": sumas,
+        "histogramas": histogramas,
+        "tendencia_calificaciones": tendencia
+    }
+
+# Obtener estadísticas de un entrenador con una sola lectura agregada del resumen
+def get_estadisticas_entrenador(db: Session, entrenador_id: int):
+    Resumen = models.quejas.ResumenCalificacionEntrenador
+    
+    fila = db.query(*_columnas_resumen()).filter(Resumen.Entrenador_ID == entrenador_id).one()
+    data = _estadisticas_desde_fila(*fila)
+    data["tendencia_calificaciones"] = get_tendencia_calificaciones(db=db, entrenador_id=entrenador_id) if data["total_quejas"] else []
+    
+    return data
+
+# Obtener las quejas más recientes de un entrenador
+def get_ultimas_quejas_entrenador(db: Session, entrenador_id: int, limit: int = 10):
+    return db.query(models.quejas.Queja).filter(
+        models.quejas.Queja.Entrenador_ID == entrenador_id
+    ).order_by(models.quejas.Queja.Fecha_Registro.desc()).limit(limit).all()
+
+# Construir el reporte completo de estadísticas de quejas para administradores
+def get_reporte_estadisticas_admin(db: Session):
+    # Obtener las estadísticas agregadas desde la base de datos
+    estadisticas = get_estadisticas_generales(db=db)
+    
+    # Preparar estadísticas
+    total_quejas = estadisticas["total_quejas"]
+    
+    if total_quejas == 0:
+        return {
+            "total_quejas": 0,
+            "promedio_calificacion": 0,
+            "distribucion_calificaciones": rating_stats.distribucion_vacia(),
+            "top_entrenadores": [],
+            "tendencia_calificaciones": []
+        }
+    
+    # Promedio, distribución y percentiles generales
+    resumen = rating_stats.resumen(estadisticas["histograma"])
+    
+    # Promedios, promedios bayesianos y distribuciones de todos los entrenadores en bloque
+    totales = estadisticas["totales"]
+    promedios = rating_stats.promedios(totales, estadisticas["sumas"])
+    promedios_bayesianos = rating_stats.promedios_bayesianos(totales, estadisticas["sumas"])
+    distribuciones = rating_stats.distribuciones(estadisticas["histogramas"])
+    
+    # Obtener los nombres de todos los entrenadores en una sola consulta
+    entrenador_ids = estadisticas["entrenador_ids"]
+    nombres_entrenadores = crud.users.get_nombres_usuarios(db=db, usuario_ids=entrenador_ids)
+    
+    # Preparar estadísticas por entrenador
+    top_entrenadores = []
+    estadisticas_por_entrenador = []
+    
+    for i, entrenador_id in enumerate(entrenador_ids):
+        promedio = round(float(promedios[i]), 2)
+        nombre_entrenador = nombres_entrenadores.get(entrenador_id, "Desconocido")
+        
+        top_entrenadores.append({
+            "entrenador_id": entrenador_id,
+            "nombre": nombre_entrenador,
+            "promedio_calificacion": promedio,
+            "total_quejas": int(totales[i])
+        })
+        
+        # Omitir entrenadores que ya no existen
+        if entrenador_id not in nombres_entrenadores:
+            continue
+        
+        estadisticas_por_entrenador.append({
+            "entrenador_id": entrenador_id,
+            "nombre": nombre_entrenador,
+            "promedio_calificacion": promedio,
+            "promedio_bayesiano": round(float(promedios_bayesianos[i]), 2),
+            "total_quejas": int(totales[i]),
+            "distribucion_calificaciones": distribuciones[i]
+        })
+    
+    # Ordenar por promedio de calificación (descendente) y tomar los 5 mejores
+    top_entrenadores.sort(key=lambda x: x["promedio_calificacion"], reverse=True)
+    top_entrenadores = top_entrenadores[:5]
+    
+    estadisticas_por_entrenador.sort(key=lambda x: x["promedio_calificacion"], reverse=True)
+    
+    # Preparar respuesta completa
+    return {
+        "total_quejas": total_quejas,
+        "promedio_calificacion": resumen["promedio"],
+        "distribucion_calificaciones": resumen["distribucion"],
+        "percentiles_calificacion": resumen["percentiles"],
+        "top_entrenadores": top_entrenadores,
+        "tendencia_calificaciones": estadisticas["tendencia_calificaciones"],
+        "estadisticas_por_entrenador": estadisticas_por_entrenador
+    }
@@ -4,8 +4,39 @@ import models.reservaciones
 import models.users
 import models.clases
 import schemas.reservaciones
-from datetime import datetime
-from sqlalchemy import and_, func
+import crud.clases
+import crud.versiones
+import crud.calendario
+import numpy as np
+from datetime import datetime, date, timedelta
+from sqlalchemy import and_, or_, func, insert, select, union, Integer
+from sqlalchemy.sql import expression
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.exc import IntegrityError
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import gmail_service
+import eventos_disponibilidad
+
+# Estatus de las reservaciones que ocupan un lugar en la sesión (una inasistencia libera el lugar)
+ESTATUS_OCUPAN_LUGAR = ("Confirmada", "Asistida")
+
+# Tarea de inasistencias: cada cuántos segundos corre y cuántas reservaciones procesa por lote
+INTERVALO_INASISTENCIAS = int(os.getenv("INASISTENCIAS_INTERVALO", "600"))
+LOTE_INASISTENCIAS = int(os.getenv("INASISTENCIAS_LOTE", "500"))
+
+# Versión que invalida el mapa de ocupación (aumenta cada vez que cambian las asistencias de días pasados)
+VERSION_OCUPACION = "ocupacion_sesiones"
+# Mapas de ocupación por (día, semanas, clase, entrenador) en este worker: (versión, mapa), los menos usados salen primero
+LIMITE_CACHE_OCUPACION = int(os.getenv("OCUPACION_CACHE_MAXIMO", "256"))
+_cache_ocupacion = OrderedDict()
+_lock_ocupacion = threading.Lock()
+
+# Los avisos de promoción se mandan por SMTP con pocos hilos fijos; los demás esperan en la cola del executor
+CORREOS_HILOS = int(os.getenv("RESERVACIONES_CORREOS_HILOS", "2"))
+_correos = ThreadPoolExecutor(max_workers=CORREOS_HILOS, thread_name_prefix="correos-promocion")
 
 # Buscar por ID
 def get_reservacion(db: Session, id: int):
@@ -27,38 +58,421 @@ def get_reservaciones_by_clase(db: Session, clase_id: int, skip: int = 0, limit:
         models.reservaciones.Reservacion.Clase_ID == clase_id
     ).offset(skip).limit(limit).all()
 
-# Verificar si un usuario ya tiene reservada una clase en una fecha específica
+# Verificar si un usuario ya tiene reservada una clase en una fecha específica (búsqueda en el índice único)
 def check_reservacion_exists(db: Session, usuario_id: int, clase_id: int, fecha_reservacion: datetime):
-    return db.query(models.reservaciones.Reservacion).filter(
+    return db.query(models.reservaciones.Reservacion.ID).filter(
         and_(
             models.reservaciones.Reservacion.Usuario_ID == usuario_id,
             models.reservaciones.Reservacion.Clase_ID == clase_id,
-            func.date(models.reservaciones.Reservacion.Fecha_Reservacion) == func.date(fecha_reservacion),
-            models.reservaciones.Reservacion.Estatus != "Cancelada"
+            models.reservaciones.Reservacion.Fecha == fecha_reservacion.date(),
+            models.reservaciones.Reservacion.Activa == True
         )
     ).first() is not None
 
-# Crear nueva reservación
+# Valor de Activa según el estatus: NULL para las canceladas, así no cuentan en el índice único
+def activa_por_estatus(estatus: str):
+    return None if estatus == "Cancelada" else True
+
+# Crear la sesión (con el horario y el cupo de la clase) si aún no existe (sin commit)
+def _asegurar_cupo_sesion(db: Session, clase_id: int, fecha: date):
+    CupoSesion = models.reservaciones.CupoSesion
+    
+    existe = db.query(CupoSesion.Clase_ID).filter(
+        CupoSesion.Clase_ID == clase_id,
+        CupoSesion.Fecha == fecha
+    ).first()
+    if existe:
+        return
+    
+    clase = db.query(models.clases.Clase).filter(models.clases.Clase.ID == clase_id).first()
+    try:
+        with db.begin_nested():
+            db.add(CupoSesion(**crud.clases.fila_sesion(clase, fecha)))
+    except IntegrityError:
+        # Otra transacción creó la fila al mismo tiempo
+        pass
+
+# Ocupar un lugar de la sesión con un UPDATE condicional; False si ya no hay lugares (sin commit)
+def ocupar_lugar(db: Session, clase_id: int, fecha: date):
+    CupoSesion = models.reservaciones.CupoSesion
+    _asegurar_cupo_sesion(db, clase_id, fecha)
+    
+    # La fila queda bloqueada hasta el commit, así dos reservaciones no pueden tomar el último lugar
+    actualizadas = db.query(CupoSesion).filter(
+        CupoSesion.Clase_ID == clase_id,
+        CupoSesion.Fecha == fecha,
+        CupoSesion.Reservados < CupoSesion.Cupo
+    ).update({
+        CupoSesion.Reservados: CupoSesion.Reservados + 1,
+        CupoSesion.Fecha_Actualizacion: datetime.now()
+    }, synchronize_session=False)
+    return actualizadas == 1
+
+# Liberar un lugar de la sesión (sin commit)
+def liberar_lugar(db: Session, clase_id: int, fecha: date):
+    CupoSesion = models.reservaciones.CupoSesion
+    db.query(CupoSesion).filter(
+        CupoSesion.Clase_ID == clase_id,
+        CupoSesion.Fecha == fecha,
+        CupoSesion.Reservados > 0
+    ).update({
+        CupoSesion.Reservados: CupoSesion.Reservados - 1,
+        CupoSesion.Fecha_Actualizacion: datetime.now()
+    }, synchronize_session=False)
+
+# True si la sesión aún no empieza; solo entonces un lugar liberado se le da a alguien en espera
+def sesion_por_iniciar(db: Session, clase_id: int, fecha: date):
+    inicio = db.query(models.reservaciones.CupoSesion.Inicio).filter(
+        models.reservaciones.CupoSesion.Clase_ID == clase_id,
+        models.reservaciones.CupoSesion.Fecha == fecha
+    ).scalar()
+    if inicio is None:
+        return fecha > date.today()
+    return inicio > datetime.now()
+
+# Liberar el lugar de una sesión y, si todavía no empieza, dárselo al primero en espera (sin commit)
+def liberar_lugar_sesion(db: Session, clase_id: int, fecha: date):
+    if sesion_por_iniciar(db, clase_id, fecha):
+        return liberar_o_promover(db, clase_id, fecha)
+    liberar_lugar(db, clase_id, fecha)
+    return None
+
+# Sumar o restar asistencias al contador de la sesión (sin commit); el mapa de ocupación solo
+# incluye días completos, así que se invalida únicamente cuando cambia una sesión anterior a hoy
+def ajustar_asistencias(db: Session, clase_id: int, fecha: date, delta: int):
+    if not delta:
+        return
+    CupoSesion = models.reservaciones.CupoSesion
+    db.query(CupoSesion).filter(
+        CupoSesion.Clase_ID == clase_id,
+        CupoSesion.Fecha == fecha,
+        CupoSesion.Asistencias + delta >= 0
+    ).update({
+        CupoSesion.Asistencias: CupoSesion.Asistencias + delta,
+        CupoSesion.Fecha_Actualizacion: datetime.now()
+    }, synchronize_session=False)
+    if fecha < date.today():
+        crud.versiones.bump_version(db, VERSION_OCUPACION)
+
+# Cupo, lugares reservados y disponibles de una sesión
+def get_disponibilidad(db: Session, clase_id: int, fecha: date):
+    CupoSesion = models.reservaciones.CupoSesion
+    
+    fila = db.query(CupoSesion.Cupo, CupoSesion.Reservados).filter(
+        CupoSesion.Clase_ID == clase_id,
+        CupoSesion.Fecha == fecha
+    ).first()
+    if fila is None:
+        cupo = db.query(models.clases.Clase.Cupo).filter(models.clases.Clase.ID == clase_id).scalar() or 0
+        fila = (cupo, 0)
+    
+    cupo, reservados = fila
+    return {
+        "Clase_ID": clase_id,
+        "Fecha": fecha,
+        "Cupo": cupo,
+        "Reservados": reservados,
+        "Lugares_Disponibles": max(cupo - reservados, 0)
+    }
+
+# Avisar a los suscriptores en vivo los lugares de las sesiones que cambiaron (después del commit, solo si alguien escucha la clase)
+def publicar_disponibilidad(db: Session, sesiones):
+    for clase_id, fecha in set(sesiones):
+        if eventos_disponibilidad.canal.hay_suscriptores(clase_id):
+            eventos_disponibilidad.canal.publicar(get_disponibilidad(db, clase_id, fecha))
+
+# Cambiar el cupo de una sesión; None si ya hay más reservaciones que el nuevo cupo
+def set_cupo_sesion(db: Session, clase_id: int, fecha: date, cupo: int):
+    CupoSesion = models.reservaciones.CupoSesion
+    _asegurar_cupo_sesion(db, clase_id, fecha)
+    
+    actualizadas = db.query(CupoSesion).filter(
+        CupoSesion.Clase_ID == clase_id,
+        CupoSesion.Fecha == fecha,
+        CupoSesion.Reservados <= cupo
+    ).update({
+        CupoSesion.Cupo: cupo,
+        CupoSesion.Fecha_Actualizacion: datetime.now()
+    }, synchronize_session=False)
+    
+    if not actualizadas:
+        db.rollback()
+        return None
+    
+    # Los lugares nuevos se dan primero a quienes están en espera
+    promovidas = llenar_desde_lista_espera(db, clase_id, fecha)
+    db.commit()
+    notificar_promociones(db, promovidas)
+    disponibilidad = get_disponibilidad(db, clase_id, fecha)
+    eventos_disponibilidad.canal.publicar(disponibilidad)
+    return disponibilidad
+
+# Día de la semana (0 = lunes) y hora de una fecha u hora, en SQL. MySQL tiene WEEKDAY y HOUR; SQLite (pruebas) usa strftime
+class dia_semana(expression.FunctionElement):
+    type = Integer()
+    inherit_cache = True
+
+class hora(expression.FunctionElement):
+    type = Integer()
+    inherit_cache = True
+
+@compiles(dia_semana)
+def _dia_semana_mysql(elemento, compilador, **kw):
+    return "WEEKDAY(%s)" % compilador.process(elemento.clauses, **kw)
+
+@compiles(dia_semana, "sqlite")
+def _dia_semana_sqlite(elemento, compilador, **kw):
+    return "((CAST(strftime('%%w', %s) AS INTEGER) + 6) %% 7)" % compilador.process(elemento.clauses, **kw)
+
+@compiles(hora)
+def _hora_mysql(elemento, compilador, **kw):
+    return "HOUR(%s)" % compilador.process(elemento.clauses, **kw)
+
+@compiles(hora, "sqlite")
+def _hora_sqlite(elemento, compilador, **kw):
+    return "CAST(strftime('%%H', %s) AS INTEGER)" % compilador.process(elemento.clauses, **kw)
+
+# Mapa de ocupación (día de la semana × hora) de las últimas semanas, agrupado en SQL a partir de tbb_reservaciones.
+# Una sesión es un (clase, día) con reservaciones o con fila en tbd_cupos_sesiones, así cuenta también la historia
+# anterior a los contadores por sesión; su cupo y hora salen de la sesión si existe y si no del horario de la clase
+def get_mapa_ocupacion(db: Session, semanas: int = 8, clase_id: int = None, entrenador_id: int = None):
+    Reservacion = models.reservaciones.Reservacion
+    CupoSesion = models.reservaciones.CupoSesion
+    Clase = models.clases.Clase
+    hasta = date.today()
+    desde = hasta - timedelta(weeks=semanas)
+    
+    # Solo días completos (hasta ayer); búsqueda por rango en los índices de Fecha
+    sesiones = union(
+        select(Reservacion.Clase_ID, Reservacion.Fecha).where(Reservacion.Fecha >= desde, Reservacion.Fecha < hasta),
+        select(CupoSesion.Clase_ID, CupoSesion.Fecha).where(CupoSesion.Fecha >= desde, CupoSesion.Fecha < hasta)
+    ).subquery()
+    asistidas = select(
+        Reservacion.Clase_ID, Reservacion.Fecha, func.count().label("Asistencias")
+    ).where(
+        Reservacion.Estatus == "Asistida",
+        Reservacion.Fecha >= desde,
+        Reservacion.Fecha < hasta
+    ).group_by(Reservacion.Clase_ID, Reservacion.Fecha).subquery()
+    
+    dia = dia_semana(sesiones.c.Fecha)
+    hora_sesion = func.coalesce(hora(CupoSesion.Inicio), hora(Clase.Hora_Inicio))
+    query = select(
+        dia,
+        hora_sesion,
+        func.coalesce(func.sum(asistidas.c.Asistencias), 0),
+        func.coalesce(func.sum(func.coalesce(CupoSesion.Cupo, Clase.Cupo)), 0),
+        func.count()
+    ).select_from(sesiones).join(
+        Clase, sesiones.c.Clase_ID == Clase.ID
+    ).outerjoin(
+        CupoSesion, and_(CupoSesion.Clase_ID == sesiones.c.Clase_ID, CupoSesion.Fecha == sesiones.c.Fecha)
+    ).outerjoin(
+        asistidas, and_(asistidas.c.Clase_ID == sesiones.c.Clase_ID, asistidas.c.Fecha == sesiones.c.Fecha)
+    ).group_by(dia, hora_sesion)
+    if clase_id is not None:
+        query = query.where(Clase.ID == clase_id)
+    if entrenador_id is not None:
+        query = query.where(Clase.Entrenador_ID == entrenador_id)
+    
+    asistencias = np.zeros((7, 24), dtype=np.int64)
+    cupo = np.zeros((7, 24), dtype=np.int64)
+    conteo = np.zeros((7, 24), dtype=np.int64)
+    # A lo más 7 × 24 filas
+    for d, h, total_asistencias, total_cupo, total_sesiones in db.execute(query):
+        asistencias[d, h] = total_asistencias
+        cupo[d, h] = total_cupo
+        conteo[d, h] = total_sesiones
+    ocupacion = np.divide(asistencias * 100.0, cupo, out=np.zeros((7, 24)), where=cupo > 0)
+    
+    return {
+        "desde": desde,
+        "hasta": hasta - timedelta(days=1),
+        "clase_id": clase_id,
+        "entrenador_id": entrenador_id,
+        "dias": list(crud.clases.DIAS_SEMANA),
+        "horas": list(range(24)),
+        "ocupacion": np.round(ocupacion, 2).tolist(),
+        "asistencias": asistencias.tolist(),
+        "sesiones": conteo.tolist()
+    }
+
+# Mapa de ocupación en caché: se calcula una vez al día y, si cambiaron las asistencias de días pasados, se vuelve
+# a calcular completo con la consulta agrupada (no se ajusta celda por celda)
+def get_mapa_ocupacion_cached(db: Session, semanas: int = 8, clase_id: int = None, entrenador_id: int = None):
+    # La versión se lee antes de consultar, así la caché nunca queda más vieja que su versión
+    version = crud.versiones.get_version(db, VERSION_OCUPACION)
+    clave = (date.today(), semanas, clase_id, entrenador_id)
+    with _lock_ocupacion:
+        cacheado = _cache_ocupacion.get(clave)
+        if cacheado is not None and cacheado[0] == version:
+            _cache_ocupacion.move_to_end(clave)
+            return cacheado[1]
+    
+    cacheado = (version, get_mapa_ocupacion(db, semanas, clase_id, entrenador_id))
+    with _lock_ocupacion:
+        # Los mapas de días anteriores ya no se usan
+        for anterior in [c for c in _cache_ocupacion if c[0] != clave[0]]:
+            del _cache_ocupacion[anterior]
+        _cache_ocupacion[clave] = cacheado
+        _cache_ocupacion.move_to_end(clave)
+        while len(_cache_ocupacion) > LIMITE_CACHE_OCUPACION:
+            _cache_ocupacion.popitem(last=False)
+    return cacheado[1]
+
+# Crear nueva reservación ocupando un lugar de la sesión; devuelve (reservación, lugares disponibles) o (None, 0) si no hay lugar.
+# Un duplicado (mismo usuario, clase y día) lo detecta el índice único: se propaga IntegrityError
 def create_reservacion(db: Session, reservacion: schemas.reservaciones.ReservacionCreate):
+    fecha = reservacion.Fecha_Reservacion.date()
+    if reservacion.Estatus in ESTATUS_OCUPAN_LUGAR and not ocupar_lugar(db, reservacion.Clase_ID, fecha):
+        db.rollback()
+        return None, 0
+    
     db_reservacion = models.reservaciones.Reservacion(
         Usuario_ID=reservacion.Usuario_ID,
         Clase_ID=reservacion.Clase_ID,
         Fecha_Reservacion=reservacion.Fecha_Reservacion,
+        Fecha=fecha,
         Estatus=reservacion.Estatus,
+        Activa=activa_por_estatus(reservacion.Estatus),
         Comentario=reservacion.Comentario,
         Fecha_Registro=datetime.now(),
         Fecha_Actualizacion=datetime.now()
     )
     
     db.add(db_reservacion)
+    try:
+        db.flush()
+    except IntegrityError:
+        # Se deshace también el lugar ocupado
+        db.rollback()
+        raise
+    disponibilidad = get_disponibilidad(db, reservacion.Clase_ID, fecha)
+    crud.calendario.bump_calendarios(db, [reservacion.Usuario_ID])
     db.commit()
+    eventos_disponibilidad.canal.publicar(disponibilidad)
     db.refresh(db_reservacion)
-    return db_reservacion
+    return db_reservacion, disponibilidad["Lugares_Disponibles"]
+
+# Fechas de una reservación recurrente: las indicadas o la misma fecha durante varias semanas
+def fechas_recurrentes(fechas=None, fecha_inicio: date = None, semanas: int = 0):
+    if fechas:
+        return sorted(set(fechas))
+    if fecha_inicio is None:
+        return []
+    return [fecha_inicio + timedelta(weeks=i) for i in range(semanas)]
+
+# Reservar varias sesiones de una clase en una sola transacción; devuelve el resultado por fecha.
+# Un duplicado concurrente (mismo usuario, clase y día) lo detecta el índice único: se propaga IntegrityError
+def create_reservaciones_recurrentes(db: Session, usuario_id: int, clase: models.clases.Clase, fechas, comentario: str = None):
+    Reservacion = models.reservaciones.Reservacion
+    CupoSesion = models.reservaciones.CupoSesion
+    resultados = {fecha: {"Fecha": fecha, "Resultado": None, "Reservacion_ID": None, "Lugares_Disponibles": None} for fecha in fechas}
+    
+    # Validar las fechas contra los días de la clase
+    pendientes = []
+    for fecha in fechas:
+        if crud.clases.fecha_en_horario(clase, fecha):
+            pendientes.append(fecha)
+        else:
+            resultados[fecha]["Resultado"] = "Fuera de horario"
+    
+    # Reservaciones activas que ya tiene el usuario en esas fechas (una sola consulta)
+    if pendientes:
+        existentes = db.query(Reservacion.Fecha, Reservacion.ID).filter(
+            Reservacion.Usuario_ID == usuario_id,
+            Reservacion.Clase_ID == clase.ID,
+            Reservacion.Fecha.in_(pendientes),
+            Reservacion.Activa == True
+        ).all()
+        for fecha, reservacion_id in existentes:
+            resultados[fecha].update(Resultado="Duplicada", Reservacion_ID=reservacion_id)
+        pendientes = [fecha for fecha in pendientes if resultados[fecha]["Resultado"] is None]
+    
+    if pendientes:
+        # Crear de una vez las filas de cupo que falten
+        con_cupo = {fecha for (fecha,) in db.query(CupoSesion.Fecha).filter(
+            CupoSesion.Clase_ID == clase.ID,
+            CupoSesion.Fecha.in_(pendientes)
+        ).all()}
+        faltantes = [fecha for fecha in pendientes if fecha not in con_cupo]
+        if faltantes:
+            try:
+                with db.begin_nested():
+                    db.execute(insert(CupoSesion), [crud.clases.fila_sesion(clase, fecha) for fecha in faltantes])
+            except IntegrityError:
+                # Otra transacción creó alguna de las filas al mismo tiempo
+                for fecha in faltantes:
+                    _asegurar_cupo_sesion(db, clase.ID, fecha)
+        
+        # Bloquear las sesiones (en orden de fecha) y ocupar un lugar en las que tienen cupo con un solo UPDATE
+        sesiones = db.query(CupoSesion.Fecha, CupoSesion.Cupo, CupoSesion.Reservados).filter(
+            CupoSesion.Clase_ID == clase.ID,
+            CupoSesion.Fecha.in_(pendientes)
+        ).order_by(CupoSesion.Fecha).with_for_update().all()
+        confirmadas = []
+        for fecha, cupo, reservados in sesiones:
+            if reservados < cupo:
+                confirmadas.append(fecha)
+                resultados[fecha]["Lugares_Disponibles"] = cupo - reservados - 1
+            else:
+                resultados[fecha].update(Resultado="Llena", Lugares_Disponibles=0)
+        
+        if confirmadas:
+            db.query(CupoSesion).filter(
+                CupoSesion.Clase_ID == clase.ID,
+                CupoSesion.Fecha.in_(confirmadas),
+                CupoSesion.Reservados < CupoSesion.Cupo
+            ).update({
+                CupoSesion.Reservados: CupoSesion.Reservados + 1,
+                CupoSesion.Fecha_Actualizacion: datetime.now()
+            }, synchronize_session=False)
+            
+            # Insertar todas las reservaciones con un solo INSERT de varias filas
+            ahora = datetime.now()
+            try:
+                db.execute(insert(Reservacion), [
+                    {
+                        "Usuario_ID": usuario_id,
+                        "Clase_ID": clase.ID,
+                        "Fecha_Reservacion": datetime.combine(fecha, clase.Hora_Inicio),
+                        "Fecha": fecha,
+                        "Estatus": "Confirmada",
+                        "Activa": True,
+                        "Comentario": comentario,
+                        "Fecha_Registro": ahora,
+                        "Fecha_Actualizacion": ahora
+                    }
+                    for fecha in confirmadas
+                ])
+            except IntegrityError:
+                # Se deshacen también los lugares ocupados
+                db.rollback()
+                raise
+            
+            nuevas = db.query(Reservacion.Fecha, Reservacion.ID).filter(
+                Reservacion.Usuario_ID == usuario_id,
+                Reservacion.Clase_ID == clase.ID,
+                Reservacion.Fecha.in_(confirmadas),
+                Reservacion.Activa == True
+            ).all()
+            for fecha, reservacion_id in nuevas:
+                resultados[fecha].update(Resultado="Confirmada", Reservacion_ID=reservacion_id)
+            crud.calendario.bump_calendarios(db, [usuario_id])
+    
+    db.commit()
+    publicar_disponibilidad(db, [(clase.ID, fecha) for fecha in fechas if resultados[fecha]["Resultado"] == "Confirmada"])
+    return [resultados[fecha] for fecha in fechas]
 
 # Actualizar reservación por ID
 def update_reservacion(db: Session, id: int, reservacion: schemas.reservaciones.ReservacionUpdate):
     db_reservacion = db.query(models.reservaciones.Reservacion).filter(models.reservaciones.Reservacion.ID == id).first()
     if db_reservacion:
+        ocupaba = db_reservacion.Estatus in ESTATUS_OCUPAN_LUGAR
+        asistia = db_reservacion.Estatus == "Asistida"
+        fecha_anterior = db_reservacion.Fecha_Reservacion.date()
+        promovidas = []
+        
         # Actualizar campos si están presentes
         if reservacion.Estatus is not None:
             db_reservacion.Estatus = reservacion.Estatus
@@ -66,11 +480,39 @@ def update_reservacion(db: Session, id: int, reservacion: schemas.reservaciones.
             db_reservacion.Comentario = reservacion.Comentario
         if reservacion.Fecha_Reservacion is not None:
             db_reservacion.Fecha_Reservacion = reservacion.Fecha_Reservacion
+            db_reservacion.Fecha = reservacion.Fecha_Reservacion.date()
+        db_reservacion.Activa = activa_por_estatus(db_reservacion.Estatus)
+        
+        # El índice único valida de inmediato que no quede duplicada (mismo usuario, clase y día)
+        try:
+            db.flush()
+        except IntegrityError:
+            db.rollback()
+            raise
+        
+        # Mover el lugar ocupado si cambió la sesión o el estatus; None si la nueva sesión está llena
+        ocupa = db_reservacion.Estatus in ESTATUS_OCUPAN_LUGAR
+        fecha_nueva = db_reservacion.Fecha_Reservacion.date()
+        if (ocupa, fecha_nueva) != (ocupaba, fecha_anterior):
+            if ocupa and not ocupar_lugar(db, db_reservacion.Clase_ID, fecha_nueva):
+                db.rollback()
+                return None
+            if ocupaba:
+                promovidas.append(liberar_lugar_sesion(db, db_reservacion.Clase_ID, fecha_anterior))
+        
+        # Mover la asistencia en los contadores de ocupación
+        asiste = db_reservacion.Estatus == "Asistida"
+        if (asiste, fecha_nueva) != (asistia, fecha_anterior):
+            ajustar_asistencias(db, db_reservacion.Clase_ID, fecha_anterior, -int(asistia))
+            ajustar_asistencias(db, db_reservacion.Clase_ID, fecha_nueva, int(asiste))
         
         # Actualizar fecha de actualización
         db_reservacion.Fecha_Actualizacion = datetime.now()
+        crud.calendario.bump_calendarios(db, [db_reservacion.Usuario_ID])
         
         db.commit()
+        notificar_promociones(db, promovidas)
+        publicar_disponibilidad(db, [(db_reservacion.Clase_ID, fecha_anterior), (db_reservacion.Clase_ID, fecha_nueva)])
         db.refresh(db_reservacion)
     return db_reservacion
 
@@ -78,9 +520,25 @@ def update_reservacion(db: Session, id: int, reservacion: schemas.reservaciones.
 def cancel_reservacion(db: Session, id: int):
     db_reservacion = db.query(models.reservaciones.Reservacion).filter(models.reservaciones.Reservacion.ID == id).first()
     if db_reservacion:
-        db_reservacion.Estatus = "Cancelada"
-        db_reservacion.Fecha_Actualizacion = datetime.now()
+        # UPDATE condicional: solo la primera cancelación concurrente libera el lugar
+        canceladas = db.query(models.reservaciones.Reservacion).filter(
+            models.reservaciones.Reservacion.ID == id,
+            models.reservaciones.Reservacion.Estatus.in_(ESTATUS_OCUPAN_LUGAR)
+        ).update({
+            models.reservaciones.Reservacion.Estatus: "Cancelada",
+            models.reservaciones.Reservacion.Activa: None,
+            models.reservaciones.Reservacion.Fecha_Actualizacion: datetime.now()
+        }, synchronize_session=False)
+        
+        promovidas = []
+        if canceladas:
+            promovidas.append(liberar_lugar_sesion(db, db_reservacion.Clase_ID, db_reservacion.Fecha_Reservacion.date()))
+            if db_reservacion.Estatus == "Asistida":
+                ajustar_asistencias(db, db_reservacion.Clase_ID, db_reservacion.Fecha_Reservacion.date(), -1)
+            crud.calendario.bump_calendarios(db, [db_reservacion.Usuario_ID])
         db.commit()
+        notificar_promociones(db, promovidas)
+        publicar_disponibilidad(db, [(db_reservacion.Clase_ID, db_reservacion.Fecha_Reservacion.date())])
         db.refresh(db_reservacion)
     return db_reservacion
 
@@ -88,12 +546,332 @@ def cancel_reservacion(db: Session, id: int):
 def mark_attendance(db: Session, id: int, asistio: bool):
     db_reservacion = db.query(models.reservaciones.Reservacion).filter(models.reservaciones.Reservacion.ID == id).first()
     if db_reservacion:
+        ocupaba = db_reservacion.Estatus in ESTATUS_OCUPAN_LUGAR
+        fecha = db_reservacion.Fecha_Reservacion.date()
+        promovidas = []
+        
+        # Una inasistencia libera el lugar; volver a marcar asistencia lo ocupa de nuevo (None si ya no hay)
+        if asistio and not ocupaba and not ocupar_lugar(db, db_reservacion.Clase_ID, fecha):
+            db.rollback()
+            return None
+        if not asistio and ocupaba:
+            promovidas.append(liberar_lugar_sesion(db, db_reservacion.Clase_ID, fecha))
+        ajustar_asistencias(db, db_reservacion.Clase_ID, fecha, int(asistio) - int(db_reservacion.Estatus == "Asistida"))
+        
         db_reservacion.Estatus = "Asistida" if asistio else "No Asistida"
         db_reservacion.Fecha_Actualizacion = datetime.now()
         db.commit()
+        notificar_promociones(db, promovidas)
+        publicar_disponibilidad(db, [(db_reservacion.Clase_ID, fecha)])
         db.refresh(db_reservacion)
     return db_reservacion
 
+# Registrar la asistencia de toda una sesión con UPDATEs por conjunto en una sola transacción; devuelve el resumen
+def registrar_asistencia_sesion(db: Session, clase_id: int, fecha: date, asistieron, no_asistieron):
+    Reservacion = models.reservaciones.Reservacion
+    CupoSesion = models.reservaciones.CupoSesion
+    asistieron, no_asistieron = set(asistieron), set(no_asistieron)
+    
+    # Reservaciones vigentes de los usuarios de la lista (una sola consulta, bloqueadas hasta el commit)
+    filas = db.query(Reservacion.ID, Reservacion.Usuario_ID, Reservacion.Estatus).filter(
+        Reservacion.Clase_ID == clase_id,
+        Reservacion.Fecha == fecha,
+        Reservacion.Activa == True,
+        Reservacion.Usuario_ID.in_(asistieron | no_asistieron)
+    ).with_for_update().all()
+    por_usuario = {usuario_id: (reservacion_id, estatus) for reservacion_id, usuario_id, estatus in filas}
+    sin_reservacion = sorted((asistieron | no_asistieron) - set(por_usuario))
+    sin_lugar = []
+    
+    # Asistencias: quienes tenían inasistencia vuelven a ocupar lugar, todos juntos y solo si alcanza el cupo
+    asistencias = [por_usuario[u][0] for u in asistieron if u in por_usuario and por_usuario[u][1] in ESTATUS_OCUPAN_LUGAR]
+    recuperan = [u for u in asistieron if u in por_usuario and por_usuario[u][1] not in ESTATUS_OCUPAN_LUGAR]
+    if recuperan:
+        _asegurar_cupo_sesion(db, clase_id, fecha)
+        ocupadas = db.query(CupoSesion).filter(
+            CupoSesion.Clase_ID == clase_id,
+            CupoSesion.Fecha == fecha,
+            CupoSesion.Reservados + len(recuperan) <= CupoSesion.Cupo
+        ).update({
+            CupoSesion.Reservados: CupoSesion.Reservados + len(recuperan),
+            CupoSesion.Fecha_Actualizacion: datetime.now()
+        }, synchronize_session=False)
+        if ocupadas:
+            asistencias.extend(por_usuario[u][0] for u in recuperan)
+        else:
+            sin_lugar = sorted(recuperan)
+    
+    # Cambio neto de asistencias: nuevas asistidas menos las que pasan a inasistencia
+    asistencias_antes = {reservacion_id for reservacion_id, estatus in por_usuario.values() if estatus == "Asistida"}
+    
+    if asistencias:
+        db.query(Reservacion).filter(Reservacion.ID.in_(asistencias)).update({
+            Reservacion.Estatus: "Asistida",
+            Reservacion.Fecha_Actualizacion: datetime.now()
+        }, synchronize_session=False)
+    
+    # Inasistencias: los lugares que ocupaban se liberan con un solo UPDATE
+    inasistencias = [por_usuario[u][0] for u in no_asistieron if u in por_usuario]
+    liberan = sum(1 for u in no_asistieron if u in por_usuario and por_usuario[u][1] in ESTATUS_OCUPAN_LUGAR)
+    if inasistencias:
+        db.query(Reservacion).filter(Reservacion.ID.in_(inasistencias)).update({
+            Reservacion.Estatus: "No Asistida",
+            Reservacion.Fecha_Actualizacion: datetime.now()
+        }, synchronize_session=False)
+    if liberan:
+        db.query(CupoSesion).filter(
+            CupoSesion.Clase_ID == clase_id,
+            CupoSesion.Fecha == fecha,
+            CupoSesion.Reservados >= liberan
+        ).update({
+            CupoSesion.Reservados: CupoSesion.Reservados - liberan,
+            CupoSesion.Fecha_Actualizacion: datetime.now()
+        }, synchronize_session=False)
+    
+    ajustar_asistencias(
+        db, clase_id, fecha,
+        len(set(asistencias) - asistencias_antes) - len(set(inasistencias) & asistencias_antes)
+    )
+    
+    # Los lugares liberados de sesiones que aún no empiezan se dan a quienes están en espera
+    promovidas = []
+    if liberan and sesion_por_iniciar(db, clase_id, fecha):
+        db.flush()
+        promovidas = llenar_desde_lista_espera(db, clase_id, fecha)
+    
+    db.commit()
+    notificar_promociones(db, promovidas)
+    publicar_disponibilidad(db, [(clase_id, fecha)])
+    
+    # Resumen de la sesión por estatus
+    conteos = dict(db.query(Reservacion.Estatus, func.count(Reservacion.ID)).filter(
+        Reservacion.Clase_ID == clase_id,
+        Reservacion.Fecha == fecha
+    ).group_by(Reservacion.Estatus).all())
+    return {
+        "Clase_ID": clase_id,
+        "Fecha": fecha,
+        "Asistidas": conteos.get("Asistida", 0),
+        "No_Asistidas": conteos.get("No Asistida", 0),
+        "Pendientes": conteos.get("Confirmada", 0),
+        "Canceladas": conteos.get("Cancelada", 0),
+        "Sin_Reservacion": sin_reservacion,
+        "Sin_Lugar": sin_lugar
+    }
+
+# Marcar como "No Asistida" un lote de reservaciones confirmadas cuya clase ya terminó; devuelve cuántas marcó
+def marcar_lote_inasistencias(db: Session, limite: int = LOTE_INASISTENCIAS):
+    Reservacion = models.reservaciones.Reservacion
+    CupoSesion = models.reservaciones.CupoSesion
+    Clase = models.clases.Clase
+    ahora = datetime.now()
+    hoy = ahora.date()
+    ayer = hoy - timedelta(days=1)
+    
+    # Sin sesión materializada (reservaciones anteriores a tbd_cupos_sesiones) el fin sale de Fecha + Clase.Hora_Fin;
+    # si Hora_Fin no es mayor que Hora_Inicio la clase pasa de medianoche y termina al día siguiente
+    termina_mismo_dia = Clase.Hora_Fin > Clase.Hora_Inicio
+    fin_segun_horario = or_(
+        and_(termina_mismo_dia, or_(Reservacion.Fecha < hoy, and_(Reservacion.Fecha == hoy, Clase.Hora_Fin <= ahora.time()))),
+        and_(~termina_mismo_dia, or_(Reservacion.Fecha < ayer, and_(Reservacion.Fecha == ayer, Clase.Hora_Fin <= ahora.time())))
+    )
+    
+    # El fin de la sesión ya materializado cubre los cambios de horario de esa fecha;
+    # SKIP LOCKED: varios procesos pueden correr la tarea sin tomar las mismas filas
+    lote = db.query(Reservacion.ID, Reservacion.Clase_ID, Reservacion.Fecha).join(
+        Clase, Clase.ID == Reservacion.Clase_ID
+    ).outerjoin(
+        CupoSesion, (CupoSesion.Clase_ID == Reservacion.Clase_ID) & (CupoSesion.Fecha == Reservacion.Fecha)
+    ).filter(
+        Reservacion.Estatus == "Confirmada",
+        Reservacion.Fecha <= hoy,
+        or_(CupoSesion.Fin <= ahora, and_(CupoSesion.Clase_ID.is_(None), fin_segun_horario))
+    ).order_by(Reservacion.ID).limit(limite).with_for_update(skip_locked=True, of=Reservacion).all()
+    if not lote:
+        db.rollback()
+        return 0
+    
+    # El UPDATE repite la condición del estatus, así volver a correr la tarea no cambia nada
+    marcadas = db.query(Reservacion).filter(
+        Reservacion.ID.in_([reservacion_id for reservacion_id, _, _ in lote]),
+        Reservacion.Estatus == "Confirmada"
+    ).update({
+        Reservacion.Estatus: "No Asistida",
+        Reservacion.Fecha_Actualizacion: ahora
+    }, synchronize_session=False)
+    
+    # Los lugares se liberan con un UPDATE por sesión (la sesión ya pasó, no se promueve a nadie)
+    por_sesion = {}
+    for _, clase_id, fecha in lote:
+        por_sesion[(clase_id, fecha)] = por_sesion.get((clase_id, fecha), 0) + 1
+    for (clase_id, fecha), liberan in por_sesion.items():
+        db.query(CupoSesion).filter(
+            CupoSesion.Clase_ID == clase_id,
+            CupoSesion.Fecha == fecha,
+            CupoSesion.Reservados >= liberan
+        ).update({
+            CupoSesion.Reservados: CupoSesion.Reservados - liberan,
+            CupoSesion.Fecha_Actualizacion: ahora
+        }, synchronize_session=False)
+    
+    db.commit()
+    return marcadas
+
+# Tarea periódica: procesar lotes hasta que no queden reservaciones vencidas; devuelve el total marcado
+def marcar_inasistencias_vencidas(db: Session, limite: int = LOTE_INASISTENCIAS):
+    total = 0
+    while True:
+        marcadas = marcar_lote_inasistencias(db, limite)
+        total += marcadas
+        if marcadas < limite:
+            return total
+
+# Agregar a un usuario al final de la lista de espera de una sesión.
+# Si ya está en espera (por ejemplo, un doble envío) lo detecta el índice único: se propaga IntegrityError
+def unirse_lista_espera(db: Session, usuario_id: int, clase_id: int, fecha_reservacion: datetime):
+    db_entrada = models.reservaciones.ListaEspera(
+        Clase_ID=clase_id,
+        Fecha=fecha_reservacion.date(),
+        Usuario_ID=usuario_id,
+        Fecha_Reservacion=fecha_reservacion,
+        Estatus="En Espera",
+        Activa=True,
+        Fecha_Registro=datetime.now(),
+        Fecha_Actualizacion=datetime.now()
+    )
+    
+    db.add(db_entrada)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise
+    db.refresh(db_entrada)
+    return db_entrada
+
+# Buscar una entrada de la lista de espera por ID
+def get_entrada_lista_espera(db: Session, id: int):
+    return db.query(models.reservaciones.ListaEspera).filter(models.reservaciones.ListaEspera.ID == id).first()
+
+# Verificar si un usuario ya está esperando lugar en una sesión
+def check_en_lista_espera(db: Session, usuario_id: int, clase_id: int, fecha: date):
+    return db.query(models.reservaciones.ListaEspera.ID).filter(
+        models.reservaciones.ListaEspera.Clase_ID == clase_id,
+        models.reservaciones.ListaEspera.Fecha == fecha,
+        models.reservaciones.ListaEspera.Estatus == "En Espera",
+        models.reservaciones.ListaEspera.Usuario_ID == usuario_id
+    ).first() is not None
+
+# Posición (1 = siguiente en ser promovido) de una entrada en espera
+def get_posicion_lista_espera(db: Session, entrada: models.reservaciones.ListaEspera):
+    if entrada.Estatus != "En Espera":
+        return None
+    
+    return db.query(func.count(models.reservaciones.ListaEspera.ID)).filter(
+        models.reservaciones.ListaEspera.Clase_ID == entrada.Clase_ID,
+        models.reservaciones.ListaEspera.Fecha == entrada.Fecha,
+        models.reservaciones.ListaEspera.Estatus == "En Espera",
+        models.reservaciones.ListaEspera.ID <= entrada.ID
+    ).scalar()
+
+# Entradas en espera de un usuario
+def get_listas_espera_by_usuario(db: Session, usuario_id: int):
+    return db.query(models.reservaciones.ListaEspera).filter(
+        models.reservaciones.ListaEspera.Usuario_ID == usuario_id,
+        models.reservaciones.ListaEspera.Estatus == "En Espera"
+    ).order_by(models.reservaciones.ListaEspera.Fecha).all()
+
+# Salir de la lista de espera
+def salir_lista_espera(db: Session, id: int):
+    db_entrada = get_entrada_lista_espera(db, id)
+    if db_entrada and db_entrada.Estatus == "En Espera":
+        db_entrada.Estatus = "Cancelada"
+        db_entrada.Activa = None
+        db_entrada.Fecha_Actualizacion = datetime.now()
+        db.commit()
+        db.refresh(db_entrada)
+    return db_entrada
+
+# Dar el lugar liberado al primero en espera; si no hay nadie, liberar el lugar (sin commit)
+def liberar_o_promover(db: Session, clase_id: int, fecha: date):
+    ListaEspera = models.reservaciones.ListaEspera
+    
+    while True:
+        # Búsqueda en el índice de la sesión; SKIP LOCKED evita que dos cancelaciones promuevan a la misma persona
+        siguiente = db.query(ListaEspera).filter(
+            ListaEspera.Clase_ID == clase_id,
+            ListaEspera.Fecha == fecha,
+            ListaEspera.Estatus == "En Espera"
+        ).order_by(ListaEspera.ID).with_for_update(skip_locked=True).first()
+        
+        if siguiente is None:
+            liberar_lugar(db, clase_id, fecha)
+            return None
+        
+        # El lugar pasa directamente a la nueva reservación, así que Reservados no cambia
+        db_reservacion = models.reservaciones.Reservacion(
+            Usuario_ID=siguiente.Usuario_ID,
+            Clase_ID=clase_id,
+            Fecha_Reservacion=siguiente.Fecha_Reservacion,
+            Fecha=fecha,
+            Estatus="Confirmada",
+            Activa=True,
+            Comentario="Asignada desde la lista de espera",
+            Fecha_Registro=datetime.now(),
+            Fecha_Actualizacion=datetime.now()
+        )
+        
+        try:
+            with db.begin_nested():
+                db.add(db_reservacion)
+        except IntegrityError:
+            # El usuario ya consiguió lugar por su cuenta: sale de la lista y se intenta con el siguiente
+            siguiente.Estatus = "Cancelada"
+            siguiente.Activa = None
+            siguiente.Fecha_Actualizacion = datetime.now()
+            db.flush()
+            continue
+        
+        siguiente.Estatus = "Promovida"
+        siguiente.Activa = None
+        siguiente.Reservacion_ID = db_reservacion.ID
+        siguiente.Fecha_Actualizacion = datetime.now()
+        crud.calendario.bump_calendarios(db, [siguiente.Usuario_ID])
+        db.flush()
+        return db_reservacion
+
+# Promover a quienes esperan mientras la sesión tenga lugares libres (sin commit)
+def llenar_desde_lista_espera(db: Session, clase_id: int, fecha: date):
+    promovidas = []
+    while ocupar_lugar(db, clase_id, fecha):
+        # Si no hay nadie en espera, liberar_o_promover devuelve el lugar recién ocupado
+        db_reservacion = liberar_o_promover(db, clase_id, fecha)
+        if db_reservacion is None:
+            break
+        promovidas.append(db_reservacion)
+    return promovidas
+
+# Avisar por correo, en segundo plano y con hilos acotados, a los usuarios promovidos (después del commit)
+def notificar_promociones(db: Session, reservaciones):
+    reservaciones = [reservacion for reservacion in reservaciones if reservacion is not None]
+    if not reservaciones:
+        return
+    
+    avisos = db.query(
+        models.users.User.Correo_Electronico,
+        models.clases.Clase.Nombre,
+        models.reservaciones.Reservacion.Fecha_Reservacion
+    ).join(
+        models.users.User, models.reservaciones.Reservacion.Usuario_ID == models.users.User.ID
+    ).join(
+        models.clases.Clase, models.reservaciones.Reservacion.Clase_ID == models.clases.Clase.ID
+    ).filter(
+        models.reservaciones.Reservacion.ID.in_([reservacion.ID for reservacion in reservaciones])
+    ).all()
+    
+    for correo, nombre_clase, fecha_reservacion in avisos:
+        _correos.submit(gmail_service.send_waitlist_promotion_email, correo, nombre_clase, fecha_reservacion)
+
 # Obtener reservación con detalles completos
 def get_reservacion_with_details(db: Session, id: int):
     # Usar aliases para evitar conflictos
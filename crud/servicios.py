@@ -6,6 +6,28 @@ import models.usersrols
 import schemas.servicios
 from datetime import datetime
 from sqlalchemy import func
+from bisect import bisect_left, bisect_right
+import os
+import time
+import threading
+import rating_stats
+import crud.versiones
+import crud.busqueda
+
+# Versión que invalida el ranking de servicios (aumenta con cada escritura de servicios o evaluaciones)
+VERSION_RANKING = "ranking_servicios"
+# Tamaño del ranking guardado en caché; los límites mayores se consultan directamente
+LIMITE_CACHE_RANKING = 50
+# Caché del ranking en este worker: {"servicios": (version, servicios)}
+_cache_ranking = {}
+
+# Versión que invalida el catálogo ordenado por precio (aumenta con cada escritura de servicios)
+VERSION_CATALOGO = "catalogo_servicios"
+# Cada cuántos segundos se compara la versión del catálogo con la base de datos (escrituras de otros workers)
+CATALOGO_INTERVALO_VERIFICACION = float(os.getenv("CATALOGO_SERVICIOS_VERIFICACION", "5"))
+# Catálogo de servicios ordenado por (Costo, ID) en este worker
+_catalogo_precios = {"version": None, "verificado": 0.0, "indice": ([], [])}
+_lock_catalogo = threading.Lock()
 
 # Buscar por ID
 def get_servicio(db: Session, id: int):
@@ -40,7 +62,12 @@ def create_servicio(db: Session, servicio: schemas.servicios.ServicioCreate, usu
     )
     
     db.add(db_servicio)
+    db.flush()
+    crud.busqueda.indexar_servicio(db, db_servicio)
+    crud.versiones.bump_version(db, VERSION_RANKING)
+    crud.versiones.bump_version(db, VERSION_CATALOGO)
     db.commit()
+    _invalidar_catalogo_local()
     db.refresh(db_servicio)
     return db_servicio
 
@@ -54,8 +81,12 @@ def update_servicio(db: Session, id: int, servicio: schemas.servicios.ServicioUp
         
         # Actualizar fecha de actualización
         db_servicio.Fecha_Actualizacion = datetime.now()
+        crud.busqueda.indexar_servicio(db, db_servicio)
+        crud.versiones.bump_version(db, VERSION_RANKING)
+        crud.versiones.bump_version(db, VERSION_CATALOGO)
         
         db.commit()
+        _invalidar_catalogo_local()
         db.refresh(db_servicio)
     return db_servicio
 
@@ -63,38 +94,39 @@ def update_servicio(db: Session, id: int, servicio: schemas.servicios.ServicioUp
 def delete_servicio(db: Session, id: int):
     db_servicio = db.query(models.servicios.Servicios).filter(models.servicios.Servicios.ID == id).first()
     if db_servicio:
+        # El resumen de evaluaciones puede quedar con totales en cero
+        db.query(models.evaluaciones_serv.ResumenEvaluacionServicio).filter(
+            models.evaluaciones_serv.ResumenEvaluacionServicio.Servicio_ID == id
+        ).delete(synchronize_session=False)
+        crud.busqueda.eliminar_documento(db, crud.busqueda.TIPO_SERVICIO, id)
         db.delete(db_servicio)
+        crud.versiones.bump_version(db, VERSION_RANKING)
+        crud.versiones.bump_version(db, VERSION_CATALOGO)
         db.commit()
+        _invalidar_catalogo_local()
     return db_servicio
 
 # Obtener servicios con información detallada
 def get_servicios_with_details(db: Session, skip: int = 0, limit: int = 10):
-    servicios = db.query(models.servicios.Servicios).offset(skip).limit(limit).all()
+    # Una sola consulta: el creador (Usuario_ID siempre existe en tbd_usuarios_roles) y los totales del resumen
+    results = db.query(
+        models.servicios.Servicios,
+        models.users.User.Nombre_Usuario,
+        models.evaluaciones_serv.ResumenEvaluacionServicio.Total_Evaluaciones,
+        models.evaluaciones_serv.ResumenEvaluacionServicio.Suma_Calificaciones
+    ).outerjoin(
+        models.users.User, models.users.User.ID == models.servicios.Servicios.Usuario_ID
+    ).outerjoin(
+        models.evaluaciones_serv.ResumenEvaluacionServicio,
+        models.evaluaciones_serv.ResumenEvaluacionServicio.Servicio_ID == models.servicios.Servicios.ID
+    ).offset(skip).limit(limit).all()
     
     servicios_con_detalles = []
-    for servicio in servicios:
-        # Obtener usuario/rol creador
-        user_rol = db.query(models.usersrols.UserRol).filter(
-            models.usersrols.UserRol.Usuario_ID == servicio.Usuario_ID
-        ).first()
-        
-        # Obtener usuario
-        user_nombre = "Desconocido"
-        if user_rol:
-            user = db.query(models.users.User).filter(models.users.User.ID == user_rol.Usuario_ID).first()
-            if user:
-                user_nombre = user.Nombre_Usuario
-        
-        # Obtener estadísticas de evaluaciones
-        evaluaciones = db.query(models.evaluaciones_serv.Evaluaciones_serv).filter(
-            models.evaluaciones_serv.Evaluaciones_serv.Servicio_ID == servicio.ID
-        ).all()
-        
-        total_evaluaciones = len(evaluaciones)
+    for servicio, user_nombre, total_evaluaciones, suma_calificaciones in results:
+        total_evaluaciones = total_evaluaciones or 0
         promedio_calificacion = 0.0
         
         if total_evaluaciones > 0:
-            suma_calificaciones = sum(eval.Calificacion for eval in evaluaciones)
             promedio_calificacion = round(suma_calificaciones / total_evaluaciones, 2)
         
         servicios_con_detalles.append({
@@ -106,53 +138,83 @@ def get_servicios_with_details(db: Session, skip: int = 0, limit: int = 10):
             "Estatus": servicio.Estatus,
             "Fecha_Registro": servicio.Fecha_Registro,
             "Fecha_Actualizacion": servicio.Fecha_Actualizacion,
-            "Usuario_Nombre": user_nombre,
+            "Usuario_Nombre": user_nombre or "Desconocido",
             "Total_Evaluaciones": total_evaluaciones,
             "Promedio_Calificacion": promedio_calificacion
         })
     
     return servicios_con_detalles
 
-# Buscar servicios por precio (rango)
-def get_servicios_by_price_range(db: Session, min_price: float = None, max_price: float = None, skip: int = 0, limit: int = 10):
-    query = db.query(models.servicios.Servicios)
+# Forzar la verificación de versión del catálogo en la siguiente búsqueda de este worker
+def _invalidar_catalogo_local():
+    _catalogo_precios["verificado"] = 0.0
+
+# Catálogo ordenado por precio; solo consulta la versión cada CATALOGO_INTERVALO_VERIFICACION segundos
+def _get_catalogo_precios(db: Session):
+    if time.time() - _catalogo_precios["verificado"] < CATALOGO_INTERVALO_VERIFICACION:
+        return _catalogo_precios["indice"]
     
-    if min_price is not None:
-        query = query.filter(models.servicios.Servicios.Costo >= min_price)
+    with _lock_catalogo:
+        if time.time() - _catalogo_precios["verificado"] < CATALOGO_INTERVALO_VERIFICACION:
+            return _catalogo_precios["indice"]
+        
+        # La versión se lee antes de cargar, así el catálogo nunca queda más viejo que su versión
+        version = crud.versiones.get_version(db, VERSION_CATALOGO)
+        if version != _catalogo_precios["version"]:
+            servicios = [
+                schemas.servicios.Servicio.model_validate(servicio)
+                for servicio in db.query(models.servicios.Servicios).order_by(
+                    models.servicios.Servicios.Costo, models.servicios.Servicios.ID
+                ).all()
+            ]
+            # Costos y servicios se reemplazan juntos para que las lecturas concurrentes sean consistentes
+            _catalogo_precios["indice"] = ([servicio.Costo for servicio in servicios], servicios)
+            _catalogo_precios["version"] = version
+        _catalogo_precios["verificado"] = time.time()
     
-    if max_price is not None:
-        query = query.filter(models.servicios.Servicios.Costo <= max_price)
+    return _catalogo_precios["indice"]
+
+# Buscar servicios por precio (rango), ordenados por costo, con búsqueda binaria sobre el catálogo en memoria
+def get_servicios_by_price_range(db: Session, min_price: float = None, max_price: float = None, skip: int = 0, limit: int = 10):
+    costos, servicios = _get_catalogo_precios(db)
     
-    return query.offset(skip).limit(limit).all()
+    inicio = bisect_left(costos, min_price) if min_price is not None else 0
+    fin = bisect_right(costos, max_price) if max_price is not None else len(costos)
+    
+    inicio += max(skip, 0)
+    return servicios[inicio:min(fin, inicio + max(limit, 0))]
 
-# Buscar servicios mejor evaluados
+# Ranking bayesiano (promedio acercado al previo según el número de votos) desde el resumen de evaluaciones
 def get_top_rated_servicios(db: Session, limit: int = 5):
-    # Obtener todos los servicios
-    servicios = db.query(models.servicios.Servicios).filter(models.servicios.Servicios.Estatus == True).all()
+    Resumen = models.evaluaciones_serv.ResumenEvaluacionServicio
+    total = func.coalesce(Resumen.Total_Activas, 0)
+    suma = func.coalesce(Resumen.Suma_Activas, 0)
+    puntaje = (rating_stats.VOTOS_MINIMOS * rating_stats.PROMEDIO_PREVIO + suma) / (rating_stats.VOTOS_MINIMOS + total)
     
-    # Para cada servicio, calcular su calificación promedio
-    servicios_rating = []
-    for servicio in servicios:
-        evaluaciones = db.query(models.evaluaciones_serv.Evaluaciones_serv).filter(
-            models.evaluaciones_serv.Evaluaciones_serv.Servicio_ID == servicio.ID,
-            models.evaluaciones_serv.Evaluaciones_serv.Estatus == True
-        ).all()
-        
-        total_evaluaciones = len(evaluaciones)
-        promedio = 0.0
-        
-        if total_evaluaciones > 0:
-            suma = sum(eval.Calificacion for eval in evaluaciones)
-            promedio = suma / total_evaluaciones
-        
-        servicios_rating.append({
-            "servicio": servicio,
-            "promedio": promedio,
-            "total_evaluaciones": total_evaluaciones
-        })
+    results = db.query(models.servicios.Servicios).outerjoin(
+        Resumen, Resumen.Servicio_ID == models.servicios.Servicios.ID
+    ).filter(
+        models.servicios.Servicios.Estatus == True
+    ).order_by(
+        puntaje.desc(), total.desc(), models.servicios.Servicios.ID
+    ).limit(limit).all()
+    
+    return results
+
+# Ranking de servicios desde la caché del worker; una sola lectura de la versión cuando está vigente
+def get_top_rated_servicios_cached(db: Session, limit: int = 5):
+    if limit > LIMITE_CACHE_RANKING:
+        return get_top_rated_servicios(db, limit)
     
-    # Ordenar por promedio (descendente) y luego por total de evaluaciones (descendente)
-    servicios_rating.sort(key=lambda x: (x["promedio"], x["total_evaluaciones"]), reverse=True)
+    # La versión se lee antes de consultar, así la caché nunca queda más vieja que su versión
+    version = crud.versiones.get_version(db, VERSION_RANKING)
+    cacheado = _cache_ranking.get("servicios")
+    if cacheado is None or cacheado[0] != version:
+        servicios = [
+            schemas.servicios.Servicio.model_validate(servicio)
+            for servicio in get_top_rated_servicios(db, LIMITE_CACHE_RANKING)
+        ]
+        cacheado = (version, servicios)
+        _cache_ranking["servicios"] = cacheado
     
-    # Devolver los top N servicios
-    return [item["servicio"] for item in servicios_rating[:limit]]
\ No newline at end of file
+    return cacheado[1][:max(limit, 0)]
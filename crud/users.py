@@ -1,4 +1,6 @@
 import models.users
+import crud.clases
+import models.persons
 import schemas.users
 import secrets
 import string
@@ -49,6 +51,7 @@ def update_user(db:Session, id:int, user:schemas.users.UserUpdate):
     if db_user:
         for var, value in vars(user).items():
             setattr(db_user, var, value) if value else None
+        crud.clases.bump_clases_entrenador(db, id)
         db.commit()
         db.refresh(db_user)
     return db_user
@@ -57,6 +60,7 @@ def update_user(db:Session, id:int, user:schemas.users.UserUpdate):
 def delete_user(db:Session, id:int):
     db_user = db.query(models.users.User).filter(models.users.User.ID == id).first()
     if db_user:
+        crud.clases.bump_clases_entrenador(db, id)
         db.delete(db_user)
         db.commit()
     return db_user
@@ -129,4 +133,35 @@ def create_user_google(db: Session, user: schemas.users.UserCreate):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
-    return db_user
\ No newline at end of file
+    return db_user
+
+# Obtener en una sola consulta el nombre para mostrar de varios usuarios
+# (nombre completo de su persona o, si no tiene, su nombre de usuario)
+def get_nombres_usuarios(db: Session, usuario_ids):
+    ids = set(usuario_ids)
+    if not ids:
+        return {}
+    
+    results = db.query(
+        models.users.User.ID,
+        models.users.User.Nombre_Usuario,
+        models.persons.Person.Nombre,
+        models.persons.Person.Primer_Apellido,
+        models.persons.Person.Segundo_Apellido
+    ).outerjoin(
+        models.persons.Person, models.persons.Person.Usuario_ID == models.users.User.ID
+    ).filter(
+        models.users.User.ID.in_(ids)
+    ).all()
+    
+    nombres = {}
+    for usuario_id, nombre_usuario, nombre, primer_apellido, segundo_apellido in results:
+        if nombre is not None:
+            nombre_completo = f"{nombre} {primer_apellido}"
+            if segundo_apellido:
+                nombre_completo += f" {segundo_apellido}"
+            nombres[usuario_id] = nombre_completo
+        else:
+            nombres[usuario_id] = nombre_usuario
+    
+    return nombres
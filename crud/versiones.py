@@ -0,0 +1,45 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+import models.versiones
+from datetime import datetime
+
+# Obtener la versión actual de un conjunto de datos (lectura por llave primaria)
+def get_version(db: Session, nombre: str):
+    version = db.query(models.versiones.VersionDatos.Version).filter(
+        models.versiones.VersionDatos.Nombre == nombre
+    ).scalar()
+    return version or 0
+
+# Aumentar la versión de un conjunto de datos dentro de la transacción actual (sin commit)
+def bump_version(db: Session, nombre: str):
+    filtro = models.versiones.VersionDatos.Nombre == nombre
+    valores = {
+        models.versiones.VersionDatos.Version: models.versiones.VersionDatos.Version + 1,
+        models.versiones.VersionDatos.Fecha_Actualizacion: datetime.now()
+    }
+    
+    actualizadas = db.query(models.versiones.VersionDatos).filter(filtro).update(valores, synchronize_session=False)
+    if actualizadas:
+        return
+    
+    try:
+        with db.begin_nested():
+            db.add(models.versiones.VersionDatos(Nombre=nombre, Version=1, Fecha_Actualizacion=datetime.now()))
+    except IntegrityError:
+        # Otra transacción creó el registro al mismo tiempo
+        db.query(models.versiones.VersionDatos).filter(filtro).update(valores, synchronize_session=False)
+
+
+# Reclamar una tarea única entre workers dentro de la transacción actual (sin commit); solo una transacción logra
+# crear el registro, las demás reciben False (en MySQL esperan a que la primera termine)
+def reclamar(db: Session, nombre: str):
+    existe = db.query(models.versiones.VersionDatos.Nombre).filter(models.versiones.VersionDatos.Nombre == nombre).first()
+    if existe:
+        return False
+    
+    try:
+        with db.begin_nested():
+            db.add(models.versiones.VersionDatos(Nombre=nombre, Version=1, Fecha_Actualizacion=datetime.now()))
+    except IntegrityError:
+        return False
+    return True
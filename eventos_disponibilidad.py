@@ -0,0 +1,119 @@
+# eventos_disponibilidad.py
+import os
+import json
+import asyncio
+from datetime import date
+
+# Cada cuántos segundos se manda un comentario para mantener viva la conexión SSE
+KEEPALIVE_SEGUNDOS = int(os.getenv("SSE_KEEPALIVE", "20"))
+# EventSource no manda encabezados: el flujo se abre con un token temporal en la URL, válido solo para esto
+USO_TOKEN_SSE = "disponibilidad_sse"
+DURACION_TOKEN_SSE = int(os.getenv("SSE_TOKEN_SEGUNDOS", "60"))
+
+
+class _Suscriptor:
+    __slots__ = ("clases", "vistas", "evento")
+
+    def __init__(self, clases):
+        self.clases = clases
+        # Última versión enviada de cada clase
+        self.vistas = dict.fromkeys(clases, 0)
+        self.evento = asyncio.Event()
+
+
+class CanalDisponibilidad:
+    """Pub/sub en proceso de los lugares disponibles por sesión.
+
+    Solo se guarda el último valor de cada sesión (clase + fecha) con una versión; un
+    suscriptor en espera ocupa un asyncio.Event y lo que le falta por enviar se calcula
+    comparando versiones, así miles de conexiones inactivas cuestan muy poca memoria.
+    Las publicaciones llegan desde los hilos del pool de FastAPI y se pasan al event loop.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._suscriptores = {}
+        self._ultimos = {}
+        self._versiones = {}
+
+    def hay_suscriptores(self, clase_id: int):
+        return bool(self._suscriptores.get(clase_id))
+
+    def publicar(self, disponibilidad: dict):
+        # Llamado desde cualquier hilo; sin suscriptores no se hace nada
+        if self._loop is None or not self.hay_suscriptores(disponibilidad["Clase_ID"]):
+            return
+        self._loop.call_soon_threadsafe(self._publicar, disponibilidad)
+
+    def _publicar(self, disponibilidad: dict):
+        clase_id = disponibilidad["Clase_ID"]
+        version = self._versiones.get(clase_id, 0) + 1
+        self._versiones[clase_id] = version
+
+        # Las sesiones pasadas ya no interesan
+        sesiones = self._ultimos.setdefault(clase_id, {})
+        for fecha in [fecha for fecha in sesiones if fecha < date.today()]:
+            del sesiones[fecha]
+        sesiones[disponibilidad["Fecha"]] = (version, disponibilidad)
+
+        for suscriptor in self._suscriptores.get(clase_id, ()):
+            suscriptor.evento.set()
+
+    def suscribir(self, clases):
+        self._loop = asyncio.get_running_loop()
+        suscriptor = _Suscriptor(clases)
+        for clase_id in clases:
+            self._suscriptores.setdefault(clase_id, set()).add(suscriptor)
+        # Lo publicado mientras se armaba el estado inicial se envía enseguida
+        suscriptor.evento.set()
+        return suscriptor
+
+    def cancelar(self, suscriptor: _Suscriptor):
+        for clase_id in suscriptor.clases:
+            suscriptores = self._suscriptores.get(clase_id)
+            if suscriptores is not None:
+                suscriptores.discard(suscriptor)
+                if not suscriptores:
+                    del self._suscriptores[clase_id]
+                    self._ultimos.pop(clase_id, None)
+
+    def pendientes(self, suscriptor: _Suscriptor):
+        # Sesiones que cambiaron desde el último envío a este suscriptor
+        cambios = []
+        for clase_id in suscriptor.clases:
+            vista = suscriptor.vistas[clase_id]
+            for version, disponibilidad in self._ultimos.get(clase_id, {}).values():
+                if version > vista:
+                    cambios.append(disponibilidad)
+            suscriptor.vistas[clase_id] = self._versiones.get(clase_id, 0)
+        return cambios
+
+
+canal = CanalDisponibilidad()
+
+
+# Formato de un evento SSE
+def evento_sse(nombre: str, datos):
+    return f"event: {nombre}\ndata: {json.dumps(datos, default=str)}\n\n"
+
+
+# Flujo SSE de un suscriptor: primero el estado actual y después solo los cambios
+async def flujo_disponibilidad(request, clases, estado_inicial):
+    suscriptor = canal.suscribir(clases)
+    try:
+        yield evento_sse("disponibilidad", estado_inicial)
+        while True:
+            try:
+                await asyncio.wait_for(suscriptor.evento.wait(), timeout=KEEPALIVE_SEGUNDOS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": keepalive\n\n"
+                continue
+            suscriptor.evento.clear()
+            cambios = canal.pendientes(suscriptor)
+            if cambios:
+                yield evento_sse("disponibilidad", cambios)
+    finally:
+        canal.cancelar(suscriptor)
+
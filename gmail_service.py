@@ -71,4 +71,42 @@ async def send_verification_email(to_email: str, token: str):
     
     except Exception as e:
         print(f'Error al enviar email: {e}')
-        return {'success': False, 'error': str(e)}
\ No newline at end of file
+        return {'success': False, 'error': str(e)}
+
+def send_waitlist_promotion_email(to_email: str, nombre_clase: str, fecha_reservacion):
+    """Avisa a un usuario que pasó de la lista de espera a tener lugar en una clase"""
+    try:
+        message = MIMEMultipart()
+        message['From'] = EMAIL_FROM
+        message['To'] = to_email
+        message['Subject'] = 'Ya tienes lugar en tu clase - GYM BULLS'
+        
+        html_content = f"""
+        <html>
+          <body>
+            <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #eee; border-radius: 10px;">
+              <h2 style="color: #333; text-align: center;">¡Se liberó un lugar!</h2>
+              <p>Estabas en la lista de espera de <strong>{nombre_clase}</strong> y ya tienes una reservación confirmada para el {fecha_reservacion:%d/%m/%Y a las %H:%M}.</p>
+              <p>Si ya no puedes asistir, cancela tu reservación desde la aplicación para liberar el lugar.</p>
+              <div style="margin-top: 30px; padding-top: 20px; border-top: 1px solid #eee; text-align: center; color: #666; font-size: 12px;">
+                &copy; 2025 GYM BULLS. Todos los derechos reservados.
+              </div>
+            </div>
+          </body>
+        </html>
+        """
+        
+        message.attach(MIMEText(html_content, 'html'))
+        
+        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
+        server.starttls()
+        server.login(EMAIL_FROM, EMAIL_PASSWORD)
+        server.send_message(message)
+        server.quit()
+        
+        print(f"Aviso de lugar disponible enviado a {to_email}")
+        return {'success': True}
+    
+    except Exception as e:
+        print(f'Error al enviar email: {e}')
+        return {'success': False, 'error': str(e)}
@@ -0,0 +1,70 @@
+# intervalos.py
+# Índice de intervalos [inicio, fin) ordenado por inicio. Se arma en O(n log n) cada vez que se usa (no se guarda
+# entre peticiones); después, saber si hay traslape cuesta O(log n) y listar los traslapes O(log n + p), con p el
+# número de intervalos que empiezan antes del fin de la consulta (en el peor caso O(n)).
+# Sirve igual para minutos de la semana (horario de una clase) que para fechas y horas (sesiones).
+from bisect import bisect_left
+from itertools import accumulate
+
+MINUTOS_DIA = 24 * 60
+MINUTOS_SEMANA = 7 * MINUTOS_DIA
+
+
+class IndiceIntervalos:
+    """Intervalos ordenados por inicio con el máximo acumulado de los fines.
+
+    Los intervalos con inicio < fin_consulta son un prefijo de la lista (bisect); hay
+    traslape si el mayor fin de ese prefijo pasa del inicio de la consulta. hay_traslape
+    es O(log n); traslapes recorre ese prefijo, así que es O(log n + p).
+    """
+
+    def __init__(self, intervalos=()):
+        # Cada intervalo es (inicio, fin, clave)
+        self.intervalos = sorted(intervalos, key=lambda intervalo: intervalo[0])
+        self.inicios = [intervalo[0] for intervalo in self.intervalos]
+        self.fines_maximos = list(accumulate((intervalo[1] for intervalo in self.intervalos), max))
+
+    def hay_traslape(self, inicio, fin):
+        limite = bisect_left(self.inicios, fin)
+        return limite > 0 and self.fines_maximos[limite - 1] > inicio
+
+    def traslapes(self, inicio, fin):
+        if not self.hay_traslape(inicio, fin):
+            return []
+        limite = bisect_left(self.inicios, fin)
+        return [intervalo for intervalo in self.intervalos[:limite] if intervalo[1] > inicio]
+
+    def huecos(self, inicio, fin, duracion_minima=None):
+        # Intervalos libres dentro de [inicio, fin), de al menos duracion_minima
+        libres = []
+        cursor = inicio
+        for ocupado_inicio, ocupado_fin, _ in self.intervalos:
+            if ocupado_fin <= cursor:
+                continue
+            if ocupado_inicio >= fin:
+                break
+            if ocupado_inicio > cursor:
+                libres.append((cursor, ocupado_inicio))
+            cursor = max(cursor, ocupado_fin)
+        if cursor < fin:
+            libres.append((cursor, fin))
+        if duracion_minima is not None:
+            libres = [(a, b) for a, b in libres if b - a >= duracion_minima]
+        return libres
+
+
+# Intervalos semanales en minutos (0 = lunes 00:00) de una clase que se imparte ciertos días de la semana;
+# una clase que termina después de medianoche se parte, y la del domingo sigue en el lunes
+def intervalos_semanales(dias, hora_inicio, hora_fin, clave=None):
+    inicio = hora_inicio.hour * 60 + hora_inicio.minute
+    fin = hora_fin.hour * 60 + hora_fin.minute
+    if fin <= inicio:
+        fin += MINUTOS_DIA
+    intervalos = []
+    for dia in dias:
+        a, b = dia * MINUTOS_DIA + inicio, dia * MINUTOS_DIA + fin
+        if b > MINUTOS_SEMANA:
+            intervalos.append((0, b - MINUTOS_SEMANA, clave))
+            b = MINUTOS_SEMANA
+        intervalos.append((a, b, clave))
+    return intervalos
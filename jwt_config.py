@@ -1,4 +1,5 @@
 from jwt import encode, decode
+from datetime import datetime, timedelta, timezone
 
 def solicita_token(dato: dict, roles: list = None) -> dict:
     # Si roles es None, inicializar como lista vacía
@@ -29,5 +30,24 @@ def valida_token(token: str) -> dict:
     dato: dict = decode(token, key='mi_clave', algorithms=['HS256'])
     return dato
 
+# Token de corta duración para un solo propósito (por ejemplo, abrir un flujo SSE desde el navegador,
+# que no puede mandar el encabezado Authorization); decode rechaza el token cuando pasa su "exp".
+# El uso va en "aud": valida_token no pide audiencia, así que rechaza estos tokens y no sirven como token de sesión
+def solicita_token_temporal(usuario_id: int, uso: str, segundos: int = 60) -> str:
+    payload = {
+        "ID": usuario_id,
+        "uso": uso,
+        "aud": uso,
+        "exp": datetime.now(tz=timezone.utc) + timedelta(seconds=segundos)
+    }
+    return encode(payload=payload, key='mi_clave', algorithm='HS256')
+
+# Validar un token temporal; solo se acepta para el uso con el que se emitió
+def valida_token_temporal(token: str, uso: str) -> dict:
+    if isinstance(token, str):
+        token = token.encode('utf-8')
+
+    return decode(token, key='mi_clave', algorithms=['HS256'], audience=uso)
+
 # Alias para compatibilidad
 decode_token = valida_token
\ No newline at end of file
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, String, Index
+from config.db import Base
+
+class TerminoBusqueda(Base):
+    __tablename__ = 'tbd_indice_busqueda'
+    
+    # Índice invertido: un término normalizado apunta a cada servicio, clase o ejercicio que lo contiene
+    Termino = Column(String(60), primary_key=True)
+    Tipo = Column(String(20), primary_key=True)  # servicio, clase o ejercicio
+    Entidad_ID = Column(Integer, primary_key=True, autoincrement=False)
+    Peso = Column(Integer, nullable=False, default=1)
+    
+    __table_args__ = (
+        Index('ix_indice_busqueda_entidad', 'Entidad_ID', 'Tipo'),
+    )
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from config.db import Base
+from datetime import datetime
+
+class CalendarioUsuario(Base):
+    __tablename__ = 'tbd_calendarios_usuarios'
+    
+    # Token del feed iCalendar de un usuario (revocable) y versión de su horario para invalidar el feed en caché
+    Usuario_ID = Column(Integer, ForeignKey('tbb_usuarios.ID'), primary_key=True)
+    Token = Column(String(64), nullable=True, unique=True)
+    Version = Column(Integer, nullable=False, default=0)
+    Fecha_Registro = Column(DateTime, default=datetime.now)
+    Fecha_Actualizacion = Column(DateTime, nullable=True, onupdate=datetime.now)
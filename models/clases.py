@@ -15,10 +15,25 @@ class Clase(Base):
     Hora_Inicio = Column(Time, nullable=False)
     Hora_Fin = Column(Time, nullable=False)
     Duracion_Minutos = Column(Integer, nullable=False)
+    Cupo = Column(Integer, nullable=False, default=20, server_default="20")  # Lugares por sesión
     Estatus = Column(Boolean, default=True)
     Fecha_Registro = Column(DateTime, default=datetime.now)
     Fecha_Actualizacion = Column(DateTime, nullable=True, onupdate=datetime.now)
     
     # Relaciones
     entrenador = relationship("User", foreign_keys=[Entrenador_ID], back_populates="clases")
-    quejas = relationship("Queja", back_populates="clase", overlaps="reservaciones")
\ No newline at end of file
+    quejas = relationship("Queja", back_populates="clase", overlaps="reservaciones")
+
+class BorradoClase(Base):
+    __tablename__ = 'tbd_borrados_clases'
+    
+    # Progreso de la eliminación en segundo plano de una clase; al estar en la base lo ven todos los workers
+    # y el registro mismo impide que dos workers borren la misma clase a la vez
+    Clase_ID = Column(Integer, primary_key=True)
+    Estado = Column(String(20), nullable=False, default="En proceso")  # En proceso, Terminado, Error
+    Reservaciones_Totales = Column(Integer, nullable=False, default=0)
+    Reservaciones_Eliminadas = Column(Integer, nullable=False, default=0)
+    Error = Column(Text, nullable=True)
+    Fecha_Inicio = Column(DateTime, nullable=False, default=datetime.now)
+    Fecha_Fin = Column(DateTime, nullable=True)
+    Fecha_Actualizacion = Column(DateTime, nullable=False, default=datetime.now)  # Cambia con cada lote
@@ -27,4 +27,21 @@ class Evaluaciones_serv(Base):
     
     # Relaciones
     usuario_rol = relationship("UserRol", foreign_keys=[Usuario_ID])
-    servicio = relationship("Servicios", foreign_keys=[Servicio_ID], back_populates="evaluaciones")
\ No newline at end of file
+    servicio = relationship("Servicios", foreign_keys=[Servicio_ID], back_populates="evaluaciones")
+
+class ResumenEvaluacionServicio(Base):
+    __tablename__ = 'tbd_resumen_evaluaciones_servicio'
+    
+    # Totales de calificaciones por servicio, mantenidos por crud.evaluaciones_serv
+    Servicio_ID = Column(Integer, ForeignKey("tbb_servicios.ID"), primary_key=True)
+    Total_Evaluaciones = Column(Integer, nullable=False, default=0)
+    Suma_Calificaciones = Column(Integer, nullable=False, default=0)
+    Estrellas_1 = Column(Integer, nullable=False, default=0)
+    Estrellas_2 = Column(Integer, nullable=False, default=0)
+    Estrellas_3 = Column(Integer, nullable=False, default=0)
+    Estrellas_4 = Column(Integer, nullable=False, default=0)
+    Estrellas_5 = Column(Integer, nullable=False, default=0)
+    # Solo evaluaciones activas (usadas en el ranking de servicios)
+    Total_Activas = Column(Integer, nullable=False, default=0)
+    Suma_Activas = Column(Integer, nullable=False, default=0)
+    Fecha_Actualizacion = Column(DateTime, nullable=True, default=datetime.now, onupdate=datetime.now)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Enum, Index
 from sqlalchemy.dialects.mysql import LONGTEXT
 from sqlalchemy.orm import relationship
 from config.db import Base
@@ -50,4 +50,9 @@ class Membresia(Base):
     Fecha_Actualizacion = Column(DateTime, nullable=True, onupdate=datetime.now)
     
     # Relaciones
-    usuario_rol = relationship("UserRol", foreign_keys=[Usuario_ID])
\ No newline at end of file
+    usuario_rol = relationship("UserRol", foreign_keys=[Usuario_ID])
+    
+    __table_args__ = (
+        # Búsqueda de membresías activas con la fecha de fin ya pasada (tarea de vencimientos)
+        Index('ix_membresias_estatus_fecha_fin', 'Estatus', 'Fecha_Fin'),
+    )
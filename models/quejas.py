@@ -20,4 +20,20 @@ class Queja(Base):
     # Relaciones
     usuario = relationship("User", foreign_keys=[Usuario_ID], overlaps="reservaciones")
     entrenador = relationship("User", foreign_keys=[Entrenador_ID], overlaps="clases")
-    clase = relationship("Clase", foreign_keys=[Clase_ID])
\ No newline at end of file
+    clase = relationship("Clase", foreign_keys=[Clase_ID])
+
+class ResumenCalificacionEntrenador(Base):
+    __tablename__ = 'tbd_resumen_calificaciones_entrenador'
+    
+    # Resumen mensual de calificaciones por entrenador, mantenido por crud.quejas
+    Entrenador_ID = Column(Integer, ForeignKey('tbb_usuarios.ID'), primary_key=True)
+    Anio = Column(SmallInteger, primary_key=True)
+    Mes = Column(SmallInteger, primary_key=True)
+    Total_Quejas = Column(Integer, nullable=False, default=0)
+    Suma_Calificaciones = Column(Integer, nullable=False, default=0)
+    Estrellas_1 = Column(Integer, nullable=False, default=0)
+    Estrellas_2 = Column(Integer, nullable=False, default=0)
+    Estrellas_3 = Column(Integer, nullable=False, default=0)
+    Estrellas_4 = Column(Integer, nullable=False, default=0)
+    Estrellas_5 = Column(Integer, nullable=False, default=0)
+    Fecha_Actualizacion = Column(DateTime, nullable=True, default=datetime.now, onupdate=datetime.now)
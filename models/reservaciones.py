@@ -1,5 +1,5 @@
 # models/reservaciones.py
-from sqlalchemy import Column, Boolean, Integer, String, DateTime, ForeignKey, Text, Time, SmallInteger
+from sqlalchemy import Column, Boolean, Integer, String, DateTime, Date, ForeignKey, Text, Time, SmallInteger, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from config.db import Base
 from datetime import datetime
@@ -11,11 +11,63 @@ class Reservacion(Base):
     Usuario_ID = Column(Integer, ForeignKey('tbb_usuarios.ID'), nullable=False)
     Clase_ID = Column(Integer, ForeignKey('tbb_clases.ID'), nullable=False)
     Fecha_Reservacion = Column(DateTime, nullable=False)  # Fecha específica de la reservación
+    Fecha = Column(Date, nullable=False)  # Día de la sesión (Fecha_Reservacion sin la hora), indexable
     Estatus = Column(String(20), default="Confirmada")  # Confirmada, Cancelada, Asistida, No Asistida
+    Activa = Column(Boolean, nullable=True, default=True)  # True si no está cancelada, NULL si lo está (para el índice único)
     Comentario = Column(Text, nullable=True)
     Fecha_Registro = Column(DateTime, default=datetime.now)
     Fecha_Actualizacion = Column(DateTime, nullable=True, onupdate=datetime.now)
     
     # Relaciones
     usuario = relationship("User", foreign_keys=[Usuario_ID], backref="reservaciones")
-    clase = relationship("Clase", foreign_keys=[Clase_ID], backref="reservaciones")
\ No newline at end of file
+    clase = relationship("Clase", foreign_keys=[Clase_ID], backref="reservaciones")
+    
+    __table_args__ = (
+        # Una sola reservación no cancelada por usuario, clase y día: los NULL de Activa no chocan entre sí
+        UniqueConstraint('Usuario_ID', 'Clase_ID', 'Fecha', 'Activa', name='uq_reservaciones_usuario_clase_fecha'),
+        Index('ix_reservaciones_clase_fecha', 'Clase_ID', 'Fecha'),
+        # Búsqueda de reservaciones confirmadas de sesiones ya pasadas (tarea de inasistencias)
+        Index('ix_reservaciones_estatus_fecha', 'Estatus', 'Fecha'),
+    )
+
+class CupoSesion(Base):
+    __tablename__ = 'tbd_cupos_sesiones'
+    
+    # Sesión concreta de una clase (clase + fecha), generada a partir del horario semanal para los próximos días.
+    # Reservados se actualiza de forma atómica al reservar o cancelar
+    Clase_ID = Column(Integer, ForeignKey('tbb_clases.ID'), primary_key=True)
+    Fecha = Column(Date, primary_key=True)
+    Inicio = Column(DateTime, nullable=False)
+    Fin = Column(DateTime, nullable=False)
+    Cupo = Column(Integer, nullable=False)
+    Reservados = Column(Integer, nullable=False, default=0)
+    Asistencias = Column(Integer, nullable=False, default=0, server_default="0")  # Reservaciones marcadas como asistidas
+    Fecha_Actualizacion = Column(DateTime, nullable=True, default=datetime.now, onupdate=datetime.now)
+    
+    __table_args__ = (
+        # Horario por rango de fechas y horas ("qué hay esta semana")
+        Index('ix_cupos_sesiones_inicio', 'Inicio'),
+    )
+
+
+class ListaEspera(Base):
+    __tablename__ = 'tbd_lista_espera'
+    
+    # Lista de espera FIFO por sesión: el orden es el ID de registro
+    ID = Column(Integer, primary_key=True, autoincrement=True)
+    Clase_ID = Column(Integer, ForeignKey('tbb_clases.ID'), nullable=False)
+    Fecha = Column(Date, nullable=False)  # Fecha de la sesión
+    Usuario_ID = Column(Integer, ForeignKey('tbb_usuarios.ID'), nullable=False)
+    Fecha_Reservacion = Column(DateTime, nullable=False)  # Fecha y hora con que se crea la reservación al promoverla
+    Estatus = Column(String(20), nullable=False, default="En Espera")  # En Espera, Promovida, Cancelada
+    Activa = Column(Boolean, nullable=True, default=True)  # True si está en espera, NULL si ya salió de la lista (para el índice único)
+    Reservacion_ID = Column(Integer, ForeignKey('tbb_reservaciones.ID'), nullable=True)
+    Fecha_Registro = Column(DateTime, default=datetime.now)
+    Fecha_Actualizacion = Column(DateTime, nullable=True, onupdate=datetime.now)
+    
+    __table_args__ = (
+        # El primero en espera de una sesión se obtiene con una sola búsqueda en el índice
+        Index('ix_lista_espera_sesion', 'Clase_ID', 'Fecha', 'Estatus', 'ID'),
+        # Una sola entrada en espera por usuario y sesión: los NULL de Activa no chocan entre sí
+        UniqueConstraint('Usuario_ID', 'Clase_ID', 'Fecha', 'Activa', name='uq_lista_espera_usuario_sesion'),
+    )
@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from config.db import Base
+from datetime import datetime
+
+class VersionDatos(Base):
+    __tablename__ = 'tbc_versiones_datos'
+    
+    # Contador que aumenta con cada escritura sobre un conjunto de datos (para invalidar cachés)
+    Nombre = Column(String(60), primary_key=True)
+    Version = Column(Integer, nullable=False, default=0)
+    Fecha_Actualizacion = Column(DateTime, nullable=True, default=datetime.now, onupdate=datetime.now)
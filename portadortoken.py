@@ -5,6 +5,7 @@ from jwt_config import valida_token
 import crud.users, config.db
 import models.users
 import models.rols
+import models.usersrols
 import jwt
 
 # Ahora que ambos modelos están importados, crea las tablas
@@ -42,6 +43,11 @@ class Portador(HTTPBearer):
                 print("Token no contiene ID")
                 raise HTTPException(status_code=401, detail="Token inválido o mal formado")
             
+            # Los tokens temporales de un solo uso (por ejemplo, el del flujo SSE) no son tokens de sesión
+            if "uso" in dato or "aud" in dato:
+                print("Token temporal usado como token de sesión")
+                raise HTTPException(status_code=401, detail="Token inválido o mal formado")
+            
             # Obtener el usuario por ID
             user_id = dato["ID"]
             db_user = crud.users.get_user(db=db, id=user_id)
@@ -0,0 +1,105 @@
+# rating_stats.py
+# Estadísticas de calificaciones (1 a 5 estrellas) compartidas por quejas y evaluaciones de servicios.
+# Todo se calcula sobre histogramas de 5 posiciones (índice 0 = 1 estrella) con operaciones vectorizadas.
+import numpy as np
+
+ESTRELLAS = np.arange(1, 6)
+
+# Claves de la distribución de calificaciones en las respuestas (de 5 a 1 estrellas)
+CLAVES_DISTRIBUCION = {
+    5: "5_estrellas",
+    4: "4_estrellas",
+    3: "3_estrellas",
+    2: "2_estrellas",
+    1: "1_estrella"
+}
+
+# Calificación promedio a priori y número mínimo de votos del promedio bayesiano
+PROMEDIO_PREVIO = 3.0
+VOTOS_MINIMOS = 5
+
+
+# Histograma a partir de pares (calificación, cantidad) devueltos por un GROUP BY
+def histograma_desde_conteos(conteos):
+    hist = np.zeros(5, dtype=np.int64)
+    for calificacion, cantidad in conteos:
+        if calificacion in CLAVES_DISTRIBUCION:
+            hist[int(calificacion) - 1] += int(cantidad)
+    return hist
+
+
+# Promedios seguros (0 cuando no hay calificaciones) para arreglos de totales y sumas
+def promedios(totales, sumas):
+    totales = np.asarray(totales, dtype=np.float64)
+    sumas = np.asarray(sumas, dtype=np.float64)
+    return np.divide(sumas, totales, out=np.zeros_like(sumas), where=totales > 0)
+
+
+# Promedio bayesiano: acerca al promedio previo los elementos con pocas calificaciones
+def promedios_bayesianos(totales, sumas, promedio_previo: float = PROMEDIO_PREVIO, votos_minimos: int = VOTOS_MINIMOS):
+    totales = np.asarray(totales, dtype=np.float64)
+    sumas = np.asarray(sumas, dtype=np.float64)
+    return (votos_minimos * promedio_previo + sumas) / (votos_minimos + totales)
+
+
+# Percentiles (rango más cercano) de las calificaciones descritas por un histograma
+def percentiles(hist, qs=(25, 50, 75)):
+    hist = np.asarray(hist, dtype=np.int64)
+    total = int(hist.sum())
+    if total == 0:
+        return {f"p{q}": 0 for q in qs}
+    acumulado = np.cumsum(hist)
+    rangos = np.ceil(np.asarray(qs, dtype=np.float64) / 100 * total).clip(min=1)
+    posiciones = np.searchsorted(acumulado, rangos)
+    return {f"p{q}": int(ESTRELLAS[posicion]) for q, posicion in zip(qs, posiciones)}
+
+
+# Distribución en porcentajes (con las claves de la respuesta) de uno o varios histogramas
+def distribuciones(hists):
+    hists = np.atleast_2d(np.asarray(hists, dtype=np.float64))
+    totales = hists.sum(axis=1, keepdims=True)
+    porcentajes = np.divide(hists, totales, out=np.zeros_like(hists), where=totales > 0) * 100
+    return [
+        {clave: round(float(fila[calificacion - 1]), 2) for calificacion, clave in CLAVES_DISTRIBUCION.items()}
+        for fila in porcentajes
+    ]
+
+
+def distribucion(hist):
+    return distribuciones(hist)[0]
+
+
+# Distribución sin datos
+def distribucion_vacia():
+    return {clave: 0 for clave in CLAVES_DISTRIBUCION.values()}
+
+
+# Resumen completo de un histograma: total, suma, promedio, distribución y percentiles
+def resumen(hist):
+    hist = np.asarray(hist, dtype=np.int64)
+    total = int(hist.sum())
+    suma = int(hist @ ESTRELLAS)
+    return {
+        "total": total,
+        "suma": suma,
+        "promedio": round(suma / total, 2) if total else 0,
+        "distribucion": distribucion(hist) if total else distribucion_vacia(),
+        "percentiles": percentiles(hist)
+    }
+
+
+# Tendencia mensual: alinear totales y sumas por (año, mes) con la lista de meses pedida
+def tendencia(meses, por_mes: dict, clave_total: str = "total"):
+    totales = np.array([por_mes.get(mes, (0, 0))[0] for mes in meses], dtype=np.int64)
+    sumas = np.array([por_mes.get(mes, (0, 0))[1] for mes in meses], dtype=np.int64)
+    medias = promedios(totales, sumas)
+    return [
+        {
+            "anio": anio,
+            "mes": mes,
+            "periodo": f"{anio}-{mes:02d}",
+            "promedio_calificacion": round(float(media), 2) if total else 0,
+            clave_total: int(total)
+        }
+        for (anio, mes), total, media in zip(meses, totales, medias)
+    ]
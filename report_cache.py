@@ -0,0 +1,152 @@
+# report_cache.py
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+import config.db
+import crud.versiones
+
+logger = logging.getLogger(__name__)
+
+# Tiempo (en segundos) que un reporte se considera fresco
+TTL_SEGUNDOS = int(os.getenv("REPORT_CACHE_TTL", "300"))
+# Cada cuántos segundos revisa la tarea de fondo los reportes vencidos o marcados
+INTERVALO_REFRESCO_SEGUNDOS = int(os.getenv("REPORT_CACHE_INTERVALO", "30"))
+# Máximo de reportes en memoria por worker; se descarta el consultado hace más tiempo
+LIMITE_REPORTES = int(os.getenv("REPORT_CACHE_MAXIMO", "256"))
+
+
+class _Snapshot:
+    def __init__(self, builder, versiones):
+        self.builder = builder
+        # Nombres en crud.versiones de los datos de los que depende el reporte
+        self.versiones = versiones
+        self.valor = None
+        self.generado = 0.0
+        self.ultimo_acceso = 0.0
+        # Última versión vista en la base de datos y versión del snapshot actual
+        self.version = ()
+        self.version_construida = None
+        # Solo un hilo reconstruye el reporte a la vez (single-flight)
+        self.lock = threading.Lock()
+
+
+class ReportCache:
+    """Caché de snapshots de reportes agregados.
+
+    Cada reporte se construye con un builder que recibe una sesión de base de datos.
+    Un reporte queda sucio cuando sube alguna de sus versiones en crud.versiones,
+    así que una escritura en cualquier worker invalida el snapshot de todos. Los
+    reportes vencidos o sucios se siguen sirviendo mientras se reconstruyen en
+    segundo plano (stale-while-revalidate).
+    """
+
+    def __init__(self, ttl: int = TTL_SEGUNDOS, intervalo: int = INTERVALO_REFRESCO_SEGUNDOS, limite: int = LIMITE_REPORTES):
+        self.ttl = ttl
+        self.intervalo = intervalo
+        self.limite = limite
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+        self._hilo = None
+
+    def get(self, db, clave: str, builder, versiones=None):
+        with self._lock:
+            snapshot = self._snapshots.get(clave)
+            if snapshot is None:
+                snapshot = _Snapshot(builder, tuple(versiones or (clave,)))
+                self._snapshots[clave] = snapshot
+                while len(self._snapshots) > self.limite:
+                    self._snapshots.popitem(last=False)
+            else:
+                self._snapshots.move_to_end(clave)
+
+        # Una lectura por versión (por llave primaria) en la sesión de la petición
+        snapshot.version = self._leer_version(db, snapshot)
+        snapshot.ultimo_acceso = time.time()
+
+        if snapshot.valor is None:
+            # Primera construcción: los demás hilos esperan el mismo resultado
+            with snapshot.lock:
+                if snapshot.valor is None:
+                    self._construir(snapshot)
+        elif self._vencido(snapshot):
+            self._refrescar_en_segundo_plano(snapshot)
+
+        return snapshot.valor, snapshot.generado
+
+    def iniciar(self):
+        # Arrancar la tarea de fondo que refresca los reportes vencidos
+        with self._lock:
+            if self._hilo is not None:
+                return
+            self._hilo = threading.Thread(target=self._ciclo, name="report-cache", daemon=True)
+            self._hilo.start()
+
+    def _leer_version(self, db, snapshot: _Snapshot):
+        return tuple(crud.versiones.get_version(db, nombre) for nombre in snapshot.versiones)
+
+    def _vencido(self, snapshot: _Snapshot):
+        # Las versiones solo suben; una versión vista mayor que la construida significa que hubo escrituras
+        sucio = snapshot.version_construida is None or any(
+            vista > construida for vista, construida in zip(snapshot.version, snapshot.version_construida)
+        )
+        return sucio or time.time() - snapshot.generado > self.ttl
+
+    def _construir(self, snapshot: _Snapshot):
+        db = config.db.SessionLocal()
+        try:
+            # La versión se lee antes de construir, así el snapshot nunca queda más viejo que su versión
+            version = self._leer_version(db, snapshot)
+            valor = snapshot.builder(db)
+        finally:
+            db.close()
+        snapshot.valor = valor
+        snapshot.generado = time.time()
+        snapshot.version_construida = version
+
+    def _refrescar(self, snapshot: _Snapshot):
+        # Si otro hilo ya lo está reconstruyendo no se hace nada
+        if not snapshot.lock.acquire(blocking=False):
+            return
+        try:
+            if self._vencido(snapshot):
+                self._construir(snapshot)
+        except Exception:
+            logger.exception("Error al refrescar un reporte en caché")
+        finally:
+            snapshot.lock.release()
+
+    def _refrescar_en_segundo_plano(self, snapshot: _Snapshot):
+        if snapshot.lock.locked():
+            return
+        threading.Thread(target=self._refrescar, args=(snapshot,), daemon=True).start()
+
+    def _ciclo(self):
+        while True:
+            time.sleep(self.intervalo)
+            with self._lock:
+                snapshots = list(self._snapshots.values())
+            for snapshot in snapshots:
+                # Solo se refrescan los reportes consultados desde su última construcción
+                if snapshot.valor is not None and snapshot.ultimo_acceso > snapshot.generado and self._vencido(snapshot):
+                    self._refrescar(snapshot)
+
+
+cache = ReportCache()
+
+
+# Obtener un reporte de la caché junto con su antigüedad; versiones son los nombres en crud.versiones de los que depende (por omisión, la clave)
+def get_reporte(db, clave: str, builder, versiones=None):
+    valor, generado = cache.get(db, clave, builder, versiones)
+    return {
+        **valor,
+        "generado_en": datetime.fromtimestamp(generado).isoformat(),
+        "antiguedad_segundos": round(time.time() - generado, 1)
+    }
+
+
+# Marcar un reporte como desactualizado en la transacción de la escritura (sin commit); lo ven todos los workers
+def marcar_sucio(db, clave: str):
+    crud.versiones.bump_version(db, clave)
@@ -0,0 +1,56 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+from config.db import get_db, engine
+from portadortoken import Portador
+import crud.busqueda
+import models.busqueda
+import models.users
+
+busqueda_router = APIRouter()
+
+# Crear las tablas si no existen
+models.busqueda.Base.metadata.create_all(bind=engine)
+
+# Ruta para buscar servicios, clases y ejercicios por nombre y descripción
+@busqueda_router.get('/buscar/', tags=['Busqueda'], dependencies=[Depends(Portador())])
+def buscar(
+    q: str = Query(..., min_length=1, max_length=200),
+    tipo: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    tipos = crud.busqueda.TIPOS
+    if tipo is not None:
+        if tipo not in crud.busqueda.TIPOS:
+            raise HTTPException(status_code=400, detail=f"Tipo inválido. Use uno de: {', '.join(crud.busqueda.TIPOS)}")
+        tipos = (tipo,)
+    
+    return crud.busqueda.buscar(db=db, texto=q, tipos=tipos, skip=skip, limit=limit)
+
+# Ruta para reconstruir el índice de búsqueda (solo admin)
+@busqueda_router.post('/admin/busqueda/reconstruir/', tags=['Busqueda'], dependencies=[Depends(Portador())])
+def rebuild_indice_busqueda(db: Session = Depends(get_db), token_data = Depends(Portador())):
+    # Obtener el ID del usuario del token
+    user_id = token_data.get("user_id") or token_data.get("ID")
+    
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Token inválido o expirado")
+    
+    # Verificar que el usuario tenga rol de administrador
+    user = db.query(models.users.User).filter(models.users.User.ID == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    
+    is_admin = False
+    for rol in user.roles:
+        if rol.Nombre == "admin":
+            is_admin = True
+            break
+    
+    if not is_admin:
+        raise HTTPException(status_code=403, detail="Solo los administradores pueden acceder a este recurso")
+    
+    documentos = crud.busqueda.rebuild_indice_busqueda(db=db)
+    return {"message": "Índice de búsqueda reconstruido", "documentos_indexados": documentos}
@@ -0,0 +1,64 @@
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from sqlalchemy.orm import Session
+from config.db import get_db, engine
+from portadortoken import Portador
+import crud.calendario
+import models.calendario
+
+calendario_router = APIRouter()
+
+# Crear la tabla si no existe
+models.calendario.Base.metadata.create_all(bind=engine)
+
+# Ruta para crear (o cambiar) el token de los feeds de calendario del usuario actual
+@calendario_router.post('/mi-calendario/token', tags=['Calendario'], dependencies=[Depends(Portador())])
+def rotar_token_calendario(request: Request, db: Session = Depends(get_db), token_data = Depends(Portador())):
+    # Obtener el ID del usuario del token
+    user_id = token_data.get("user_id") or token_data.get("ID")
+    
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Token inválido o expirado")
+    
+    token = crud.calendario.rotar_token(db=db, usuario_id=user_id)
+    return {
+        "token": token,
+        "url_reservaciones": str(request.url_for("feed_reservaciones", token=token)),
+        "url_clases": str(request.url_for("feed_clases", token=token))
+    }
+
+# Ruta para revocar el token de los feeds de calendario del usuario actual
+@calendario_router.delete('/mi-calendario/token', tags=['Calendario'], dependencies=[Depends(Portador())])
+def revocar_token_calendario(db: Session = Depends(get_db), token_data = Depends(Portador())):
+    # Obtener el ID del usuario del token
+    user_id = token_data.get("user_id") or token_data.get("ID")
+    
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Token inválido o expirado")
+    
+    if not crud.calendario.revocar_token(db=db, usuario_id=user_id):
+        raise HTTPException(status_code=404, detail="No tienes un feed de calendario activo")
+    return {"message": "Token de calendario revocado"}
+
+# Responder un feed: 304 si el cliente ya tiene la versión actual, si no el cuerpo (de la caché cuando no cambió)
+def responder_feed(request: Request, db: Session, token: str, tipo: str):
+    calendario = crud.calendario.get_calendario_by_token(db=db, token=token)
+    if calendario is None:
+        raise HTTPException(status_code=404, detail="Calendario no encontrado")
+    
+    encabezados = {"Cache-Control": "private, max-age=300"}
+    etag = crud.calendario.etag_feed(calendario, tipo)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={**encabezados, "ETag": etag})
+    
+    etag, cuerpo = crud.calendario.get_feed(db=db, calendario=calendario, tipo=tipo)
+    return Response(content=cuerpo, media_type="text/calendar; charset=utf-8", headers={**encabezados, "ETag": etag})
+
+# Feed iCalendar con las reservaciones del usuario (autenticado por el token del feed)
+@calendario_router.get('/calendario/{token}/reservaciones.ics', name="feed_reservaciones", tags=['Calendario'])
+def feed_reservaciones(token: str, request: Request, db: Session = Depends(get_db)):
+    return responder_feed(request, db, token, crud.calendario.TIPO_RESERVACIONES)
+
+# Feed iCalendar con las sesiones de las clases que imparte el entrenador
+@calendario_router.get('/calendario/{token}/clases.ics', name="feed_clases", tags=['Calendario'])
+def feed_clases(token: str, request: Request, db: Session = Depends(get_db)):
+    return responder_feed(request, db, token, crud.calendario.TIPO_CLASES)
@@ -1,7 +1,9 @@
 # routes/clases.py
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import JSONResponse, Response
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from config.db import get_db, engine
 from portadortoken import Portador
 from jwt_config import decode_token
@@ -9,7 +11,7 @@ import crud.clases
 import schemas.clases
 import models.users
 import models.clases
-from datetime import datetime
+from datetime import datetime, date, timedelta
 
 clase_router = APIRouter()
 
@@ -41,7 +43,8 @@ def read_clases(skip: int = 0, limit: int = 10, db: Session = Depends(get_db), t
     if not is_admin:
         raise HTTPException(status_code=403, detail="Solo los administradores pueden ver todas las clases")
     
-    return crud.clases.get_clases(db=db, skip=skip, limit=limit)
+    # El horario cambia pocas veces por semana: se sirve ya serializado desde la caché
+    return Response(content=crud.clases.get_clases_json_cached(db=db, skip=skip, limit=limit), media_type="application/json")
 
 # Ruta para que los entrenadores vean solo sus propias clases
 @clase_router.get('/mis-clases/', response_model=List[schemas.clases.Clase], tags=['Clases'])
@@ -96,6 +99,12 @@ def create_clase(clase: schemas.clases.ClaseCreate, db: Session = Depends(get_db
     if not is_entrenador:
         raise HTTPException(status_code=403, detail="Solo los entrenadores pueden crear clases")
     
+    # Un entrenador no puede tener dos clases activas a la misma hora
+    if clase.Estatus is not False:
+        conflictos = crud.clases.get_conflictos_horario(db, user_id, clase.Dia_Inicio, clase.Dia_Fin, clase.Hora_Inicio, clase.Hora_Fin)
+        if conflictos:
+            raise HTTPException(status_code=409, detail=f"El horario se traslapa con tus clases: {', '.join(c.Nombre for c in conflictos)}")
+    
     # Pasar el ID del entrenador directamente a la función de creación
     return crud.clases.create_clase(db=db, clase=clase, entrenador_id=user_id)
 
@@ -129,6 +138,18 @@ def update_clase(id: int, clase: schemas.clases.ClaseUpdate, db: Session = Depen
     if db_clase.Entrenador_ID != user_id and not is_admin:
         raise HTTPException(status_code=403, detail="Solo puedes actualizar tus propias clases")
     
+    # Verificar traslapes con el horario resultante (campos nuevos o los actuales de la clase)
+    horario = {
+        campo: getattr(clase, campo) if getattr(clase, campo) is not None else getattr(db_clase, campo)
+        for campo in ("Dia_Inicio", "Dia_Fin", "Hora_Inicio", "Hora_Fin", "Estatus")
+    }
+    if horario["Estatus"]:
+        conflictos = crud.clases.get_conflictos_horario(
+            db, db_clase.Entrenador_ID, horario["Dia_Inicio"], horario["Dia_Fin"], horario["Hora_Inicio"], horario["Hora_Fin"], excluir_id=id
+        )
+        if conflictos:
+            raise HTTPException(status_code=409, detail=f"El horario se traslapa con otras clases del entrenador: {', '.join(c.Nombre for c in conflictos)}")
+    
     return crud.clases.update_clase(db=db, id=id, clase=clase)
 
 # Ruta para eliminar una clase (solo el entrenador que la creó o admin)
@@ -161,13 +182,30 @@ def delete_clase(id: int, db: Session = Depends(get_db), token_data = Depends(Po
     if db_clase.Entrenador_ID != user_id and not is_admin:
         raise HTTPException(status_code=403, detail="Solo puedes eliminar tus propias clases")
     
+    # Si ya se está eliminando en segundo plano (en cualquier worker) solo se informa el progreso
+    progreso = crud.clases.get_progreso_borrado(db=db, id=id)
+    if progreso and progreso["estado"] == "En proceso":
+        return JSONResponse(status_code=202, content=jsonable_encoder(progreso))
+    
+    # Las clases con muchas reservaciones se desactivan de inmediato y se eliminan en segundo plano
+    if crud.clases.contar_reservaciones_clase(db=db, id=id) > crud.clases.UMBRAL_BORRADO_CLASES:
+        progreso = crud.clases.iniciar_borrado_clase(db=db, id=id)
+        return JSONResponse(status_code=202, content=jsonable_encoder(progreso))
+    
     return crud.clases.delete_clase(db=db, id=id)
 
+# Ruta para consultar el progreso de la eliminación en segundo plano de una clase
+@clase_router.get('/clases/{id}/eliminacion', tags=['Clases'], dependencies=[Depends(Portador())])
+def read_progreso_eliminacion(id: int, db: Session = Depends(get_db)):
+    progreso = crud.clases.get_progreso_borrado(db=db, id=id)
+    if progreso is None:
+        raise HTTPException(status_code=404, detail="No hay una eliminación en segundo plano para esta clase")
+    return progreso
+
 #Para visualizar todas las clases que exsiten
 @clase_router.get('/clases/with-details/', tags=['Clases'], dependencies=[Depends(Portador())])
 def read_clases_with_details(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    db_clases = crud.clases.get_clases_with_entrenador(db=db, skip=skip, limit=limit)
-    return db_clases
+    return Response(content=crud.clases.get_clases_with_entrenador_json_cached(db=db, skip=skip, limit=limit), media_type="application/json")
 
 # Ruta para obtener una clase por ID con detalles del entrenador
 @clase_router.get('/clases/{id}/with-details/', tags=['Clases'], dependencies=[Depends(Portador())])
@@ -215,6 +253,50 @@ def read_clases(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
     db_clases = crud.clases.get_clases(db=db, skip=skip, limit=limit)
     return db_clases
 
+# Ruta para consultar el horario de sesiones (por defecto, los próximos 7 días)
+@clase_router.get('/sesiones/', response_model=List[schemas.clases.SesionClase], tags=['Clases'], dependencies=[Depends(Portador())])
+def read_sesiones(
+    desde: Optional[date] = Query(None, description="Primer día del horario (por defecto hoy)"),
+    hasta: Optional[date] = Query(None, description="Último día del horario (por defecto 7 días después)"),
+    clase_id: Optional[int] = None,
+    entrenador_id: Optional[int] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    db: Session = Depends(get_db)
+):
+    desde = desde or date.today()
+    hasta = hasta or desde + timedelta(days=6)
+    if hasta < desde:
+        raise HTTPException(status_code=400, detail="La fecha final no puede ser anterior a la inicial")
+    
+    return crud.clases.get_sesiones(
+        db=db,
+        desde=datetime.combine(desde, datetime.min.time()),
+        hasta=datetime.combine(hasta + timedelta(days=1), datetime.min.time()),
+        clase_id=clase_id,
+        entrenador_id=entrenador_id,
+        skip=skip,
+        limit=limit
+    )
+
+# Ruta para consultar los huecos libres de un entrenador en un rango de fechas
+@clase_router.get('/entrenadores/{entrenador_id}/horarios-libres/', response_model=List[schemas.clases.HorarioLibre], tags=['Clases'], dependencies=[Depends(Portador())])
+def read_horarios_libres(
+    entrenador_id: int,
+    desde: Optional[date] = Query(None, description="Primer día (por defecto hoy)"),
+    hasta: Optional[date] = Query(None, description="Último día (por defecto 7 días después)"),
+    duracion: int = Query(60, ge=15, le=720, description="Duración mínima del hueco en minutos"),
+    db: Session = Depends(get_db)
+):
+    desde = desde or date.today()
+    hasta = hasta or desde + timedelta(days=6)
+    if hasta < desde:
+        raise HTTPException(status_code=400, detail="La fecha final no puede ser anterior a la inicial")
+    if (hasta - desde).days > 31:
+        raise HTTPException(status_code=400, detail="El rango no puede ser mayor a 31 días")
+    
+    return crud.clases.get_horarios_libres(db=db, entrenador_id=entrenador_id, desde=desde, hasta=hasta, duracion_minima=duracion)
+
 # Ruta para obtener una clase por ID
 @clase_router.get('/clases/{id}', response_model=schemas.clases.Clase, tags=['Clases'], dependencies=[Depends(Portador())])
 def read_clase(id: int, db: Session = Depends(get_db)):
@@ -5,6 +5,7 @@ from config.db import get_db, engine
 from portadortoken import Portador
 import crud.evaluaciones_serv
 import crud.servicios
+import report_cache
 import schemas.evaluaciones_serv
 import models.users
 import models.evaluaciones_serv
@@ -185,5 +186,37 @@ def get_estadisticas_servicio(servicio_id: int, db: Session = Depends(get_db)):
     servicio = db.query(models.servicios.Servicios).filter(models.servicios.Servicios.ID == servicio_id).first()
     if not servicio:
         raise HTTPException(status_code=404, detail="Servicio no encontrado")
-        
-    return crud.evaluaciones_serv.get_estadisticas_servicio(db=db, servicio_id=servicio_id)
\ No newline at end of file
+    
+    # Servir el último snapshot de las estadísticas (se refresca en segundo plano)
+    return report_cache.get_reporte(
+        db,
+        crud.evaluaciones_serv.clave_reporte_servicio(servicio_id),
+        lambda db_reporte: crud.evaluaciones_serv.get_estadisticas_servicio(db=db_reporte, servicio_id=servicio_id),
+        crud.evaluaciones_serv.versiones_reporte_servicio(servicio_id)
+    )
+
+# Ruta para reconstruir el resumen de evaluaciones por servicio (solo admin)
+@evaluaciones_router.post('/admin/evaluaciones/resumen/reconstruir/', tags=['Evaluaciones'], dependencies=[Depends(Portador())])
+def rebuild_resumen_evaluaciones(db: Session = Depends(get_db), token_data = Depends(Portador())):
+    # Obtener el ID del usuario del token
+    user_id = token_data.get("user_id") or token_data.get("ID")
+    
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Token inválido o expirado")
+    
+    # Verificar que el usuario tenga rol de administrador
+    user = db.query(models.users.User).filter(models.users.User.ID == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    
+    is_admin = False
+    for rol in user.roles:
+        if rol.Nombre == "admin":
+            is_admin = True
+            break
+    
+    if not is_admin:
+        raise HTTPException(status_code=403, detail="Solo los administradores pueden acceder a este recurso")
+    
+    filas = crud.evaluaciones_serv.rebuild_resumen_servicios(db=db)
+    return {"message": "Resumen de evaluaciones reconstruido", "filas_resumen": filas}
@@ -191,7 +191,13 @@ def delete_membresia(id: int, db: Session = Depends(get_db), token_data = Depend
 
 # Ruta para obtener usuarios con rol "usuario"
 @membresias_router.get('/admin/usuarios-disponibles/', response_model=List[dict], tags=['Membresías Admin'], dependencies=[Depends(Portador())])
-def get_usuarios_disponibles(skip: int = 0, limit: int = 10, db: Session = Depends(get_db), token_data = Depends(Portador())):
+def get_usuarios_disponibles(
+    skip: int = 0, 
+    limit: int = 10, 
+    despues_de: Optional[int] = Query(None, description="ID del último usuario de la página anterior (paginación por llave)"),
+    db: Session = Depends(get_db), 
+    token_data = Depends(Portador())
+):
     # Obtener el ID del usuario del token
     user_id = token_data.get("user_id") or token_data.get("ID")
     
@@ -212,25 +218,8 @@ def get_usuarios_disponibles(skip: int = 0, limit: int = 10, db: Session = Depen
     if not is_admin:
         raise HTTPException(status_code=403, detail="Solo los administradores pueden acceder a esta información")
     
-    usuarios = crud.membresias.get_usuarios_rol_usuario(db=db, skip=skip, limit=limit)
-    
-    # Convertir resultado a formato dict para la respuesta
-    resultado = []
-    for usuario in usuarios:
-        # Verificar si el usuario ya tiene una membresía activa
-        membresia = db.query(models.membresias.Membresia).filter(
-            models.membresias.Membresia.Usuario_ID == usuario.ID,
-            models.membresias.Membresia.Estatus == True
-        ).first()
-        
-        resultado.append({
-            "id": usuario.ID,
-            "nombre_usuario": usuario.Nombre_Usuario,
-            "correo_electronico": usuario.Correo_Electronico,
-            "tiene_membresia_activa": membresia is not None
-        })
-    
-    return resultado
+    # Usuarios y su membresía vigente en una sola consulta
+    return crud.membresias.get_usuarios_rol_usuario(db=db, skip=skip, limit=limit, despues_de=despues_de)
 
 # Ruta para obtener usuarios con una membresía específica
 @membresias_router.get('/admin/usuarios-membresia/', response_model=List[dict], tags=['Membresías Admin'], dependencies=[Depends(Portador())])
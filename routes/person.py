@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from cryptography.fernet import Fernet
 import crud.persons, config.db, schemas.persons, models.persons
 import crud.users
+import crud.clases
 from typing import List
 from portadortoken import Portador
 from datetime import datetime
@@ -251,6 +252,8 @@ def create_user_profile(
     db_person.Estatura = person_data.Estatura
     db_person.Peso = person_data.Peso
     
+    # El nombre del entrenador aparece en el listado de clases
+    crud.clases.bump_clases_entrenador(db, user_id)
     db.commit()
     db.refresh(db_person)
     
@@ -325,6 +328,8 @@ def update_user_profile(
     
     user_profile.Fecha_Actualizacion = datetime.now()
     
+    # El nombre del entrenador aparece en el listado de clases
+    crud.clases.bump_clases_entrenador(db, user_id)
     db.commit()
     db.refresh(user_profile)
     
@@ -434,6 +439,7 @@ def create_person_user_basic_info(
     
     # Guardar cambios
     db.add(new_person)
+    crud.clases.bump_clases_entrenador(db, user_id)
     db.commit()
     db.refresh(new_person)
     db.refresh(db_user)
@@ -527,6 +533,7 @@ def update_person_user_basic_info(
     db_user.Fecha_Actualizacion = datetime.now()
     
     # Guardar cambios
+    crud.clases.bump_clases_entrenador(db, user_id)
     db.commit()
     db.refresh(db_person)
     db.refresh(db_user)
@@ -4,6 +4,10 @@ from typing import List, Optional, Dict
 from config.db import get_db, engine
 from portadortoken import Portador
 import crud.quejas
+import crud.users
+import crud.clases
+import report_cache
+import rating_stats
 import schemas.quejas
 import models.users
 import models.quejas
@@ -176,211 +180,8 @@ def get_estadisticas_quejas_admin(
     if not is_admin:
         raise HTTPException(status_code=403, detail="Solo los administradores pueden acceder a este recurso")
     
-    # Obtener todas las quejas
-    quejas = db.query(models.quejas.Queja).all()
-    
-    # Preparar estadísticas
-    total_quejas = len(quejas)
-    
-    if total_quejas == 0:
-        return {
-            "total_quejas": 0,
-            "promedio_calificacion": 0,
-            "distribucion_calificaciones": {
-                "5_estrellas": 0,
-                "4_estrellas": 0,
-                "3_estrellas": 0,
-                "2_estrellas": 0,
-                "1_estrella": 0
-            },
-            "top_entrenadores": [],
-            "tendencia_calificaciones": []
-        }
-    
-    # Calcular promedio de calificaciones
-    suma_calificaciones = sum(queja.Calificacion for queja in quejas)
-    promedio_calificacion = round(suma_calificaciones / total_quejas, 2)
-    
-    # Calcular distribución de calificaciones
-    distribucion = {
-        "5_estrellas": 0,
-        "4_estrellas": 0,
-        "3_estrellas": 0,
-        "2_estrellas": 0,
-        "1_estrella": 0
-    }
-    
-    for queja in quejas:
-        if queja.Calificacion == 5:
-            distribucion["5_estrellas"] += 1
-        elif queja.Calificacion == 4:
-            distribucion["4_estrellas"] += 1
-        elif queja.Calificacion == 3:
-            distribucion["3_estrellas"] += 1
-        elif queja.Calificacion == 2:
-            distribucion["2_estrellas"] += 1
-        elif queja.Calificacion == 1:
-            distribucion["1_estrella"] += 1
-    
-    # Calcular porcentajes
-    for key in distribucion:
-        distribucion[key] = round((distribucion[key] / total_quejas) * 100, 2) if total_quejas > 0 else 0
-    
-    # Obtener top entrenadores por calificación
-    # Agrupar quejas por entrenador
-    entrenadores_data = {}
-    
-    for queja in quejas:
-        if queja.Entrenador_ID not in entrenadores_data:
-            entrenadores_data[queja.Entrenador_ID] = {
-                "entrenador_id": queja.Entrenador_ID,
-                "total_quejas": 0,
-                "suma_calificaciones": 0
-            }
-        
-        entrenadores_data[queja.Entrenador_ID]["total_quejas"] += 1
-        entrenadores_data[queja.Entrenador_ID]["suma_calificaciones"] += queja.Calificacion
-    
-    # Calcular promedio para cada entrenador
-    top_entrenadores = []
-    for entrenador_id, data in entrenadores_data.items():
-        if data["total_quejas"] > 0:
-            promedio = round(data["suma_calificaciones"] / data["total_quejas"], 2)
-            
-            # Obtener información del entrenador
-            entrenador = db.query(models.users.User).filter(models.users.User.ID == entrenador_id).first()
-            entrenador_persona = db.query(models.persons.Person).filter(
-                models.persons.Person.Usuario_ID == entrenador_id
-            ).first()
-            
-            nombre_entrenador = entrenador.Nombre_Usuario if entrenador else "Desconocido"
-            if entrenador_persona:
-                nombre_entrenador = f"{entrenador_persona.Nombre} {entrenador_persona.Primer_Apellido}"
-                if entrenador_persona.Segundo_Apellido:
-                    nombre_entrenador += f" {entrenador_persona.Segundo_Apellido}"
-            
-            top_entrenadores.append({
-                "entrenador_id": entrenador_id,
-                "nombre": nombre_entrenador,
-                "promedio_calificacion": promedio,
-                "total_quejas": data["total_quejas"]
-            })
-    
-    # Ordenar por promedio de calificación (descendente)
-    top_entrenadores.sort(key=lambda x: x["promedio_calificacion"], reverse=True)
-    
-    # Tomar los 5 mejores
-    top_entrenadores = top_entrenadores[:5]
-    
-    # Calcular tendencia de calificaciones por mes (últimos 6 meses)
-    tendencia_calificaciones = []
-    
-    if quejas:
-        # Obtener la fecha más reciente
-        fecha_mas_reciente = max(queja.Fecha_Registro for queja in quejas)
-        
-        # Generar los últimos 6 meses desde la fecha más reciente
-        meses = []
-        for i in range(6):
-            mes = fecha_mas_reciente.month - i
-            anio = fecha_mas_reciente.year
-            if mes <= 0:
-                mes += 12
-                anio -= 1
-            meses.append((anio, mes))
-        
-        # Invertir para que esté en orden cronológico
-        meses.reverse()
-        
-        # Calcular promedio por mes
-        for anio, mes in meses:
-            quejas_mes = [
-                queja for queja in quejas 
-                if queja.Fecha_Registro.year == anio and queja.Fecha_Registro.month == mes
-            ]
-            
-            if quejas_mes:
-                promedio_mes = round(sum(queja.Calificacion for queja in quejas_mes) / len(quejas_mes), 2)
-            else:
-                promedio_mes = 0
-            
-            tendencia_calificaciones.append({
-                "anio": anio,
-                "mes": mes,
-                "periodo": f"{anio}-{mes:02d}",
-                "promedio_calificacion": promedio_mes,
-                "total_quejas": len(quejas_mes)
-            })
-    
-    # Preparar estadísticas por entrenador
-    estadisticas_por_entrenador = []
-    for entrenador_id, data in entrenadores_data.items():
-        if data["total_quejas"] > 0:
-            # Obtener información del entrenador
-            entrenador = db.query(models.users.User).filter(models.users.User.ID == entrenador_id).first()
-            
-            if not entrenador:
-                continue
-                
-            entrenador_persona = db.query(models.persons.Person).filter(
-                models.persons.Person.Usuario_ID == entrenador_id
-            ).first()
-            
-            # Calcular nombre del entrenador
-            nombre_entrenador = entrenador.Nombre_Usuario
-            if entrenador_persona:
-                nombre_entrenador = f"{entrenador_persona.Nombre} {entrenador_persona.Primer_Apellido}"
-                if entrenador_persona.Segundo_Apellido:
-                    nombre_entrenador += f" {entrenador_persona.Segundo_Apellido}"
-            
-            # Obtener todas las quejas del entrenador
-            quejas_entrenador = [q for q in quejas if q.Entrenador_ID == entrenador_id]
-            
-            # Calcular distribución de calificaciones para este entrenador
-            dist_entrenador = {
-                "5_estrellas": 0,
-                "4_estrellas": 0,
-                "3_estrellas": 0,
-                "2_estrellas": 0,
-                "1_estrella": 0
-            }
-            
-            for queja in quejas_entrenador:
-                if queja.Calificacion == 5:
-                    dist_entrenador["5_estrellas"] += 1
-                elif queja.Calificacion == 4:
-                    dist_entrenador["4_estrellas"] += 1
-                elif queja.Calificacion == 3:
-                    dist_entrenador["3_estrellas"] += 1
-                elif queja.Calificacion == 2:
-                    dist_entrenador["2_estrellas"] += 1
-                elif queja.Calificacion == 1:
-                    dist_entrenador["1_estrella"] += 1
-            
-            # Calcular porcentajes
-            for key in dist_entrenador:
-                dist_entrenador[key] = round((dist_entrenador[key] / len(quejas_entrenador)) * 100, 2) if quejas_entrenador else 0
-            
-            estadisticas_por_entrenador.append({
-                "entrenador_id": entrenador_id,
-                "nombre": nombre_entrenador,
-                "promedio_calificacion": round(data["suma_calificaciones"] / data["total_quejas"], 2),
-                "total_quejas": data["total_quejas"],
-                "distribucion_calificaciones": dist_entrenador
-            })
-    
-    # Ordenar por promedio de calificación (descendente)
-    estadisticas_por_entrenador.sort(key=lambda x: x["promedio_calificacion"], reverse=True)
-    
-    # Preparar respuesta completa
-    return {
-        "total_quejas": total_quejas,
-        "promedio_calificacion": promedio_calificacion,
-        "distribucion_calificaciones": distribucion,
-        "top_entrenadores": top_entrenadores,
-        "tendencia_calificaciones": tendencia_calificaciones,
-        "estadisticas_por_entrenador": estadisticas_por_entrenador
-    }
+    # Servir el último snapshot del reporte (se refresca en segundo plano)
+    return report_cache.get_reporte(db, crud.quejas.CLAVE_REPORTE_ADMIN, crud.quejas.get_reporte_estadisticas_admin)
 
 # Ruta para obtener información detallada de un entrenador específico
 @feedback_router.get('/admin/entrenador/{entrenador_id}/estadisticas/', tags=['Feedback Admin'], dependencies=[Depends(Portador())])
@@ -426,11 +227,11 @@ def get_estadisticas_entrenador(
         if entrenador_persona.Segundo_Apellido:
             nombre_entrenador += f" {entrenador_persona.Segundo_Apellido}"
     
-    # Obtener todas las quejas del entrenador
-    quejas = db.query(models.quejas.Queja).filter(models.quejas.Queja.Entrenador_ID == entrenador_id).all()
+    # Obtener las estadísticas del entrenador desde el resumen de calificaciones
+    estadisticas = crud.quejas.get_estadisticas_entrenador(db=db, entrenador_id=entrenador_id)
     
     # Preparar estadísticas
-    total_quejas = len(quejas)
+    total_quejas = estadisticas["total_quejas"]
     
     if total_quejas == 0:
         return {
@@ -438,114 +239,32 @@ def get_estadisticas_entrenador(
             "nombre": nombre_entrenador,
             "total_quejas": 0,
             "promedio_calificacion": 0,
-            "distribucion_calificaciones": {
-                "5_estrellas": 0,
-                "4_estrellas": 0,
-                "3_estrellas": 0,
-                "2_estrellas": 0,
-                "1_estrella": 0
-            },
+            "distribucion_calificaciones": rating_stats.distribucion_vacia(),
             "tendencia_calificaciones": [],
             "ultimas_quejas": []
         }
     
-    # Calcular promedio de calificaciones
-    suma_calificaciones = sum(queja.Calificacion for queja in quejas)
-    promedio_calificacion = round(suma_calificaciones / total_quejas, 2)
-    
-    # Calcular distribución de calificaciones
-    distribucion = {
-        "5_estrellas": 0,
-        "4_estrellas": 0,
-        "3_estrellas": 0,
-        "2_estrellas": 0,
-        "1_estrella": 0
-    }
+    # Calcular promedio, distribución y percentiles de calificaciones
+    resumen = rating_stats.resumen(estadisticas["histograma"])
     
-    for queja in quejas:
-        if queja.Calificacion == 5:
-            distribucion["5_estrellas"] += 1
-        elif queja.Calificacion == 4:
-            distribucion["4_estrellas"] += 1
-        elif queja.Calificacion == 3:
-            distribucion["3_estrellas"] += 1
-        elif queja.Calificacion == 2:
-            distribucion["2_estrellas"] += 1
-        elif queja.Calificacion == 1:
-            distribucion["1_estrella"] += 1
-    
-    # Calcular porcentajes
-    for key in distribucion:
-        distribucion[key] = round((distribucion[key] / total_quejas) * 100, 2)
-    
-    # Calcular tendencia de calificaciones por mes (últimos 6 meses)
-    tendencia_calificaciones = []
-    
-    if quejas:
-        # Obtener la fecha más reciente
-        fecha_mas_reciente = max(queja.Fecha_Registro for queja in quejas)
-        
-        # Generar los últimos 6 meses desde la fecha más reciente
-        meses = []
-        for i in range(6):
-            mes = fecha_mas_reciente.month - i
-            anio = fecha_mas_reciente.year
-            if mes <= 0:
-                mes += 12
-                anio -= 1
-            meses.append((anio, mes))
-        
-        # Invertir para que esté en orden cronológico
-        meses.reverse()
-        
-        # Calcular promedio por mes
-        for anio, mes in meses:
-            quejas_mes = [
-                queja for queja in quejas 
-                if queja.Fecha_Registro.year == anio and queja.Fecha_Registro.month == mes
-            ]
-            
-            if quejas_mes:
-                promedio_mes = round(sum(queja.Calificacion for queja in quejas_mes) / len(quejas_mes), 2)
-            else:
-                promedio_mes = 0
-            
-            tendencia_calificaciones.append({
-                "anio": anio,
-                "mes": mes,
-                "periodo": f"{anio}-{mes:02d}",
-                "promedio_calificacion": promedio_mes,
-                "total_quejas": len(quejas_mes)
-            })
+    tendencia_calificaciones = estadisticas["tendencia_calificaciones"]
     
     # Obtener las últimas 10 quejas con detalles
     ultimas_quejas = []
+    quejas_ordenadas = crud.quejas.get_ultimas_quejas_entrenador(db=db, entrenador_id=entrenador_id, limit=10)
     
-    # Ordenar quejas por fecha (más recientes primero)
-    quejas_ordenadas = sorted(quejas, key=lambda q: q.Fecha_Registro, reverse=True)[:10]
+    # Cargar usuarios y clases relacionados con una consulta por entidad
+    nombres_usuarios = crud.users.get_nombres_usuarios(db=db, usuario_ids=[queja.Usuario_ID for queja in quejas_ordenadas])
+    nombres_clases = crud.clases.get_nombres_clases(db=db, clase_ids=[queja.Clase_ID for queja in quejas_ordenadas])
     
     for queja in quejas_ordenadas:
-        # Obtener información del usuario que hizo la queja
-        usuario = db.query(models.users.User).filter(models.users.User.ID == queja.Usuario_ID).first()
-        persona = db.query(models.persons.Person).filter(models.persons.Person.Usuario_ID == queja.Usuario_ID).first()
-        
-        # Obtener información de la clase
-        clase = db.query(models.clases.Clase).filter(models.clases.Clase.ID == queja.Clase_ID).first()
-        
-        # Construir nombre del usuario
-        nombre_usuario = usuario.Nombre_Usuario if usuario else "Desconocido"
-        if persona:
-            nombre_usuario = f"{persona.Nombre} {persona.Primer_Apellido}"
-            if persona.Segundo_Apellido:
-                nombre_usuario += f" {persona.Segundo_Apellido}"
-        
         ultimas_quejas.append({
             "id": queja.ID,
             "calificacion": queja.Calificacion,
             "comentario": queja.Comentario,
             "fecha": queja.Fecha_Registro.isoformat(),
-            "usuario_nombre": nombre_usuario,
-            "clase_nombre": clase.Nombre if clase else "Desconocida"
+            "usuario_nombre": nombres_usuarios.get(queja.Usuario_ID, "Desconocido"),
+            "clase_nombre": nombres_clases.get(queja.Clase_ID, "Desconocida")
         })
     
     # Preparar respuesta completa
@@ -553,13 +272,40 @@ def get_estadisticas_entrenador(
         "entrenador_id": entrenador_id,
         "nombre": nombre_entrenador,
         "total_quejas": total_quejas,
-        "promedio_calificacion": promedio_calificacion,
-        "distribucion_calificaciones": distribucion,
+        "promedio_calificacion": resumen["promedio"],
+        "distribucion_calificaciones": resumen["distribucion"],
+        "percentiles_calificacion": resumen["percentiles"],
         "tendencia_calificaciones": tendencia_calificaciones,
         "ultimas_quejas": ultimas_quejas
     }
 
 
+# Ruta para reconstruir el resumen de calificaciones por entrenador (solo admin)
+@feedback_router.post('/admin/quejas/resumen/reconstruir/', tags=['Feedback Admin'], dependencies=[Depends(Portador())])
+def rebuild_resumen_quejas(db: Session = Depends(get_db), token_data = Depends(Portador())):
+    # Obtener el ID del usuario del token
+    user_id = token_data.get("user_id") or token_data.get("ID")
+    
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Token inválido o expirado")
+    
+    # Verificar que el usuario tenga rol de administrador
+    user = db.query(models.users.User).filter(models.users.User.ID == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    
+    is_admin = False
+    for rol in user.roles:
+        if rol.Nombre == "admin":
+            is_admin = True
+            break
+    
+    if not is_admin:
+        raise HTTPException(status_code=403, detail="Solo los administradores pueden acceder a este recurso")
+    
+    filas = crud.quejas.rebuild_resumen_entrenadores(db=db)
+    return {"message": "Resumen de calificaciones reconstruido", "filas_resumen": filas}
+
 # Ruta para que un entrenador vea todas sus propias quejas (sin límite)
 @feedback_router.get('/entrenador/mis-quejas/', response_model=List[dict], tags=['Feedback Entrenador'], dependencies=[Depends(Portador())])
 def read_quejas_entrenador(db: Session = Depends(get_db), token_data = Depends(Portador())):
@@ -586,33 +332,19 @@ def read_quejas_entrenador(db: Session = Depends(get_db), token_data = Depends(P
     # Obtener TODAS las quejas del entrenador (sin límite)
     quejas = db.query(models.quejas.Queja).filter(models.quejas.Queja.Entrenador_ID == user_id).all()
     
+    # Cargar usuarios y clases relacionados con una consulta por entidad
+    nombres_usuarios = crud.users.get_nombres_usuarios(db=db, usuario_ids=[queja.Usuario_ID for queja in quejas])
+    nombres_clases = crud.clases.get_nombres_clases(db=db, clase_ids=[queja.Clase_ID for queja in quejas])
+    
     # Preparar la respuesta con detalles adicionales
     resultado = []
     for queja in quejas:
-        # Obtener información del usuario que hizo la queja
-        usuario = db.query(models.users.User).filter(models.users.User.ID == queja.Usuario_ID).first()
-        
-        # Obtener información personal del usuario que hizo la queja
-        persona = db.query(models.persons.Person).filter(models.persons.Person.Usuario_ID == queja.Usuario_ID).first()
-        
-        # Obtener información de la clase
-        clase = queja.clase  # Usando la relación definida en el modelo
-        
-        # Construir nombre del usuario
-        nombre_completo = "Usuario desconocido"
-        if persona:
-            nombre_completo = f"{persona.Nombre} {persona.Primer_Apellido}"
-            if persona.Segundo_Apellido:
-                nombre_completo += f" {persona.Segundo_Apellido}"
-        elif usuario:
-            nombre_completo = usuario.Nombre_Usuario
-            
         resultado.append({
             "id": queja.ID,
             "usuario_id": queja.Usuario_ID,
-            "nombre_usuario": nombre_completo,
+            "nombre_usuario": nombres_usuarios.get(queja.Usuario_ID, "Usuario desconocido"),
             "clase_id": queja.Clase_ID,
-            "clase_nombre": clase.Nombre if clase else "Clase desconocida",
+            "clase_nombre": nombres_clases.get(queja.Clase_ID, "Clase desconocida"),
             "calificacion": queja.Calificacion,
             "comentario": queja.Comentario,
             "fecha": queja.Fecha_Registro.isoformat(),
@@ -1,10 +1,11 @@
 # routes/reservaciones.py
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from config.db import get_db
 from portadortoken import Portador
-from jwt_config import decode_token
+from jwt_config import solicita_token_temporal, valida_token_temporal
 import crud.reservaciones
 import crud.clases
 import schemas.reservaciones
@@ -14,6 +15,9 @@ from config.db import get_db, engine
 import models.reservaciones
 from datetime import datetime, date, timedelta
 from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+import eventos_disponibilidad
+import jwt
 
 reservacion_router = APIRouter()
 
@@ -179,7 +183,7 @@ def read_reservaciones_by_clase(
     
     # Aplicar filtro de fecha si está presente
     if fecha:
-        query = query.filter(func.date(models.reservaciones.Reservacion.Fecha_Reservacion) == fecha)
+        query = query.filter(models.reservaciones.Reservacion.Fecha == fecha)
     
     # Ejecutar consulta
     results = query.offset(skip).limit(limit).all()
@@ -204,7 +208,7 @@ def read_reservaciones_by_clase(
     return reservaciones_con_detalles
 
 # Ruta para crear una nueva reservación
-@reservacion_router.post('/reservaciones/', response_model=schemas.reservaciones.Reservacion, tags=['Reservaciones'], dependencies=[Depends(Portador())])
+@reservacion_router.post('/reservaciones/', response_model=schemas.reservaciones.ReservacionConfirmada, tags=['Reservaciones'], dependencies=[Depends(Portador())])
 def create_reservacion(
     reservacion: schemas.reservaciones.ReservacionCreate, 
     db: Session = Depends(get_db),
@@ -240,17 +244,81 @@ def create_reservacion(
     if not db_clase.Estatus:
         raise HTTPException(status_code=400, detail="La clase no está disponible para reservaciones")
     
-    # Verificar si ya existe una reservación para esta clase en la misma fecha
-    if crud.reservaciones.check_reservacion_exists(
-        db=db, 
-        usuario_id=reservacion.Usuario_ID, 
-        clase_id=reservacion.Clase_ID, 
-        fecha_reservacion=reservacion.Fecha_Reservacion
-    ):
+    # Verificar que la clase se imparta ese día (que exista la sesión en su horario)
+    if not crud.clases.fecha_en_horario(db_clase, reservacion.Fecha_Reservacion.date()):
+        raise HTTPException(status_code=400, detail="La clase no se imparte en la fecha indicada")
+    
+    # Crear la reservación ocupando un lugar de la sesión; el índice único rechaza duplicados del mismo día
+    try:
+        db_reservacion, lugares_disponibles = crud.reservaciones.create_reservacion(db=db, reservacion=reservacion)
+    except IntegrityError:
         raise HTTPException(status_code=400, detail="Ya tienes una reservación para esta clase en la misma fecha")
+    if db_reservacion is None:
+        raise HTTPException(status_code=409, detail="La clase ya no tiene lugares disponibles en esta fecha. Puedes unirte a la lista de espera")
     
-    # Crear la reservación
-    return crud.reservaciones.create_reservacion(db=db, reservacion=reservacion)
+    return {
+        **schemas.reservaciones.Reservacion.model_validate(db_reservacion).model_dump(),
+        "Lugares_Disponibles": lugares_disponibles
+    }
+
+# Ruta para reservar varias sesiones de una clase (p. ej. todos los martes de las próximas 8 semanas)
+@reservacion_router.post('/reservaciones/recurrentes/', response_model=schemas.reservaciones.ReservacionRecurrenteResultado, tags=['Reservaciones'], dependencies=[Depends(Portador())])
+def create_reservaciones_recurrentes(
+    reservacion: schemas.reservaciones.ReservacionRecurrenteCreate, 
+    db: Session = Depends(get_db),
+    token_data = Depends(Portador())
+):
+    # Obtener el ID del usuario del token
+    user_id = token_data.get("user_id") or token_data.get("ID")
+    
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Token inválido o expirado")
+    
+    # Verificar si el usuario está creando reservaciones para sí mismo o si es un administrador
+    if reservacion.Usuario_ID != user_id:
+        user = db.query(models.users.User).filter(models.users.User.ID == user_id).first()
+        if not user:
+            raise HTTPException(status_code=404, detail="Usuario no encontrado")
+        
+        is_admin = False
+        for rol in user.roles:
+            if rol.Nombre == "admin":
+                is_admin = True
+                break
+        
+        if not is_admin:
+            raise HTTPException(status_code=403, detail="Solo puedes crear reservaciones para ti mismo")
+    
+    # Verificar que la clase exista y esté activa
+    db_clase = crud.clases.get_clase(db=db, id=reservacion.Clase_ID)
+    if db_clase is None:
+        raise HTTPException(status_code=404, detail="Clase no encontrada")
+    
+    if not db_clase.Estatus:
+        raise HTTPException(status_code=400, detail="La clase no está disponible para reservaciones")
+    
+    fechas = crud.reservaciones.fechas_recurrentes(reservacion.Fechas, reservacion.Fecha_Inicio, reservacion.Semanas)
+    if not fechas:
+        raise HTTPException(status_code=400, detail="Indica las fechas o la fecha de inicio y el número de semanas")
+    
+    # Todas las fechas se reservan en una sola transacción; el índice único rechaza duplicados concurrentes
+    try:
+        resultados = crud.reservaciones.create_reservaciones_recurrentes(
+            db=db,
+            usuario_id=reservacion.Usuario_ID,
+            clase=db_clase,
+            fechas=fechas,
+            comentario=reservacion.Comentario
+        )
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Alguna de las fechas se reservó al mismo tiempo desde otra solicitud, intenta de nuevo")
+    
+    return {
+        "Usuario_ID": reservacion.Usuario_ID,
+        "Clase_ID": reservacion.Clase_ID,
+        "Confirmadas": sum(1 for resultado in resultados if resultado["Resultado"] == "Confirmada"),
+        "Resultados": resultados
+    }
 
 # Ruta para actualizar una reservación
 @reservacion_router.put('/reservaciones/{id}', response_model=schemas.reservaciones.Reservacion, tags=['Reservaciones'], dependencies=[Depends(Portador())])
@@ -295,7 +363,19 @@ def update_reservacion(
     if reservacion.Estatus in ["Asistida", "No Asistida"] and not (is_admin or is_entrenador):
         raise HTTPException(status_code=403, detail="Solo el entrenador o un administrador puede marcar la asistencia")
     
-    return crud.reservaciones.update_reservacion(db=db, id=id, reservacion=reservacion)
+    # Al cambiar de fecha, la nueva debe estar en el horario de la clase
+    if reservacion.Fecha_Reservacion is not None and db_clase and not crud.clases.fecha_en_horario(db_clase, reservacion.Fecha_Reservacion.date()):
+        raise HTTPException(status_code=400, detail="La clase no se imparte en la fecha indicada")
+    
+    try:
+        db_reservacion = crud.reservaciones.update_reservacion(db=db, id=id, reservacion=reservacion)
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="Ya existe una reservación para esta clase en la misma fecha")
+    
+    if db_reservacion is None:
+        raise HTTPException(status_code=409, detail="La clase ya no tiene lugares disponibles en esta fecha")
+    
+    return db_reservacion
 
 # Ruta para cancelar una reservación
 @reservacion_router.put('/reservaciones/{id}/cancelar', response_model=schemas.reservaciones.Reservacion, tags=['Reservaciones'], dependencies=[Depends(Portador())])
@@ -377,4 +457,293 @@ def mark_attendance(
     if db_reservacion.Estatus == "Cancelada":
         raise HTTPException(status_code=400, detail="No se puede marcar asistencia en una reservación cancelada")
     
-    return crud.reservaciones.mark_attendance(db=db, id=id, asistio=asistio)
\ No newline at end of file
+    db_reservacion = crud.reservaciones.mark_attendance(db=db, id=id, asistio=asistio)
+    if db_reservacion is None:
+        raise HTTPException(status_code=409, detail="El lugar de esta reservación ya fue asignado a otra persona")
+    
+    return db_reservacion
+
+# Ruta para registrar la asistencia de toda una sesión en una sola solicitud
+@reservacion_router.put('/clases/{clase_id}/sesiones/{fecha}/asistencia', response_model=schemas.reservaciones.ResumenAsistenciaSesion, tags=['Reservaciones'], dependencies=[Depends(Portador())])
+def registrar_asistencia_sesion(
+    clase_id: int,
+    fecha: date,
+    lista: schemas.reservaciones.ListaAsistenciaSesion,
+    db: Session = Depends(get_db),
+    token_data = Depends(Portador())
+):
+    # Obtener el ID del usuario del token
+    user_id = token_data.get("user_id") or token_data.get("ID")
+    
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Token inválido o expirado")
+    
+    db_clase = crud.clases.get_clase(db=db, id=clase_id)
+    if db_clase is None:
+        raise HTTPException(status_code=404, detail="Clase no encontrada")
+    
+    # Verificar que sea el entrenador de la clase o un administrador
+    if db_clase.Entrenador_ID != user_id:
+        user = db.query(models.users.User).filter(models.users.User.ID == user_id).first()
+        if not user:
+            raise HTTPException(status_code=404, detail="Usuario no encontrado")
+        
+        is_admin = False
+        for rol in user.roles:
+            if rol.Nombre == "admin":
+                is_admin = True
+                break
+        
+        if not is_admin:
+            raise HTTPException(status_code=403, detail="Solo el entrenador de la clase o un administrador puede marcar la asistencia")
+    
+    if set(lista.Asistieron) & set(lista.No_Asistieron):
+        raise HTTPException(status_code=400, detail="Un usuario no puede aparecer como asistente y como inasistente")
+    
+    return crud.reservaciones.registrar_asistencia_sesion(
+        db=db,
+        clase_id=clase_id,
+        fecha=fecha,
+        asistieron=lista.Asistieron,
+        no_asistieron=lista.No_Asistieron
+    )
+
+# Ruta para el mapa de ocupación por día de la semana y hora (solo admin)
+@reservacion_router.get('/admin/reportes/ocupacion/', response_model=schemas.reservaciones.MapaOcupacion, tags=['Reservaciones'], dependencies=[Depends(Portador())])
+def read_mapa_ocupacion(
+    semanas: int = Query(8, ge=1, le=52, description="Semanas hacia atrás (hasta ayer)"),
+    clase_id: Optional[int] = None,
+    entrenador_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    token_data = Depends(Portador())
+):
+    # Obtener el ID del usuario del token
+    user_id = token_data.get("user_id") or token_data.get("ID")
+    
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Token inválido o expirado")
+    
+    # Verificar que el usuario tenga rol de administrador
+    user = db.query(models.users.User).filter(models.users.User.ID == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    
+    is_admin = False
+    for rol in user.roles:
+        if rol.Nombre == "admin":
+            is_admin = True
+            break
+    
+    if not is_admin:
+        raise HTTPException(status_code=403, detail="Solo los administradores pueden acceder a este recurso")
+    
+    return crud.reservaciones.get_mapa_ocupacion_cached(db=db, semanas=semanas, clase_id=clase_id, entrenador_id=entrenador_id)
+
+# Ruta para obtener el token temporal con el que el navegador abre el flujo SSE de disponibilidad
+@reservacion_router.post('/disponibilidad/eventos/token', tags=['Reservaciones'], dependencies=[Depends(Portador())])
+def create_token_disponibilidad(token_data = Depends(Portador())):
+    # Obtener el ID del usuario del token
+    user_id = token_data.get("user_id") or token_data.get("ID")
+    
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Token inválido o expirado")
+    
+    return {
+        "token": solicita_token_temporal(user_id, eventos_disponibilidad.USO_TOKEN_SSE, eventos_disponibilidad.DURACION_TOKEN_SSE),
+        "expira_en_segundos": eventos_disponibilidad.DURACION_TOKEN_SSE
+    }
+
+# Ruta SSE: lugares disponibles en vivo de las clases indicadas (estado de los próximos 7 días y después solo los cambios).
+# EventSource no puede mandar Authorization, así que se autentica con el token temporal de la ruta anterior en la URL
+@reservacion_router.get('/disponibilidad/eventos/', tags=['Reservaciones'])
+def stream_disponibilidad(
+    request: Request,
+    clase_id: List[int] = Query(..., description="Clases a seguir (se puede repetir)"),
+    token: str = Query(..., description="Token temporal de POST /disponibilidad/eventos/token"),
+    db: Session = Depends(get_db)
+):
+    # Solo se acepta un token temporal emitido para este flujo (nunca el token de sesión en la URL)
+    try:
+        dato = valida_token_temporal(token, eventos_disponibilidad.USO_TOKEN_SSE)
+    except jwt.exceptions.PyJWTError:
+        raise HTTPException(status_code=401, detail="Token inválido o expirado")
+    if not dato.get("ID"):
+        raise HTTPException(status_code=401, detail="Token inválido o expirado")
+    
+    clases = sorted(set(clase_id))
+    if len(clases) > 20:
+        raise HTTPException(status_code=400, detail="Se pueden seguir como máximo 20 clases")
+    
+    # El estado inicial se arma antes de abrir el flujo; después la conexión ya no usa la base de datos
+    hoy = datetime.combine(date.today(), datetime.min.time())
+    estado_inicial = []
+    for id in clases:
+        for sesion in crud.clases.get_sesiones(db=db, desde=hoy, hasta=hoy + timedelta(days=7), clase_id=id):
+            estado_inicial.append({
+                "Clase_ID": sesion["Clase_ID"],
+                "Fecha": sesion["Fecha"],
+                "Cupo": sesion["Cupo"],
+                "Reservados": sesion["Reservados"],
+                "Lugares_Disponibles": sesion["Lugares_Disponibles"]
+            })
+    
+    return StreamingResponse(
+        eventos_disponibilidad.flujo_disponibilidad(request, clases, estado_inicial),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Ruta para consultar los lugares disponibles de una clase en una fecha
+@reservacion_router.get('/clases/{clase_id}/disponibilidad', response_model=schemas.reservaciones.DisponibilidadSesion, tags=['Reservaciones'], dependencies=[Depends(Portador())])
+def read_disponibilidad(
+    clase_id: int,
+    fecha: date = Query(..., description="Fecha de la sesión"),
+    db: Session = Depends(get_db)
+):
+    # Verificar que la clase exista
+    db_clase = crud.clases.get_clase(db=db, id=clase_id)
+    if db_clase is None:
+        raise HTTPException(status_code=404, detail="Clase no encontrada")
+    
+    return crud.reservaciones.get_disponibilidad(db=db, clase_id=clase_id, fecha=fecha)
+
+# Ruta para cambiar el cupo de una sesión específica (solo el entrenador de la clase o admin)
+@reservacion_router.put('/clases/{clase_id}/sesiones/{fecha}/cupo', response_model=schemas.reservaciones.DisponibilidadSesion, tags=['Reservaciones'], dependencies=[Depends(Portador())])
+def update_cupo_sesion(
+    clase_id: int,
+    fecha: date,
+    cupo: schemas.reservaciones.CupoSesionUpdate,
+    db: Session = Depends(get_db),
+    token_data = Depends(Portador())
+):
+    # Obtener el ID del usuario del token
+    user_id = token_data.get("user_id") or token_data.get("ID")
+    
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Token inválido o expirado")
+    
+    # Obtener la clase
+    db_clase = crud.clases.get_clase(db=db, id=clase_id)
+    if db_clase is None:
+        raise HTTPException(status_code=404, detail="Clase no encontrada")
+    
+    # Verificar que sea el entrenador de la clase o un administrador
+    user = db.query(models.users.User).filter(models.users.User.ID == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    
+    is_admin = False
+    for rol in user.roles:
+        if rol.Nombre == "admin":
+            is_admin = True
+            break
+    
+    if db_clase.Entrenador_ID != user_id and not is_admin:
+        raise HTTPException(status_code=403, detail="Solo el entrenador de la clase o un administrador puede cambiar el cupo")
+    
+    disponibilidad = crud.reservaciones.set_cupo_sesion(db=db, clase_id=clase_id, fecha=fecha, cupo=cupo.Cupo)
+    if disponibilidad is None:
+        raise HTTPException(status_code=400, detail="El cupo no puede ser menor que los lugares ya reservados")
+    
+    return disponibilidad
+
+# Ruta para unirse a la lista de espera de una sesión llena
+@reservacion_router.post('/lista-espera/', response_model=schemas.reservaciones.ListaEspera, tags=['Reservaciones'], dependencies=[Depends(Portador())])
+def join_lista_espera(
+    entrada: schemas.reservaciones.ListaEsperaCreate,
+    db: Session = Depends(get_db),
+    token_data = Depends(Portador())
+):
+    # Obtener el ID del usuario del token
+    user_id = token_data.get("user_id") or token_data.get("ID")
+    
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Token inválido o expirado")
+    
+    # Verificar que la clase exista y esté activa
+    db_clase = crud.clases.get_clase(db=db, id=entrada.Clase_ID)
+    if db_clase is None:
+        raise HTTPException(status_code=404, detail="Clase no encontrada")
+    
+    if not db_clase.Estatus:
+        raise HTTPException(status_code=400, detail="La clase no está disponible para reservaciones")
+    
+    fecha = entrada.Fecha_Reservacion.date()
+    if not crud.clases.fecha_en_horario(db_clase, fecha):
+        raise HTTPException(status_code=400, detail="La clase no se imparte en la fecha indicada")
+    
+    # Solo tiene sentido esperar si la sesión está llena y el usuario no tiene ya lugar
+    if crud.reservaciones.get_disponibilidad(db=db, clase_id=entrada.Clase_ID, fecha=fecha)["Lugares_Disponibles"] > 0:
+        raise HTTPException(status_code=400, detail="La clase todavía tiene lugares disponibles, puedes reservar directamente")
+    
+    if crud.reservaciones.check_reservacion_exists(db=db, usuario_id=user_id, clase_id=entrada.Clase_ID, fecha_reservacion=entrada.Fecha_Reservacion):
+        raise HTTPException(status_code=400, detail="Ya tienes una reservación para esta clase en la misma fecha")
+    
+    if crud.reservaciones.check_en_lista_espera(db=db, usuario_id=user_id, clase_id=entrada.Clase_ID, fecha=fecha):
+        raise HTTPException(status_code=400, detail="Ya estás en la lista de espera de esta clase")
+    
+    # El índice único rechaza una segunda entrada en espera (doble envío)
+    try:
+        db_entrada = crud.reservaciones.unirse_lista_espera(
+            db=db,
+            usuario_id=user_id,
+            clase_id=entrada.Clase_ID,
+            fecha_reservacion=entrada.Fecha_Reservacion
+        )
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="Ya estás en la lista de espera de esta clase")
+    
+    return {
+        **schemas.reservaciones.ListaEspera.model_validate(db_entrada).model_dump(),
+        "Posicion": crud.reservaciones.get_posicion_lista_espera(db=db, entrada=db_entrada)
+    }
+
+# Ruta para ver las listas de espera del usuario actual
+@reservacion_router.get('/mis-listas-espera/', response_model=List[schemas.reservaciones.ListaEspera], tags=['Reservaciones'], dependencies=[Depends(Portador())])
+def read_mis_listas_espera(db: Session = Depends(get_db), token_data = Depends(Portador())):
+    # Obtener el ID del usuario del token
+    user_id = token_data.get("user_id") or token_data.get("ID")
+    
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Token inválido o expirado")
+    
+    entradas = crud.reservaciones.get_listas_espera_by_usuario(db=db, usuario_id=user_id)
+    return [
+        {
+            **schemas.reservaciones.ListaEspera.model_validate(entrada).model_dump(),
+            "Posicion": crud.reservaciones.get_posicion_lista_espera(db=db, entrada=entrada)
+        }
+        for entrada in entradas
+    ]
+
+# Ruta para salir de una lista de espera
+@reservacion_router.delete('/lista-espera/{id}', response_model=schemas.reservaciones.ListaEspera, tags=['Reservaciones'], dependencies=[Depends(Portador())])
+def leave_lista_espera(id: int, db: Session = Depends(get_db), token_data = Depends(Portador())):
+    # Obtener el ID del usuario del token
+    user_id = token_data.get("user_id") or token_data.get("ID")
+    
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Token inválido o expirado")
+    
+    db_entrada = crud.reservaciones.get_entrada_lista_espera(db=db, id=id)
+    if db_entrada is None:
+        raise HTTPException(status_code=404, detail="Entrada de lista de espera no encontrada")
+    
+    # Verificar que sea el dueño de la entrada o un administrador
+    user = db.query(models.users.User).filter(models.users.User.ID == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    
+    is_admin = False
+    for rol in user.roles:
+        if rol.Nombre == "admin":
+            is_admin = True
+            break
+    
+    if db_entrada.Usuario_ID != user_id and not is_admin:
+        raise HTTPException(status_code=403, detail="No tienes permiso para modificar esta entrada")
+    
+    if db_entrada.Estatus != "En Espera":
+        raise HTTPException(status_code=400, detail=f"No se puede salir de una entrada con estatus '{db_entrada.Estatus}'")
+    
+    return crud.reservaciones.salir_lista_espera(db=db, id=id)
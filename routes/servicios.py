@@ -186,4 +186,4 @@ def search_servicios(
 # Ruta para obtener los servicios mejor evaluados
 @servicios_router.get('/servicios/top-rated/', response_model=List[schemas.servicios.Servicio], tags=['Servicios'])
 def get_top_rated_servicios(limit: int = 5, db: Session = Depends(get_db)):
-    return crud.servicios.get_top_rated_servicios(db=db, limit=limit)
\ No newline at end of file
+    return crud.servicios.get_top_rated_servicios_cached(db=db, limit=limit)
\ No newline at end of file
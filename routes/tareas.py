@@ -0,0 +1,47 @@
+from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy.orm import Session
+from config.db import get_db
+from portadortoken import Portador
+import models.users
+import tareas
+
+tareas_router = APIRouter()
+
+# Verificar que el usuario del token sea administrador
+def verificar_admin(db: Session, token_data):
+    # Obtener el ID del usuario del token
+    user_id = token_data.get("user_id") or token_data.get("ID")
+    
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Token inválido o expirado")
+    
+    user = db.query(models.users.User).filter(models.users.User.ID == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    
+    is_admin = False
+    for rol in user.roles:
+        if rol.Nombre == "admin":
+            is_admin = True
+            break
+    
+    if not is_admin:
+        raise HTTPException(status_code=403, detail="Solo los administradores pueden acceder a este recurso")
+
+# Ruta para consultar las métricas de las tareas en segundo plano (solo admin)
+@tareas_router.get('/admin/tareas/', tags=['Tareas'], dependencies=[Depends(Portador())])
+def read_tareas(db: Session = Depends(get_db), token_data = Depends(Portador())):
+    verificar_admin(db, token_data)
+    return tareas.get_metricas()
+
+# Ruta para ejecutar una tarea de inmediato (solo admin)
+@tareas_router.post('/admin/tareas/{nombre}/ejecutar/', tags=['Tareas'], dependencies=[Depends(Portador())])
+def ejecutar_tarea(nombre: str, db: Session = Depends(get_db), token_data = Depends(Portador())):
+    verificar_admin(db, token_data)
+    
+    tarea = tareas.get_tarea(nombre)
+    if tarea is None:
+        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+    
+    tarea.ejecutar()
+    return tarea.metricas()
@@ -1,6 +1,6 @@
 from typing import Optional, List
-from pydantic import BaseModel
-from datetime import datetime, time
+from pydantic import BaseModel, Field
+from datetime import datetime, time, date
 
 class ClaseBase(BaseModel):
     Nombre: str
@@ -10,6 +10,7 @@ class ClaseBase(BaseModel):
     Hora_Inicio: time
     Hora_Fin: time
     Duracion_Minutos: int
+    Cupo: int = Field(20, ge=1)  # Lugares por sesión
     Estatus: Optional[bool] = True
 
 class ClaseCreate(ClaseBase):
@@ -23,6 +24,7 @@ class ClaseUpdate(BaseModel):
     Hora_Inicio: Optional[time] = None
     Hora_Fin: Optional[time] = None
     Duracion_Minutos: Optional[int] = None
+    Cupo: Optional[int] = Field(None, ge=1)
     Estatus: Optional[bool] = None
 
 class Clase(ClaseBase):
@@ -37,4 +39,22 @@ class Clase(ClaseBase):
 
 class ClaseWithEntrenador(Clase):
     Entrenador_Nombre: Optional[str] = None
-    Entrenador_Apellido: Optional[str] = None
\ No newline at end of file
+    Entrenador_Apellido: Optional[str] = None
+
+class SesionClase(BaseModel):
+    Clase_ID: int
+    Fecha: date
+    Inicio: datetime
+    Fin: datetime
+    Nombre_Clase: str
+    Entrenador_ID: int
+    Entrenador_Nombre: Optional[str] = None
+    Cupo: int
+    Reservados: int
+    Lugares_Disponibles: int
+
+class HorarioLibre(BaseModel):
+    Fecha: date
+    Inicio: datetime
+    Fin: datetime
+    Minutos: int
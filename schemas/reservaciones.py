@@ -1,7 +1,7 @@
 # schemas/reservaciones.py
 from typing import Optional, List
-from pydantic import BaseModel
-from datetime import datetime
+from pydantic import BaseModel, Field
+from datetime import datetime, date
 
 class ReservacionBase(BaseModel):
     Usuario_ID: int
@@ -27,6 +27,84 @@ class Reservacion(ReservacionBase):
         orm_mode = True
         from_attributes = True
 
+class ReservacionConfirmada(Reservacion):
+    Lugares_Disponibles: int
+
+# Reservación de varias sesiones: fechas explícitas o la misma fecha durante varias semanas
+class ReservacionRecurrenteCreate(BaseModel):
+    Usuario_ID: int
+    Clase_ID: int
+    Fechas: Optional[List[date]] = Field(None, max_length=52)
+    Fecha_Inicio: Optional[date] = None
+    Semanas: int = Field(1, ge=1, le=52)
+    Comentario: Optional[str] = None
+
+class ResultadoReservacionFecha(BaseModel):
+    Fecha: date
+    Resultado: str  # Confirmada, Duplicada, Llena o Fuera de horario
+    Reservacion_ID: Optional[int] = None
+    Lugares_Disponibles: Optional[int] = None
+
+class ReservacionRecurrenteResultado(BaseModel):
+    Usuario_ID: int
+    Clase_ID: int
+    Confirmadas: int
+    Resultados: List[ResultadoReservacionFecha]
+
+class CupoSesionUpdate(BaseModel):
+    Cupo: int = Field(..., ge=1)
+
+# Lista de asistencia de una sesión: IDs de los usuarios que asistieron y de los que no
+class ListaAsistenciaSesion(BaseModel):
+    Asistieron: List[int] = []
+    No_Asistieron: List[int] = []
+
+class ResumenAsistenciaSesion(BaseModel):
+    Clase_ID: int
+    Fecha: date
+    Asistidas: int
+    No_Asistidas: int
+    Pendientes: int
+    Canceladas: int
+    Sin_Reservacion: List[int]  # Usuarios de la lista sin reservación en la sesión
+    Sin_Lugar: List[int]  # Usuarios con inasistencia que no pudieron recuperar su lugar
+
+class DisponibilidadSesion(BaseModel):
+    Clase_ID: int
+    Fecha: date
+    Cupo: int
+    Reservados: int
+    Lugares_Disponibles: int
+
+class MapaOcupacion(BaseModel):
+    desde: date
+    hasta: date
+    clase_id: Optional[int] = None
+    entrenador_id: Optional[int] = None
+    dias: List[str]
+    horas: List[int]
+    ocupacion: List[List[float]]  # Porcentaje de asistencia sobre el cupo, [día][hora]
+    asistencias: List[List[int]]
+    sesiones: List[List[int]]
+
+class ListaEsperaCreate(BaseModel):
+    Clase_ID: int
+    Fecha_Reservacion: datetime
+
+class ListaEspera(BaseModel):
+    ID: int
+    Clase_ID: int
+    Fecha: date
+    Usuario_ID: int
+    Fecha_Reservacion: datetime
+    Estatus: str
+    Reservacion_ID: Optional[int] = None
+    Posicion: Optional[int] = None
+    Fecha_Registro: datetime
+    
+    class Config:
+        from_attributes = True
+
 class ReservacionWithDetails(Reservacion):
     Nombre_Usuario: Optional[str] = None
     Nombre_Clase: Optional[str] = None
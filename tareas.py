@@ -0,0 +1,104 @@
+# tareas.py
+import time
+import logging
+import threading
+from datetime import datetime
+import config.db
+
+logger = logging.getLogger(__name__)
+
+
+class TareaPeriodica:
+    """Tarea de mantenimiento que se ejecuta cada cierto intervalo en un hilo de fondo.
+
+    La función recibe una sesión de base de datos y devuelve cuántas filas procesó;
+    con eso se llevan las métricas de cada ejecución.
+    """
+
+    def __init__(self, nombre: str, funcion, intervalo: int):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.intervalo = intervalo
+        self.ejecuciones = 0
+        self.errores = 0
+        self.filas_totales = 0
+        self.ultimas_filas = 0
+        self.ultima_ejecucion = None
+        self.ultima_duracion = 0.0
+        self.ultimo_error = None
+        # Una sola ejecución a la vez (el ciclo y una ejecución manual no se enciman)
+        self.lock = threading.Lock()
+        self._hilo = None
+
+    def ejecutar(self):
+        with self.lock:
+            inicio = time.time()
+            db = config.db.SessionLocal()
+            try:
+                filas = self.funcion(db) or 0
+                self.ultimas_filas = filas
+                self.filas_totales += filas
+                self.ultimo_error = None
+            except Exception as e:
+                db.rollback()
+                self.errores += 1
+                self.ultimas_filas = 0
+                self.ultimo_error = str(e)
+                logger.exception("Error en la tarea %s", self.nombre)
+            finally:
+                db.close()
+            self.ejecuciones += 1
+            self.ultima_ejecucion = datetime.now()
+            self.ultima_duracion = time.time() - inicio
+            logger.info("Tarea %s: %s filas en %.2f s", self.nombre, self.ultimas_filas, self.ultima_duracion)
+            return self.ultimas_filas
+
+    def iniciar(self):
+        if self._hilo is not None:
+            return
+        self._hilo = threading.Thread(target=self._ciclo, name=f"tarea-{self.nombre}", daemon=True)
+        self._hilo.start()
+
+    def metricas(self):
+        return {
+            "nombre": self.nombre,
+            "intervalo_segundos": self.intervalo,
+            "ejecuciones": self.ejecuciones,
+            "errores": self.errores,
+            "filas_totales": self.filas_totales,
+            "ultimas_filas": self.ultimas_filas,
+            "ultima_ejecucion": self.ultima_ejecucion.isoformat() if self.ultima_ejecucion else None,
+            "ultima_duracion_segundos": round(self.ultima_duracion, 3),
+            "ultimo_error": self.ultimo_error
+        }
+
+    def _ciclo(self):
+        # La primera ejecución es al arrancar; después, una cada intervalo
+        while True:
+            self.ejecutar()
+            time.sleep(self.intervalo)
+
+
+_tareas = {}
+_lock = threading.Lock()
+
+
+# Registrar una tarea periódica y arrancar su hilo (si ya existe no se duplica)
+def programar(nombre: str, funcion, intervalo: int):
+    with _lock:
+        tarea = _tareas.get(nombre)
+        if tarea is None:
+            tarea = TareaPeriodica(nombre, funcion, intervalo)
+            _tareas[nombre] = tarea
+        tarea.iniciar()
+    return tarea
+
+
+# Buscar una tarea registrada por nombre
+def get_tarea(nombre: str):
+    return _tareas.get(nombre)
+
+
+# Métricas de todas las tareas registradas
+def get_metricas():
+    return [tarea.metricas() for tarea in _tareas.values()]
@@ -0,0 +1,99 @@
+# tests/conftest.py
+# Las pruebas corren contra una base SQLite temporal, salvo que TEST_DATABASE_URL indique otra
+# (nunca se usa el DATABASE_URL del .env, para no tocar la base real)
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, time
+
+_directorio = tempfile.mkdtemp(prefix="gimnasio-pruebas-")
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL", f"sqlite:///{os.path.join(_directorio, 'pruebas.db')}")
+os.environ.setdefault("SMTP_PORT", "25")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.dialects.mysql import LONGTEXT
+
+# SQLite no tiene LONGTEXT
+@compiles(LONGTEXT, "sqlite")
+def _longtext_sqlite(tipo, compilador, **kw):
+    return "TEXT"
+
+# Importar la app registra todos los modelos y crea las tablas
+import app  # noqa: E402
+import config.db  # noqa: E402
+import models.users, models.rols, models.usersrols, models.persons, models.clases  # noqa: E402
+
+
+class ContadorConsultas:
+    """Cuenta las sentencias SQL que se ejecutan mientras está activo."""
+
+    def __init__(self):
+        self.total = 0
+
+    def _contar(self, *args, **kwargs):
+        self.total += 1
+
+
+@contextmanager
+def contar_consultas():
+    contador = ContadorConsultas()
+    event.listen(config.db.engine, "before_cursor_execute", contador._contar)
+    try:
+        yield contador
+    finally:
+        event.remove(config.db.engine, "before_cursor_execute", contador._contar)
+
+
+# Base vacía en cada prueba
+@pytest.fixture
+def db():
+    config.db.Base.metadata.drop_all(bind=config.db.engine)
+    config.db.Base.metadata.create_all(bind=config.db.engine)
+    sesion = config.db.SessionLocal()
+    try:
+        yield sesion
+    finally:
+        sesion.close()
+
+
+# Roles admin, entrenador y usuario
+@pytest.fixture
+def roles(db):
+    roles = {nombre: models.rols.Rol(Nombre=nombre) for nombre in ("admin", "entrenador", "usuario")}
+    db.add_all(roles.values())
+    db.commit()
+    return roles
+
+
+# Crear un usuario con un rol y, opcionalmente, sus datos personales
+def crear_usuario(db, nombre: str, rol, con_persona: bool = True):
+    usuario = models.users.User(Nombre_Usuario=nombre, Correo_Electronico=f"{nombre}@gimnasio.test", Contrasena="x")
+    db.add(usuario)
+    db.flush()
+    db.add(models.usersrols.UserRol(Usuario_ID=usuario.ID, Rol_ID=rol.ID))
+    if con_persona:
+        db.add(models.persons.Person(Usuario_ID=usuario.ID, Nombre=f"N{nombre}", Primer_Apellido="Apellido"))
+    db.flush()
+    return usuario
+
+
+# Crear una clase de lunes a domingo sin pasar por crud (no genera sesiones)
+def crear_clase(db, entrenador, nombre: str = "Clase", cupo: int = 20):
+    clase = models.clases.Clase(
+        Entrenador_ID=entrenador.ID,
+        Nombre=nombre,
+        Dia_Inicio="Lunes",
+        Dia_Fin="Domingo",
+        Hora_Inicio=time(8),
+        Hora_Fin=time(9),
+        Duracion_Minutos=60,
+        Cupo=cupo,
+        Fecha_Registro=datetime.now()
+    )
+    db.add(clase)
+    db.flush()
+    return clase
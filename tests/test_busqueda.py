@@ -0,0 +1,18 @@
+# tests/test_busqueda.py
+# El índice de búsqueda se llena al arrancar sobre una base que ya tiene clases
+import crud.busqueda
+from conftest import crear_usuario, crear_clase
+
+
+def test_indice_se_inicializa_si_esta_vacio(db, roles):
+    entrenador = crear_usuario(db, "entrenador", roles["entrenador"])
+    # Clases creadas sin pasar por crud (como las que existían antes del índice)
+    crear_clase(db, entrenador, nombre="Yoga matutino")
+    crear_clase(db, entrenador, nombre="Spinning")
+    db.commit()
+    assert crud.busqueda.buscar(db, "yoga")["total"] == 0
+
+    assert crud.busqueda.inicializar_indice_busqueda(db) == 2
+    assert crud.busqueda.buscar(db, "yoga")["total"] == 1
+    # Ya inicializado: no se vuelve a reconstruir
+    assert crud.busqueda.inicializar_indice_busqueda(db) == 0
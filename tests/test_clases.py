@@ -0,0 +1,24 @@
+# tests/test_clases.py
+# Generación de sesiones de las clases
+from datetime import date, timedelta
+
+import crud.clases
+import models.reservaciones
+from conftest import crear_usuario, crear_clase
+
+
+def test_generar_sesiones_ignora_sesiones_repetidas(db, roles):
+    entrenador = crear_usuario(db, "entrenador", roles["entrenador"])
+    clase = crear_clase(db, entrenador)
+    db.commit()
+    desde = date.today()
+    hasta = desde + timedelta(days=7)
+
+    # Otro worker creó una de las sesiones entre la lectura y el INSERT: la misma clase dos veces en el lote
+    # produce las mismas llaves, y el lote no debe abortar
+    crud.clases.generar_sesiones(db, [clase, clase], desde, hasta)
+    db.commit()
+
+    assert db.query(models.reservaciones.CupoSesion).filter(
+        models.reservaciones.CupoSesion.Clase_ID == clase.ID
+    ).count() == 7
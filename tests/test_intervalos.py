@@ -0,0 +1,65 @@
+# tests/test_intervalos.py
+# Intervalos semanales de las clases, traslapes y huecos del índice de intervalos
+from datetime import time
+
+import intervalos
+import crud.clases
+from conftest import crear_usuario, crear_clase
+
+LUNES, MARTES, DOMINGO = 0, 1, 6
+
+
+def test_intervalos_semanales_mismo_dia():
+    assert intervalos.intervalos_semanales([MARTES], time(8), time(9, 30), "c") == [
+        (intervalos.MINUTOS_DIA + 8 * 60, intervalos.MINUTOS_DIA + 9 * 60 + 30, "c")
+    ]
+
+
+def test_intervalos_semanales_pasan_de_medianoche():
+    # Lunes 23:00 a martes 01:00 queda en un solo intervalo
+    assert intervalos.intervalos_semanales([LUNES], time(23), time(1)) == [
+        (23 * 60, intervalos.MINUTOS_DIA + 60, None)
+    ]
+
+
+def test_intervalos_semanales_domingo_sigue_en_lunes():
+    # Domingo 23:00 a lunes 01:00: se parte en el final de la semana y el inicio de la siguiente
+    assert sorted(intervalos.intervalos_semanales([DOMINGO], time(23), time(1))) == [
+        (0, 60, None),
+        (DOMINGO * intervalos.MINUTOS_DIA + 23 * 60, intervalos.MINUTOS_SEMANA, None)
+    ]
+
+
+def test_traslapes_con_extremos_abiertos():
+    indice = intervalos.IndiceIntervalos([(0, 60, "a"), (120, 180, "b"), (30, 200, "c")])
+
+    # [60, 120) solo toca a "a" y "b" en sus extremos
+    assert sorted(clave for _, _, clave in indice.traslapes(60, 120)) == ["c"]
+    assert not intervalos.IndiceIntervalos([(0, 60, "a"), (120, 180, "b")]).hay_traslape(60, 120)
+    assert sorted(clave for _, _, clave in indice.traslapes(170, 190)) == ["b", "c"]
+    assert indice.traslapes(200, 300) == []
+
+
+def test_huecos():
+    indice = intervalos.IndiceIntervalos([(10, 20, "a"), (15, 30, "b"), (50, 60, "c")])
+
+    assert indice.huecos(0, 100) == [(0, 10), (30, 50), (60, 100)]
+    # Solo los huecos de al menos 25
+    assert indice.huecos(0, 100, duracion_minima=25) == [(60, 100)]
+    # Un rango que empieza dentro de un intervalo ocupado
+    assert indice.huecos(12, 55) == [(30, 50)]
+    assert intervalos.IndiceIntervalos().huecos(0, 10) == [(0, 10)]
+
+
+def test_conflicto_de_domingo_a_lunes(db, roles):
+    entrenador = crear_usuario(db, "entrenador", roles["entrenador"])
+    # Lunes a las 00:30 (la clase de crear_clase es de lunes a domingo; se deja solo el lunes)
+    madrugada = crear_clase(db, entrenador, nombre="Madrugada")
+    madrugada.Dia_Inicio, madrugada.Dia_Fin = "Lunes", "Lunes"
+    madrugada.Hora_Inicio, madrugada.Hora_Fin = time(0, 30), time(1, 30)
+    db.commit()
+
+    # Domingo 23:00 a 01:00 choca con la del lunes 00:30
+    conflictos = crud.clases.get_conflictos_horario(db, entrenador.ID, "Domingo", "Domingo", time(23), time(1))
+    assert [clase.ID for clase in conflictos] == [madrugada.ID]
+    assert crud.clases.get_conflictos_horario(db, entrenador.ID, "Domingo", "Domingo", time(22), time(0, 30)) == []
@@ -0,0 +1,118 @@
+# tests/test_membresias.py
+# Vigencia de las membresías, tarea que desactiva las vencidas y listado de usuarios disponibles
+from datetime import datetime, timedelta
+
+import crud.membresias
+import models.membresias
+from conftest import contar_consultas, crear_usuario
+
+
+# Crear una membresía que termina dentro de `dias` días (negativo: ya venció)
+def crear_membresia(db, usuario, dias: int, estatus: bool = True):
+    membresia = models.membresias.Membresia(
+        Usuario_ID=usuario.ID,
+        Codigo=f"M-{usuario.ID}-{dias}",
+        Tipo=models.membresias.MyTipo.Individual,
+        Tipo_Servicios=models.membresias.MyTipoServicios.Basicos,
+        Tipo_Plan=models.membresias.MyTipoPlan.Mensual,
+        Fecha_Inicio=datetime.now() - timedelta(days=30),
+        Fecha_Fin=datetime.now() + timedelta(days=dias),
+        Estatus=estatus
+    )
+    db.add(membresia)
+    db.flush()
+    return membresia
+
+
+def test_lecturas_tratan_vencidas_como_inactivas(db, roles):
+    vigente = crear_membresia(db, crear_usuario(db, "vigente", roles["usuario"]), 10)
+    vencida = crear_membresia(db, crear_usuario(db, "vencida", roles["usuario"]), -1)
+    db.commit()
+
+    detalles = {m["ID"]: m["Estatus"] for m in crud.membresias.get_membresias_with_details(db)}
+    por_membresia = {m["membresia_id"]: m["estatus"] for m in crud.membresias.get_usuarios_por_membresia(db)}
+
+    assert detalles == {vigente.ID: True, vencida.ID: False}
+    assert por_membresia == {vigente.ID: True, vencida.ID: False}
+
+
+def test_desactivar_vencidas_en_lotes(db, roles):
+    vencidas = [crear_membresia(db, crear_usuario(db, f"vencida{i}", roles["usuario"]), -1 - i).ID for i in range(5)]
+    vigente = crear_membresia(db, crear_usuario(db, "vigente", roles["usuario"]), 10).ID
+    ya_inactiva = crear_membresia(db, crear_usuario(db, "inactiva", roles["usuario"]), -3, estatus=False).ID
+    db.commit()
+
+    # Lotes de 2: 2 + 2 + 1
+    assert crud.membresias.desactivar_lote_membresias(db, limite=2) == 2
+    assert crud.membresias.desactivar_membresias_vencidas(db, limite=2) == 3
+    # Volver a correr la tarea no cambia nada
+    assert crud.membresias.desactivar_membresias_vencidas(db, limite=2) == 0
+
+    db.expire_all()
+    estatus = dict(db.query(models.membresias.Membresia.ID, models.membresias.Membresia.Estatus).all())
+    assert [estatus[i] for i in vencidas] == [False] * 5
+    assert (estatus[vigente], estatus[ya_inactiva]) == (True, False)
+
+
+def test_desactivar_vencidas_un_lote_por_consulta_acotada(db, roles):
+    for i in range(7):
+        crear_membresia(db, crear_usuario(db, f"vencida{i}", roles["usuario"]), -1 - i)
+    db.commit()
+
+    with contar_consultas() as contador:
+        total = crud.membresias.desactivar_membresias_vencidas(db, limite=3)
+
+    # Lotes de 3, 3 y 1: cada lote es un SELECT y un UPDATE
+    assert total == 7
+    assert contador.total == 3 * 2
+
+
+# Usuarios con rol "usuario" (con y sin membresía vigente), más un entrenador que no debe aparecer
+def _sembrar_usuarios(db, roles, total: int):
+    ids = []
+    for i in range(total):
+        usuario = crear_usuario(db, f"socio{i}", roles["usuario"], con_persona=False)
+        if i % 3 == 0:
+            crear_membresia(db, usuario, 10)
+        elif i % 3 == 1:
+            crear_membresia(db, usuario, -1)
+        ids.append(usuario.ID)
+    crear_usuario(db, "entrenador", roles["entrenador"], con_persona=False)
+    db.commit()
+    return ids
+
+
+def test_usuarios_disponibles_una_consulta_por_pagina(db, roles):
+    _sembrar_usuarios(db, roles, 60)
+
+    consultas = {}
+    for limite in (1, 10, 60):
+        db.expire_all()
+        with contar_consultas() as contador:
+            usuarios = crud.membresias.get_usuarios_rol_usuario(db, skip=0, limit=limite)
+        assert len(usuarios) == limite
+        consultas[limite] = contador.total
+
+    assert consultas[1] == consultas[10] == consultas[60] == 1
+
+
+def test_usuarios_disponibles_paginacion_por_llave(db, roles):
+    ids = _sembrar_usuarios(db, roles, 25)
+
+    paginas = []
+    despues_de = None
+    while True:
+        pagina = crud.membresias.get_usuarios_rol_usuario(db, limit=10, despues_de=despues_de)
+        if not pagina:
+            break
+        paginas.append(pagina)
+        despues_de = pagina[-1]["id"]
+
+    assert [len(pagina) for pagina in paginas] == [10, 10, 5]
+    vistos = [usuario["id"] for pagina in paginas for usuario in pagina]
+    assert vistos == ids
+    # Solo la membresía vigente cuenta (la vencida no)
+    activas = {usuario["id"]: usuario["tiene_membresia_activa"] for pagina in paginas for usuario in pagina}
+    assert [activas[usuario_id] for usuario_id in ids[:3]] == [True, False, False]
+    # La paginación por llave y la de OFFSET devuelven la misma página
+    assert crud.membresias.get_usuarios_rol_usuario(db, limit=10, despues_de=ids[9]) == crud.membresias.get_usuarios_rol_usuario(db, skip=10, limit=10)
@@ -0,0 +1,69 @@
+# tests/test_ocupacion.py
+# El mapa de ocupación se agrupa en SQL e incluye las reservaciones sin sesión materializada
+from datetime import datetime, date, time, timedelta
+
+import crud.reservaciones
+import models.reservaciones
+from conftest import contar_consultas, crear_usuario, crear_clase
+
+
+def _reservar(db, usuario, clase, fecha: date, estatus: str):
+    db.add(models.reservaciones.Reservacion(
+        Usuario_ID=usuario.ID,
+        Clase_ID=clase.ID,
+        Fecha_Reservacion=datetime.combine(fecha, clase.Hora_Inicio),
+        Fecha=fecha,
+        Estatus=estatus,
+        Activa=True
+    ))
+
+
+def test_mapa_ocupacion_incluye_historia_sin_sesiones(db, roles):
+    entrenador = crear_usuario(db, "entrenador", roles["entrenador"])
+    clase = crear_clase(db, entrenador, cupo=4)
+    usuarios = [crear_usuario(db, f"u{i}", roles["usuario"], con_persona=False) for i in range(4)]
+    hace_una_semana = date.today() - timedelta(days=7)
+    hace_dos_semanas = date.today() - timedelta(days=14)
+
+    # Historia anterior a tbd_cupos_sesiones: 3 asistencias y 1 inasistencia a las 8:00
+    for usuario, estatus in zip(usuarios, ["Asistida", "Asistida", "Asistida", "No Asistida"]):
+        _reservar(db, usuario, clase, hace_dos_semanas, estatus)
+    # Sesión materializada que se movió a las 18:00, con cupo propio y 1 asistencia
+    db.add(models.reservaciones.CupoSesion(
+        Clase_ID=clase.ID,
+        Fecha=hace_una_semana,
+        Inicio=datetime.combine(hace_una_semana, time(18)),
+        Fin=datetime.combine(hace_una_semana, time(19)),
+        Cupo=2,
+        Reservados=1
+    ))
+    _reservar(db, usuarios[0], clase, hace_una_semana, "Asistida")
+    db.commit()
+
+    with contar_consultas() as contador:
+        mapa = crud.reservaciones.get_mapa_ocupacion(db, semanas=8)
+
+    # Las dos fechas caen en el mismo día de la semana
+    dia = hace_una_semana.weekday()
+    assert contador.total == 1
+    assert (mapa["asistencias"][dia][8], mapa["sesiones"][dia][8], mapa["ocupacion"][dia][8]) == (3, 1, 75.0)
+    assert (mapa["asistencias"][dia][18], mapa["sesiones"][dia][18], mapa["ocupacion"][dia][18]) == (1, 1, 50.0)
+    assert sum(map(sum, mapa["sesiones"])) == 2
+
+
+def test_mapa_ocupacion_filtra_por_clase(db, roles):
+    entrenador = crear_usuario(db, "entrenador", roles["entrenador"])
+    clase = crear_clase(db, entrenador)
+    otra = crear_clase(db, entrenador, nombre="Otra")
+    usuario = crear_usuario(db, "usuario", roles["usuario"], con_persona=False)
+    ayer = date.today() - timedelta(days=1)
+    _reservar(db, usuario, clase, ayer, "Asistida")
+    _reservar(db, usuario, otra, ayer, "Asistida")
+    # Hoy todavía no es un día completo
+    _reservar(db, usuario, clase, date.today(), "Asistida")
+    db.commit()
+
+    mapa = crud.reservaciones.get_mapa_ocupacion(db, semanas=1, clase_id=clase.ID)
+
+    assert mapa["asistencias"][ayer.weekday()][8] == 1
+    assert sum(map(sum, mapa["asistencias"])) == 1
@@ -0,0 +1,153 @@
+# tests/test_quejas.py
+# Las vistas de quejas deben costar el mismo número de consultas sin importar cuántas quejas o entrenadores devuelven
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, insert
+
+import crud.quejas
+import models.quejas
+import routes.quejas
+from conftest import contar_consultas, crear_usuario, crear_clase
+
+# Benchmark del reporte de administrador
+QUEJAS_BENCHMARK = int(os.getenv("PRUEBA_QUEJAS_TOTAL", "100000"))
+ENTRENADORES_BENCHMARK = 20
+# Latencia máxima aceptada del reporte con todas las quejas, en segundos
+LATENCIA_REPORTE = float(os.getenv("PRUEBA_QUEJAS_LATENCIA", "2"))
+
+
+# Crear un entrenador con quejas de usuarios y clases distintos (el peor caso para consultas por fila)
+def _entrenador_con_quejas(db, roles, nombre: str, quejas: int):
+    entrenador = crear_usuario(db, nombre, roles["entrenador"])
+    for q in range(quejas):
+        usuario = crear_usuario(db, f"{nombre}-u{q}", roles["usuario"], con_persona=q % 2 == 0)
+        clase = crear_clase(db, entrenador, nombre=f"{nombre} clase {q}")
+        db.add(models.quejas.Queja(
+            Usuario_ID=usuario.ID,
+            Entrenador_ID=entrenador.ID,
+            Clase_ID=clase.ID,
+            Calificacion=q % 5 + 1,
+            Comentario="Comentario",
+            Fecha_Registro=datetime.now() - timedelta(days=q)
+        ))
+    db.commit()
+    crud.quejas.rebuild_resumen_entrenadores(db)
+    return entrenador
+
+
+# Ejecutar una vista contando sus consultas; devuelve (consultas, resultado)
+def _medir(db, funcion, **kwargs):
+    db.expire_all()
+    with contar_consultas() as contador:
+        resultado = funcion(db=db, **kwargs)
+    return contador.total, resultado
+
+
+def test_mis_quejas_entrenador_costo_constante(db, roles):
+    pocas = _entrenador_con_quejas(db, roles, "pocas", 3)
+    muchas = _entrenador_con_quejas(db, roles, "muchas", 40)
+
+    consultas_pocas, resultado_pocas = _medir(db, routes.quejas.read_quejas_entrenador, token_data={"ID": pocas.ID})
+    consultas_muchas, resultado_muchas = _medir(db, routes.quejas.read_quejas_entrenador, token_data={"ID": muchas.ID})
+
+    assert (len(resultado_pocas), len(resultado_muchas)) == (3, 40)
+    assert all(queja["nombre_usuario"] != "Usuario desconocido" for queja in resultado_muchas)
+    assert consultas_pocas == consultas_muchas
+
+
+def test_estadisticas_entrenador_costo_constante(db, roles):
+    admin = crear_usuario(db, "admin", roles["admin"])
+    pocas = _entrenador_con_quejas(db, roles, "pocas", 3)
+    muchas = _entrenador_con_quejas(db, roles, "muchas", 40)
+
+    consultas_pocas, resultado_pocas = _medir(
+        db, routes.quejas.get_estadisticas_entrenador, entrenador_id=pocas.ID, token_data={"ID": admin.ID}
+    )
+    consultas_muchas, resultado_muchas = _medir(
+        db, routes.quejas.get_estadisticas_entrenador, entrenador_id=muchas.ID, token_data={"ID": admin.ID}
+    )
+
+    assert (resultado_pocas["total_quejas"], resultado_muchas["total_quejas"]) == (3, 40)
+    assert len(resultado_muchas["ultimas_quejas"]) == 10
+    assert consultas_pocas == consultas_muchas
+
+
+def test_reporte_admin_costo_constante(db, roles):
+    for e in range(2):
+        _entrenador_con_quejas(db, roles, f"ent{e}", 2)
+    consultas_pocos, _ = _medir(db, crud.quejas.get_reporte_estadisticas_admin)
+
+    for e in range(2, 14):
+        _entrenador_con_quejas(db, roles, f"ent{e}", 4)
+    consultas_muchos, _ = _medir(db, crud.quejas.get_reporte_estadisticas_admin)
+
+    assert consultas_pocos == consultas_muchos
+
+
+# Insertar quejas en bloque (un INSERT de varias filas), repartidas entre entrenadores, calificaciones y seis meses
+def _sembrar_quejas(db, usuario, clases, desde: int, hasta: int):
+    ahora = datetime.now()
+    db.execute(insert(models.quejas.Queja), [
+        {
+            "Usuario_ID": usuario.ID,
+            "Entrenador_ID": clases[q % len(clases)].Entrenador_ID,
+            "Clase_ID": clases[q % len(clases)].ID,
+            "Calificacion": q % 5 + 1,
+            "Estatus": True,
+            "Fecha_Registro": ahora - timedelta(days=q % 180)
+        }
+        for q in range(desde, hasta)
+    ])
+    db.commit()
+    crud.quejas.rebuild_resumen_entrenadores(db)
+
+
+def test_reporte_admin_benchmark_100k(db, roles):
+    usuario = crear_usuario(db, "usuario", roles["usuario"])
+    clases = [
+        crear_clase(db, crear_usuario(db, f"ent{e}", roles["entrenador"]), nombre=f"Clase {e}")
+        for e in range(ENTRENADORES_BENCHMARK)
+    ]
+    db.commit()
+
+    # El reporte no debe cargar quejas como objetos (los bucles anteriores hacían .all() de la tabla)
+    cargadas = []
+    def _contar_carga(objetivo, contexto):
+        cargadas.append(objetivo)
+    event.listen(models.quejas.Queja, "load", _contar_carga)
+    try:
+        _sembrar_quejas(db, usuario, clases, 0, 1000)
+        consultas_pocas, reporte_pocas = _medir(db, crud.quejas.get_reporte_estadisticas_admin)
+
+        _sembrar_quejas(db, usuario, clases, 1000, QUEJAS_BENCHMARK)
+        inicio = time.perf_counter()
+        consultas_todas, reporte_todas = _medir(db, crud.quejas.get_reporte_estadisticas_admin)
+        latencia = time.perf_counter() - inicio
+    finally:
+        event.remove(models.quejas.Queja, "load", _contar_carga)
+
+    assert (reporte_pocas["total_quejas"], reporte_todas["total_quejas"]) == (1000, QUEJAS_BENCHMARK)
+    assert reporte_todas["promedio_calificacion"] == 3.0
+    assert len(reporte_todas["estadisticas_por_entrenador"]) == ENTRENADORES_BENCHMARK
+    assert consultas_pocas == consultas_todas
+    assert cargadas == []
+    assert latencia < LATENCIA_REPORTE
+
+
+def test_resumen_se_inicializa_si_esta_vacio(db, roles):
+    usuario = crear_usuario(db, "usuario", roles["usuario"])
+    clase = crear_clase(db, crear_usuario(db, "entrenador", roles["entrenador"]))
+    db.commit()
+    # Quejas que ya existían antes de la tabla de resumen
+    db.execute(insert(models.quejas.Queja), [
+        {"Usuario_ID": usuario.ID, "Entrenador_ID": clase.Entrenador_ID, "Clase_ID": clase.ID, "Calificacion": c, "Fecha_Registro": datetime.now()}
+        for c in (2, 4)
+    ])
+    db.commit()
+
+    assert crud.quejas.inicializar_resumen_entrenadores(db) == 1
+    assert crud.quejas.get_estadisticas_entrenador(db, clase.Entrenador_ID)["total_quejas"] == 2
+    # Ya inicializado: no se vuelve a reconstruir
+    assert crud.quejas.inicializar_resumen_entrenadores(db) == 0
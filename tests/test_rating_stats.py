@@ -0,0 +1,83 @@
+# tests/test_rating_stats.py
+# Benchmark de rating_stats contra los bucles que calculaban promedios y distribuciones elemento por elemento
+import os
+import time
+
+import numpy as np
+
+import rating_stats
+
+ELEMENTOS = int(os.getenv("PRUEBA_RATING_ELEMENTOS", "500"))
+CALIFICACIONES_POR_ELEMENTO = int(os.getenv("PRUEBA_RATING_CALIFICACIONES", "200"))
+
+
+# Cálculo anterior (get_estadisticas_servicio / get_top_rated_servicios): promedio y distribución con if/elif por calificación
+def _estadisticas_con_bucles(calificaciones_por_elemento):
+    resultados = []
+    for calificaciones in calificaciones_por_elemento:
+        total = len(calificaciones)
+        promedio = sum(calificaciones) / total if total else 0.0
+        distribucion = {"5_estrellas": 0, "4_estrellas": 0, "3_estrellas": 0, "2_estrellas": 0, "1_estrella": 0}
+        for calificacion in calificaciones:
+            if calificacion == 5:
+                distribucion["5_estrellas"] += 1
+            elif calificacion == 4:
+                distribucion["4_estrellas"] += 1
+            elif calificacion == 3:
+                distribucion["3_estrellas"] += 1
+            elif calificacion == 2:
+                distribucion["2_estrellas"] += 1
+            elif calificacion == 1:
+                distribucion["1_estrella"] += 1
+        for clave in distribucion:
+            distribucion[clave] = round(distribucion[clave] / total * 100, 2) if total else 0
+        resultados.append((round(promedio, 2), distribucion))
+    return resultados
+
+
+# Cálculo con rating_stats sobre la misma entrada: histogramas por elemento en bloque y luego promedios y distribuciones
+def _estadisticas_vectorizadas(elementos, calificaciones):
+    hists = np.zeros((ELEMENTOS, 5), dtype=np.int64)
+    np.add.at(hists, (elementos, calificaciones - 1), 1)
+    totales = hists.sum(axis=1)
+    sumas = hists @ rating_stats.ESTRELLAS
+    promedios = rating_stats.promedios(totales, sumas)
+    distribuciones = rating_stats.distribuciones(hists)
+    return [(round(float(promedio), 2), distribucion) for promedio, distribucion in zip(promedios, distribuciones)]
+
+
+def test_rating_stats_igual_y_mas_rapido_que_los_bucles():
+    generador = np.random.default_rng(30)
+    elementos = np.repeat(np.arange(ELEMENTOS), CALIFICACIONES_POR_ELEMENTO)
+    calificaciones = generador.integers(1, 6, size=elementos.size)
+    por_elemento = [calificaciones[elementos == e].tolist() for e in range(ELEMENTOS)]
+
+    inicio = time.perf_counter()
+    con_bucles = _estadisticas_con_bucles(por_elemento)
+    tiempo_bucles = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    vectorizadas = _estadisticas_vectorizadas(elementos, calificaciones)
+    tiempo_vectorizado = time.perf_counter() - inicio
+
+    assert vectorizadas == con_bucles
+    assert tiempo_vectorizado < tiempo_bucles
+
+
+def test_resumen_y_percentiles():
+    # 1 de 1 estrella, 2 de 3 estrellas y 1 de 5 estrellas
+    hist = rating_stats.histograma_desde_conteos([(1, 1), (3, 2), (5, 1), (7, 4)])
+
+    resumen = rating_stats.resumen(hist)
+
+    assert (resumen["total"], resumen["suma"], resumen["promedio"]) == (4, 12, 3.0)
+    assert resumen["percentiles"] == {"p25": 1, "p50": 3, "p75": 3}
+    assert resumen["distribucion"]["3_estrellas"] == 50.0
+    assert rating_stats.resumen([0, 0, 0, 0, 0])["distribucion"] == rating_stats.distribucion_vacia()
+
+
+def test_promedio_bayesiano_acerca_al_promedio_previo():
+    promedios = rating_stats.promedios_bayesianos([1, 100], [5, 500])
+
+    assert promedios[0] < promedios[1]
+    assert round(float(promedios[0]), 2) == round((rating_stats.VOTOS_MINIMOS * rating_stats.PROMEDIO_PREVIO + 5) / (rating_stats.VOTOS_MINIMOS + 1), 2)
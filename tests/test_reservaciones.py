@@ -0,0 +1,148 @@
+# tests/test_reservaciones.py
+# Cupo de las sesiones bajo reservaciones simultáneas y tarea de inasistencias
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, time as hora, timedelta
+
+import config.db
+import crud.reservaciones
+import models.reservaciones
+import schemas.reservaciones
+from conftest import crear_usuario, crear_clase
+
+RESERVACIONES_SIMULTANEAS = int(os.getenv("PRUEBA_RESERVACIONES_SIMULTANEAS", "500"))
+CUPO_CLASE = 20
+HILOS = int(os.getenv("PRUEBA_RESERVACIONES_HILOS", "50"))
+# Latencia máxima aceptada por reservación, en segundos
+LATENCIA_MAXIMA = float(os.getenv("PRUEBA_RESERVACIONES_LATENCIA", "5"))
+
+
+def test_reservaciones_concurrentes_respetan_cupo(db, roles, record_property):
+    entrenador = crear_usuario(db, "entrenador", roles["entrenador"])
+    clase = crear_clase(db, entrenador, cupo=CUPO_CLASE)
+    usuarios = [crear_usuario(db, f"u{i}", roles["usuario"], con_persona=False).ID for i in range(RESERVACIONES_SIMULTANEAS)]
+    db.commit()
+    clase_id = clase.ID
+    fecha = datetime.combine(date.today() + timedelta(days=7), clase.Hora_Inicio)
+
+    # Las primeras reservaciones (una por hilo) salen al mismo tiempo
+    salida = threading.Barrier(HILOS)
+    primeros = set(usuarios[:HILOS])
+
+    def reservar(usuario_id):
+        sesion = config.db.SessionLocal()
+        try:
+            if usuario_id in primeros:
+                salida.wait()
+            inicio = time.perf_counter()
+            reservacion, _ = crud.reservaciones.create_reservacion(
+                sesion,
+                schemas.reservaciones.ReservacionCreate(Usuario_ID=usuario_id, Clase_ID=clase_id, Fecha_Reservacion=fecha)
+            )
+            return reservacion is not None, time.perf_counter() - inicio
+        finally:
+            sesion.close()
+
+    with ThreadPoolExecutor(max_workers=HILOS) as ejecutor:
+        resultados = list(ejecutor.map(reservar, usuarios))
+
+    confirmadas = sum(1 for confirmada, _ in resultados if confirmada)
+    latencias = sorted(latencia for _, latencia in resultados)
+    # Las latencias quedan en el reporte de pytest (por ejemplo, con --junitxml)
+    record_property("latencia_p50_segundos", round(latencias[len(latencias) // 2], 3))
+    record_property("latencia_maxima_segundos", round(latencias[-1], 3))
+
+    assert confirmadas == CUPO_CLASE
+    assert latencias[-1] < LATENCIA_MAXIMA
+
+    db.expire_all()
+    disponibilidad = crud.reservaciones.get_disponibilidad(db, clase_id, fecha.date())
+    assert (disponibilidad["Reservados"], disponibilidad["Lugares_Disponibles"]) == (CUPO_CLASE, 0)
+    assert db.query(models.reservaciones.Reservacion).filter(
+        models.reservaciones.Reservacion.Clase_ID == clase_id
+    ).count() == CUPO_CLASE
+
+
+# Reservación confirmada anterior a tbd_cupos_sesiones (sin fila de sesión)
+def _reservacion_sin_sesion(db, usuario, clase, fecha):
+    reservacion = models.reservaciones.Reservacion(
+        Usuario_ID=usuario.ID,
+        Clase_ID=clase.ID,
+        Fecha_Reservacion=datetime.combine(fecha, clase.Hora_Inicio),
+        Fecha=fecha,
+        Estatus="Confirmada",
+        Activa=True
+    )
+    db.add(reservacion)
+    db.flush()
+    return reservacion.ID
+
+
+def test_inasistencias_sin_sesion_usan_el_horario_de_la_clase(db, roles):
+    entrenador = crear_usuario(db, "entrenador", roles["entrenador"])
+    usuario = crear_usuario(db, "usuario", roles["usuario"], con_persona=False)
+    hoy = date.today()
+    diurna = crear_clase(db, entrenador, nombre="Diurna")
+    nocturna = crear_clase(db, entrenador, nombre="Nocturna")
+    nocturna.Hora_Inicio, nocturna.Hora_Fin = hora(22), hora(0)
+    tardia = crear_clase(db, entrenador, nombre="Tardía")
+    tardia.Hora_Inicio, tardia.Hora_Fin = hora(23, 59, 58), hora(23, 59, 59)
+
+    vencidas = [
+        _reservacion_sin_sesion(db, usuario, diurna, hoy - timedelta(days=3)),
+        # Pasa de medianoche: la de hace dos días ya terminó
+        _reservacion_sin_sesion(db, usuario, nocturna, hoy - timedelta(days=2))
+    ]
+    pendientes = [
+        # La de hoy termina mañana a medianoche
+        _reservacion_sin_sesion(db, usuario, nocturna, hoy),
+        _reservacion_sin_sesion(db, usuario, tardia, hoy)
+    ]
+    db.commit()
+
+    assert crud.reservaciones.marcar_inasistencias_vencidas(db) == 2
+    # Volver a correr la tarea no cambia nada
+    assert crud.reservaciones.marcar_inasistencias_vencidas(db) == 0
+
+    db.expire_all()
+    estatus = dict(db.query(models.reservaciones.Reservacion.ID, models.reservaciones.Reservacion.Estatus).all())
+    assert [estatus[i] for i in vencidas] == ["No Asistida", "No Asistida"]
+    assert [estatus[i] for i in pendientes] == ["Confirmada", "Confirmada"]
+
+
+def test_avisos_de_promocion_usan_hilos_acotados(db, roles, monkeypatch):
+    entrenador = crear_usuario(db, "entrenador", roles["entrenador"])
+    clase = crear_clase(db, entrenador, cupo=40)
+    fecha = date.today() + timedelta(days=7)
+    promovidas = [
+        _reservacion_sin_sesion(db, crear_usuario(db, f"u{i}", roles["usuario"], con_persona=False), clase, fecha)
+        for i in range(30)
+    ]
+    db.commit()
+
+    enviados = []
+    activos = {"ahora": 0, "maximo": 0}
+    candado = threading.Lock()
+    def _enviar(correo, nombre_clase, fecha_reservacion):
+        with candado:
+            activos["ahora"] += 1
+            activos["maximo"] = max(activos["maximo"], activos["ahora"])
+        time.sleep(0.01)
+        with candado:
+            activos["ahora"] -= 1
+            enviados.append(correo)
+    monkeypatch.setattr(crud.reservaciones.gmail_service, "send_waitlist_promotion_email", _enviar)
+
+    crud.reservaciones.notificar_promociones(
+        db, db.query(models.reservaciones.Reservacion).filter(models.reservaciones.Reservacion.ID.in_(promovidas)).all()
+    )
+    # Esperar a que el executor vacíe la cola
+    crud.reservaciones._correos.submit(lambda: None).result()
+    limite = time.perf_counter() + 5
+    while len(enviados) < 30 and time.perf_counter() < limite:
+        time.sleep(0.01)
+
+    assert len(enviados) == 30
+    assert activos["maximo"] <= crud.reservaciones.CORREOS_HILOS
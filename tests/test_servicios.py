@@ -0,0 +1,64 @@
+# tests/test_servicios.py
+# get_servicios_with_details debe ejecutar el mismo número de sentencias para cualquier tamaño de página
+import crud.servicios
+import crud.evaluaciones_serv
+import models.servicios
+import models.evaluaciones_serv
+from conftest import contar_consultas, crear_usuario
+
+
+# Crear servicios de distintos usuarios, con evaluaciones en la mayoría de ellos
+def _sembrar_servicios(db, roles, servicios: int):
+    evaluador = crear_usuario(db, "evaluador", roles["usuario"])
+    for s in range(servicios):
+        creador = crear_usuario(db, f"creador{s}", roles["admin"])
+        servicio = models.servicios.Servicios(Nombre=f"Servicio {s}", Descripcion="Descripción", Costo=100.0 + s, Usuario_ID=creador.ID)
+        db.add(servicio)
+        db.flush()
+        for calificacion in range(1, s % 4 + 1):
+            db.add(models.evaluaciones_serv.Evaluaciones_serv(
+                Usuario_ID=evaluador.ID,
+                Servicio_ID=servicio.ID,
+                Tipo_Servicio=models.evaluaciones_serv.TipoServicio.C,
+                Calificacion=calificacion
+            ))
+    db.commit()
+    crud.evaluaciones_serv.rebuild_resumen_servicios(db)
+
+
+def test_servicios_with_details_costo_constante(db, roles):
+    _sembrar_servicios(db, roles, 60)
+
+    consultas = {}
+    for limite in (1, 10, 60):
+        db.expire_all()
+        with contar_consultas() as contador:
+            servicios = crud.servicios.get_servicios_with_details(db, skip=0, limit=limite)
+        assert len(servicios) == limite
+        consultas[limite] = contador.total
+
+    assert consultas[1] == consultas[10] == consultas[60] == 1
+
+
+def test_servicios_with_details_totales(db, roles):
+    _sembrar_servicios(db, roles, 4)
+
+    servicios = crud.servicios.get_servicios_with_details(db, skip=0, limit=10)
+
+    # El servicio s tiene las calificaciones 1..s % 4
+    assert [servicio["Total_Evaluaciones"] for servicio in servicios] == [0, 1, 2, 3]
+    assert [servicio["Promedio_Calificacion"] for servicio in servicios] == [0.0, 1.0, 1.5, 2.0]
+    assert [servicio["Usuario_Nombre"] for servicio in servicios] == ["creador0", "creador1", "creador2", "creador3"]
+
+
+def test_resumen_se_inicializa_si_esta_vacio(db, roles):
+    _sembrar_servicios(db, roles, 4)
+    # Base existente: evaluaciones sin resumen
+    db.query(models.evaluaciones_serv.ResumenEvaluacionServicio).delete()
+    db.commit()
+
+    assert crud.evaluaciones_serv.inicializar_resumen_servicios(db) == 3
+    servicios = crud.servicios.get_servicios_with_details(db, skip=0, limit=10)
+    assert [servicio["Total_Evaluaciones"] for servicio in servicios] == [0, 1, 2, 3]
+    # Ya inicializado: no se vuelve a reconstruir
+    assert crud.evaluaciones_serv.inicializar_resumen_servicios(db) == 0
@@ -0,0 +1,41 @@
+# tests/test_tokens.py
+# El token temporal del flujo SSE viaja en la URL: no debe servir como token de sesión
+from fastapi.testclient import TestClient
+
+import app
+import eventos_disponibilidad
+from jwt_config import solicita_token, solicita_token_temporal
+from conftest import crear_usuario
+
+# Sin "with": no se ejecutan las tareas de startup
+cliente = TestClient(app.app)
+
+
+def test_token_sse_no_sirve_como_token_de_sesion(db, roles):
+    usuario = crear_usuario(db, "usuario", roles["usuario"])
+    db.commit()
+    token_sse = solicita_token_temporal(usuario.ID, eventos_disponibilidad.USO_TOKEN_SSE)
+
+    respuesta = cliente.get("/mis-reservaciones/", headers={"Authorization": f"Bearer {token_sse}"})
+
+    assert respuesta.status_code == 401
+
+
+def test_token_de_sesion_sigue_funcionando(db, roles):
+    usuario = crear_usuario(db, "usuario", roles["usuario"])
+    db.commit()
+    token = solicita_token({"ID": usuario.ID}, ["usuario"])["access_token"]
+
+    respuesta = cliente.get("/mis-reservaciones/", headers={"Authorization": f"Bearer {token}"})
+
+    assert respuesta.status_code == 200
+
+
+def test_flujo_sse_rechaza_el_token_de_sesion(db, roles):
+    usuario = crear_usuario(db, "usuario", roles["usuario"])
+    db.commit()
+    token = solicita_token({"ID": usuario.ID}, ["usuario"])["access_token"]
+
+    respuesta = cliente.get("/disponibilidad/eventos/", params={"clase_id": 1, "token": token})
+
+    assert respuesta.status_code == 401